@@ -0,0 +1,58 @@
+import { apiInitializer } from "discourse/lib/api";
+
+const SCRYFALL_API_URL = "https://api.scryfall.com";
+
+function scryfallImage(name) {
+  return `${SCRYFALL_API_URL}/cards/named?fuzzy=${encodeURIComponent(name)}&format=image&version=normal`;
+}
+
+// When the mtg_card_service_url site setting points at card_service.py,
+// resolves every [[Card Name]] in a post with one call to the service
+// and points each tooltip straight at its cached image, instead of one
+// fuzzy lookup per card on hover. Any tooltip image that fails to load
+// (service down, or the setting changed since the post was cooked)
+// falls back to Scryfall.
+export default apiInitializer((api) => {
+  const siteSettings = api.container.lookup("service:site-settings");
+
+  api.decorateCooked(($elem, helper) => {
+    if (!helper) return;
+
+    const links = [...$elem[0].querySelectorAll("a.mtg-card-link[data-card]")];
+    if (!links.length) return;
+
+    links.forEach(link => {
+      const img = link.querySelector(".mtg-card-tooltip img");
+      if (!img) return;
+      const fallback = scryfallImage(decodeURIComponent(link.dataset.card));
+      img.addEventListener("error", () => {
+        if (img.src !== fallback) img.src = fallback;
+      });
+    });
+
+    const serviceUrl = (siteSettings.mtg_card_service_url || "").replace(/\/+$/, "");
+    if (!serviceUrl) return;
+
+    const names = [...new Set(links.map(link => decodeURIComponent(link.dataset.card)))];
+
+    fetch(`${serviceUrl}/cards/resolve`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ names }),
+    })
+      .then(response => (response.ok ? response.json() : null))
+      .then(result => {
+        if (!result) return;
+        links.forEach(link => {
+          const card = result.cards[decodeURIComponent(link.dataset.card)];
+          const img = link.querySelector(".mtg-card-tooltip img");
+          if (!card || !img) return;
+          img.src = card.image_uris.normal;
+          img.alt = card.name;
+        });
+      })
+      .catch(() => {
+        // the rendered image URLs stay, with the Scryfall fallback on error
+      });
+  }, { id: "mtg-card-tooltips" });
+});
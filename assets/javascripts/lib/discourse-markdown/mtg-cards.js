@@ -1,11 +1,15 @@
 // ============================================================
 // MTG Card Tooltip Markdown Extension
 // Converts [[Card Name]] into a hoverable link that shows
-// the card image fetched from the Scryfall API
+// the card image: from card_service.py when the
+// mtg_card_service_url site setting is set, otherwise from the
+// Scryfall API
 // ============================================================
 
 const CARD_REGEX = /\[\[([^\]]+)\]\]/;
 
+const SCRYFALL_API_URL = "https://api.scryfall.com";
+
 function cardMatcher(state, silent) {
   const src = state.src;
   const pos = state.pos;
@@ -31,18 +35,28 @@ function cardMatcher(state, silent) {
   return true;
 }
 
-function cardRenderer(tokens, idx) {
-  const cardName = tokens[idx].content;
+// card_service.py answers the same Scryfall-style fuzzy lookup from a
+// local copy of Scryfall's bulk data
+function cardRenderer(serviceUrl) {
+  const baseUrl = (serviceUrl || SCRYFALL_API_URL).replace(/\/+$/, "");
+  return (tokens, idx) => renderCard(baseUrl, tokens[idx].content);
+}
+
+function renderCard(baseUrl, cardName) {
   const encodedName = encodeURIComponent(cardName);
-  const scryfallUrl = `https://api.scryfall.com/cards/named?fuzzy=${encodedName}&format=image&version=normal`;
+  const imageUrl = `${baseUrl}/cards/named?fuzzy=${encodedName}&format=image&version=normal`;
   const scryfallPage = `https://scryfall.com/search?q=${encodedName}`;
 
-  return `<a class="mtg-card-link" href="${scryfallPage}" target="_blank" rel="noopener" data-card="${encodedName}">${cardName}<span class="mtg-card-tooltip"><img src="${scryfallUrl}" alt="${cardName}" loading="lazy" /></span></a>`;
+  return `<a class="mtg-card-link" href="${scryfallPage}" target="_blank" rel="noopener" data-card="${encodedName}">${cardName}<span class="mtg-card-tooltip"><img src="${imageUrl}" alt="${cardName}" loading="lazy" /></span></a>`;
 }
 
 export function setup(helper) {
   if (!helper.markdownIt) return;
 
+  helper.registerOptions((opts, siteSettings) => {
+    opts.mtgCardServiceUrl = siteSettings.mtg_card_service_url;
+  });
+
   helper.allowList([
     "a.mtg-card-link",
     "span.mtg-card-tooltip",
@@ -52,6 +66,6 @@ export function setup(helper) {
 
   helper.registerPlugin((md) => {
     md.inline.ruler.push("mtg_cards", cardMatcher);
-    md.renderer.rules["mtg_card"] = cardRenderer;
+    md.renderer.rules["mtg_card"] = cardRenderer(md.options.discourse.mtgCardServiceUrl);
   });
 }
@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""
+Card resolution and image cache for the [[Card Name]] tooltips.
+
+mtg-cards.js used to point every tooltip at Scryfall's fuzzy name
+lookup, so each hover on a decklist post cost a round trip to a
+throttled API. This service answers those lookups locally:
+
+  - Scryfall bulk data (oracle_cards, or default_cards) is compiled once
+    into a compact binary index that is memory-mapped at startup. Names
+    resolve by exact match, then by prefix, then by trigram similarity,
+    so "[[lightnig bolt]]" and "[[Bolas Citadel]]" still find their card
+  - Card images are fetched from Scryfall once and served from a
+    size-bounded LRU disk cache
+  - POST /cards/resolve resolves every card in a post in one call
+
+Endpoints:
+  GET  /cards/named?fuzzy=NAME[&format=image]   card JSON, or a redirect to its image
+  GET  /cards/named?exact=NAME[&format=image]
+  GET  /cards/<id>/image                        cached card image (JPEG)
+  POST /cards/resolve {"names": [...]}          {"cards": {name: card or null}}
+
+Card JSON is a subset of Scryfall's card object:
+  {"object": "card", "id": ..., "name": ..., "image_uris": {"normal": ...}}
+
+The plugin uses this service once the mtg_card_service_url site
+setting holds its public base URL (e.g. /mtg-cards, proxied by the
+forum); with the setting empty, tooltips load images from Scryfall.
+CARD_PUBLIC_PREFIX must match that setting.
+
+Usage:
+  python3 card_service.py download                      # fetch oracle_cards bulk data
+  python3 card_service.py build oracle-cards.json       # compile the index
+  python3 card_service.py lookup "lightnig bolt" ...    # resolve names offline
+  python3 card_service.py serve
+
+Resolution works entirely offline against any bulk file, including the
+fixture in tests/fixtures/cards.json; only image misses reach Scryfall.
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import mmap
+import time
+import uuid
+import struct
+import difflib
+import logging
+import argparse
+import threading
+import functools
+import unicodedata
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+# ============================================================
+# Configuration
+# ============================================================
+
+INDEX_FILE = os.environ.get("CARD_INDEX_FILE", "/var/lib/lfg_bot/cards.idx")
+BULK_FILE = os.environ.get("CARD_BULK_FILE", "/var/lib/lfg_bot/oracle-cards.json")
+IMAGE_DIR = os.environ.get("CARD_IMAGE_DIR", "/var/lib/lfg_bot/card-images")
+IMAGE_CACHE_BYTES = int(os.environ.get("CARD_IMAGE_CACHE_BYTES", str(2 * 1024 ** 3)))
+BIND_ADDRESS = os.environ.get("CARD_BIND_ADDRESS", "127.0.0.1")
+PORT = int(os.environ.get("CARD_SERVICE_PORT", "8788"))
+# Public base URL of this service (the mtg_card_service_url site setting); used in image links
+PUBLIC_PREFIX = os.environ.get("CARD_PUBLIC_PREFIX", "/mtg-cards")
+
+SCRYFALL_BULK_URL = "https://api.scryfall.com/bulk-data/oracle-cards"
+# Scryfall asks API clients to identify themselves and stay under 10 requests/second
+SCRYFALL_HEADERS = {"User-Agent": "PDHForumCardService/1.0", "Accept": "application/json;q=0.9,*/*;q=0.8"}
+SCRYFALL_MIN_INTERVAL = 0.1
+
+MAX_BATCH = 500            # names per /cards/resolve call
+RESOLVE_CACHE_SIZE = 8192  # resolved queries kept in memory
+FUZZY_MIN_SCORE = 0.75     # difflib ratio a fuzzy match must reach
+FUZZY_CANDIDATES = 8       # trigram candidates re-scored with difflib
+
+log = logging.getLogger("card_service")
+
+# ============================================================
+# Bulk Data
+# ============================================================
+
+def iter_bulk_cards(path, chunk_size=1 << 20):
+    """
+    Yield the card objects of a Scryfall bulk-data file (a JSON array,
+    optionally gzipped) one at a time, holding at most a chunk or so of
+    the file in memory.
+    """
+    decoder = json.JSONDecoder()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        buf, pos = "", 0
+        started = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f"{path}: bulk data ends before the closing ]")
+                buf, pos = more, 0
+                continue
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError(f"{path}: bulk data is not a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                card, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # the object runs past the end of the buffer
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield card
+            pos = end
+
+def card_image_url(card):
+    """Scryfall's normal-size image for a card (the front face for double-faced cards)."""
+    uris = card.get("image_uris") or ((card.get("card_faces") or [{}])[0].get("image_uris") or {})
+    return uris.get("normal", "")
+
+def download_bulk(dest):
+    """Download the current oracle_cards bulk file from Scryfall to dest."""
+    info = requests.get(SCRYFALL_BULK_URL, headers=SCRYFALL_HEADERS, timeout=30)
+    info.raise_for_status()
+    tmp = dest + ".part"
+    with requests.get(info.json()["download_uri"], headers=SCRYFALL_HEADERS, timeout=60, stream=True) as r:
+        r.raise_for_status()
+        with open(tmp, "wb") as f:
+            for chunk in r.iter_content(1 << 20):
+                f.write(chunk)
+    os.replace(tmp, dest)
+    log.info(f"Downloaded bulk data to {dest} ({os.path.getsize(dest) // 1024 // 1024} MB)")
+
+# ============================================================
+# Name Index
+# ============================================================
+#
+# Index file layout (little-endian), written by build_index() and
+# memory-mapped by CardIndex:
+#
+#   header    MAGIC, then offset/count pairs for the four tables below
+#   cards     CARD records: Scryfall id, name and image URL (as string refs)
+#   keys      KEY records sorted by normalized name: string ref, card number
+#   grams     GRAM records sorted by byte trigram: posting list ref
+#   postings  uint32 key numbers, one list per trigram
+#   strings   UTF-8 bytes referenced by the records above
+
+MAGIC = b"PDHCIDX1"
+HEADER = struct.Struct("<8s9I")
+CARD = struct.Struct("<16sIHIH")  # id, name offset/length, image URL offset/length
+KEY = struct.Struct("<IHI")       # key offset/length, card number
+GRAM = struct.Struct("<3sII")     # trigram, first posting, posting count
+
+def normalize(name):
+    """Fold a card name for matching: no accents, case, apostrophes or punctuation."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).casefold()
+    name = name.replace("'", "").replace("’", "")
+    return " ".join(re.sub(r"[\W_]+", " ", name).split())
+
+def trigrams(key):
+    """Byte trigrams of a normalized key, padded so short names still have several."""
+    data = b"  " + key.encode() + b" "
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+def card_keys(name):
+    """The keys a card is found under: its full name and, for split and double-faced cards, each face."""
+    keys = {normalize(name)}
+    if " // " in name:
+        keys.update(normalize(face) for face in name.split(" // "))
+    keys.discard("")
+    return keys
+
+def build_index(bulk_path, index_path):
+    """Compile a bulk-data file into an index file; returns the number of cards indexed."""
+    strings = bytearray()
+    interned = {}
+
+    def ref(text):
+        data = text.encode()
+        if data not in interned:
+            interned[data] = len(strings)
+            strings.extend(data)
+        return interned[data], len(data)
+
+    cards = bytearray()
+    card_count = 0
+    keys = {}
+    for card in iter_bulk_cards(bulk_path):
+        # default_cards lists every printing; the first one found for a name wins
+        if card.get("layout") in ("art_series", "token", "double_faced_token", "emblem"):
+            continue
+        name = card.get("name")
+        new_keys = [k for k in card_keys(name or "") if k not in keys]
+        if not new_keys:
+            continue
+        cards.extend(CARD.pack(uuid.UUID(card["id"]).bytes, *ref(name), *ref(card_image_url(card))))
+        for key in new_keys:
+            keys[key] = card_count
+        card_count += 1
+
+    key_table = bytearray()
+    postings_by_gram = {}
+    for number, key in enumerate(sorted(keys)):
+        key_table.extend(KEY.pack(*ref(key), keys[key]))
+        for gram in trigrams(key):
+            postings_by_gram.setdefault(gram, []).append(number)
+
+    gram_table = bytearray()
+    postings = bytearray()
+    first = 0
+    for gram in sorted(postings_by_gram):
+        numbers = postings_by_gram[gram]
+        gram_table.extend(GRAM.pack(gram, first, len(numbers)))
+        postings.extend(struct.pack(f"<{len(numbers)}I", *numbers))
+        first += len(numbers)
+
+    offset = HEADER.size
+    sections = []
+    for table, count in ((cards, card_count), (key_table, len(keys)), (gram_table, len(postings_by_gram)),
+                         (postings, first)):
+        sections += [offset, count]
+        offset += len(table)
+    tmp = index_path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, *sections, offset))
+        for table in (cards, key_table, gram_table, postings, strings):
+            f.write(table)
+    os.replace(tmp, index_path)
+    log.info(f"Indexed {card_count} cards under {len(keys)} names into {index_path} ({offset + len(strings)} bytes)")
+    return card_count
+
+class Card:
+    __slots__ = ("id", "name", "image_url")
+
+    def __init__(self, card_id, name, image_url):
+        self.id = card_id
+        self.name = name
+        self.image_url = image_url
+
+    def to_json(self):
+        return {
+            "object": "card",
+            "id": self.id,
+            "name": self.name,
+            "image_uris": {"normal": f"{PUBLIC_PREFIX}/cards/{self.id}/image"},
+        }
+
+class CardIndex:
+    """Read-only view of an index file; lookups decode only the records they touch."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self._cards, self.card_count, self._keys, self.key_count,
+         self._grams, self._gram_count, self._postings_at, _, self._strings) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a card index")
+        self._by_id = None
+        # the Card per query, bounded; the index never changes while mapped
+        self.resolve = functools.lru_cache(maxsize=RESOLVE_CACHE_SIZE)(self._resolve)
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._mm[start:start + length].decode()
+
+    def _key(self, number):
+        offset, length, card = KEY.unpack_from(self._mm, self._keys + number * KEY.size)
+        return self._string(offset, length), card
+
+    def card(self, number):
+        card_id, name_off, name_len, image_off, image_len = CARD.unpack_from(self._mm, self._cards + number * CARD.size)
+        return Card(str(uuid.UUID(bytes=card_id)), self._string(name_off, name_len), self._string(image_off, image_len))
+
+    def by_id(self, card_id):
+        """The card with a Scryfall id, or None."""
+        if self._by_id is None:
+            # built on first use: {id bytes: card number}
+            self._by_id = {
+                self._mm[self._cards + n * CARD.size:self._cards + n * CARD.size + 16]: n
+                for n in range(self.card_count)
+            }
+        try:
+            number = self._by_id.get(uuid.UUID(card_id).bytes)
+        except ValueError:
+            return None
+        return None if number is None else self.card(number)
+
+    def _bisect(self, key):
+        """First key number whose key is >= key."""
+        lo, hi = 0, self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def exact(self, query):
+        key = normalize(query)
+        number = self._bisect(key)
+        if number < self.key_count:
+            found, card = self._key(number)
+            if found == key:
+                return self.card(card)
+        return None
+
+    def prefix(self, key, limit=50):
+        """The shortest name starting with key (of the first `limit` in order)."""
+        best = None
+        number = self._bisect(key)
+        for number in range(number, min(number + limit, self.key_count)):
+            found, card = self._key(number)
+            if not found.startswith(key):
+                break
+            if best is None or len(found) < len(best[0]):
+                best = (found, card)
+        return None if best is None else self.card(best[1])
+
+    def _postings(self, gram):
+        lo, hi = 0, self._gram_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, first, count = GRAM.unpack_from(self._mm, self._grams + mid * GRAM.size)
+            if found < gram:
+                lo = mid + 1
+            elif found > gram:
+                hi = mid
+            else:
+                return struct.unpack_from(f"<{count}I", self._mm, self._postings_at + first * 4)
+        return ()
+
+    def fuzzy(self, key):
+        """The most similar name by trigram overlap, re-scored with difflib; None below FUZZY_MIN_SCORE."""
+        grams = trigrams(key)
+        shared = {}
+        for gram in grams:
+            for number in self._postings(gram):
+                shared[number] = shared.get(number, 0) + 1
+        # Dice coefficient; a padded key of n bytes has about n + 1 trigrams
+        scored = []
+        for number, count in shared.items():
+            if count * 3 < len(grams):
+                continue
+            _, length, _ = KEY.unpack_from(self._mm, self._keys + number * KEY.size)
+            scored.append((2 * count / (len(grams) + length + 1), number))
+        best = None
+        for _, number in sorted(scored, reverse=True)[:FUZZY_CANDIDATES]:
+            found, card = self._key(number)
+            score = difflib.SequenceMatcher(None, key, found).ratio()
+            if score >= FUZZY_MIN_SCORE and (best is None or score > best[0]):
+                best = (score, card)
+        return None if best is None else self.card(best[1])
+
+    def _resolve(self, query):
+        """Resolve a name the way Scryfall's fuzzy lookup would: exact, then prefix, then similar."""
+        key = normalize(query)
+        if not key:
+            return None
+        return self.exact(key) or self.prefix(key) or self.fuzzy(key)
+
+    def close(self):
+        self._mm.close()
+
+# ============================================================
+# Image Cache
+# ============================================================
+
+class ImageCache:
+    """
+    Card images on disk, named by Scryfall id and evicted least recently
+    used first once they total more than max_bytes. Recency survives a
+    restart through the files' modification times. Concurrent requests
+    for the same missing image download it once.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._downloads = {}  # card id -> lock held while it downloads
+        self._throttle = threading.Lock()
+        self._last_fetch = 0.0
+        self._session = requests.Session()
+        self._session.headers.update(SCRYFALL_HEADERS)
+        self._entries = OrderedDict()  # card id -> size, least recently used first
+        files = [name for name in os.listdir(directory) if name.endswith(".jpg")]
+        for name in sorted(files, key=lambda n: os.path.getmtime(os.path.join(directory, n))):
+            self._entries[name[:-4]] = os.path.getsize(os.path.join(directory, name))
+        self.size = sum(self._entries.values())
+
+    def _path(self, card_id):
+        return os.path.join(self.directory, card_id + ".jpg")
+
+    def get(self, card):
+        """Path of the card's image, downloading it on a miss; None if it cannot be fetched."""
+        path = self._path(card.id)
+        with self._lock:
+            if card.id in self._entries:
+                self._entries.move_to_end(card.id)
+                hit = True
+            else:
+                hit = False
+                download = self._downloads.setdefault(card.id, threading.Lock())
+        if hit:
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                with self._lock:
+                    self.size -= self._entries.pop(card.id, 0)
+                return self.get(card)
+        with download:
+            with self._lock:
+                if card.id in self._entries:
+                    return path
+            try:
+                data = self._fetch(card.image_url)
+            finally:
+                with self._lock:
+                    self._downloads.pop(card.id, None)
+            if data is None:
+                return None
+            tmp = path + ".part"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                self._entries[card.id] = len(data)
+                self.size += len(data)
+                self._evict()
+        return path
+
+    def _fetch(self, url):
+        if not url:
+            return None
+        with self._throttle:
+            wait = self._last_fetch + SCRYFALL_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_fetch = time.monotonic()
+        try:
+            r = self._session.get(url, timeout=15)
+        except requests.RequestException as e:
+            log.warning(f"Image fetch failed for {url}: {e}")
+            return None
+        if r.status_code != 200:
+            log.warning(f"Image fetch for {url} returned {r.status_code}")
+            return None
+        return r.content
+
+    def _evict(self):
+        """Remove least recently used images until the cache fits; called with the lock held."""
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            card_id, size = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self._path(card_id))
+            except OSError:
+                pass
+
+# ============================================================
+# HTTP Service
+# ============================================================
+
+class CardServiceHandler(BaseHTTPRequestHandler):
+    index = None
+    images = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, details):
+        self._send_json(404, {"object": "error", "code": "not_found", "status": 404, "details": details})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/cards/named":
+            self._named(parse_qs(url.query))
+            return
+        match = re.fullmatch(r"/cards/([0-9a-f-]{36})/image", url.path)
+        if match:
+            self._image(match.group(1))
+            return
+        self._not_found(f"No endpoint at {url.path}")
+
+    def _named(self, query):
+        if "exact" in query:
+            card = self.index.exact(query["exact"][0])
+        elif "fuzzy" in query:
+            card = self.index.resolve(query["fuzzy"][0])
+        else:
+            self._send_json(400, {"object": "error", "code": "bad_request", "status": 400,
+                                  "details": "Give a card name as exact= or fuzzy="})
+            return
+        if card is None:
+            self._not_found("No card found with the given name")
+        elif query.get("format", [""])[0] == "image":
+            self.send_response(302)
+            self.send_header("Location", f"{PUBLIC_PREFIX}/cards/{card.id}/image")
+            self.send_header("Cache-Control", "public, max-age=86400")
+            self.end_headers()
+        else:
+            self._send_json(200, card.to_json())
+
+    def _image(self, card_id):
+        if self.headers.get("If-None-Match") == f'"{card_id}"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        card = self.index.by_id(card_id)
+        path = card and self.images.get(card)
+        if not path:
+            self._not_found("No image for this card")
+            return
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            # evicted between lookup and read
+            self._not_found("No image for this card")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "public, max-age=604800")
+        self.send_header("ETag", f'"{card_id}"')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/cards/resolve":
+            self._not_found(f"No endpoint at {self.path}")
+            return
+        try:
+            names = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")["names"]
+            if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"object": "error", "code": "bad_request", "status": 400,
+                                  "details": 'Expected {"names": [...]}'})
+            return
+        if len(names) > MAX_BATCH:
+            self._send_json(400, {"object": "error", "code": "bad_request", "status": 400,
+                                  "details": f"At most {MAX_BATCH} names per request"})
+            return
+        cards = {}
+        for name in names:
+            card = self.index.resolve(name)
+            cards[name] = card.to_json() if card else None
+        self._send_json(200, {"object": "resolution", "cards": cards})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(index, images):
+    CardServiceHandler.index = index
+    CardServiceHandler.images = images
+    server = ThreadingHTTPServer((BIND_ADDRESS, PORT), CardServiceHandler)
+    log.info(f"Card service for {index.card_count} cards listening on {BIND_ADDRESS}:{PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# ============================================================
+# Main
+# ============================================================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Card resolution and image cache for [[Card Name]] tooltips.")
+    parser.add_argument("--index", default=INDEX_FILE, help="index file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="download Scryfall's oracle_cards bulk data")
+    download.add_argument("dest", nargs="?", default=BULK_FILE)
+
+    build = commands.add_parser("build", help="compile a bulk-data file into the index")
+    build.add_argument("bulk", nargs="?", default=BULK_FILE, help="Scryfall bulk JSON, optionally .gz")
+
+    lookup = commands.add_parser("lookup", help="resolve card names against the index")
+    lookup.add_argument("names", nargs="+")
+
+    serve_cmd = commands.add_parser("serve", help="run the HTTP service")
+    serve_cmd.add_argument("--bulk", default=BULK_FILE,
+                           help="rebuild the index from this file first when it is newer than the index")
+    serve_cmd.add_argument("--image-dir", default=IMAGE_DIR)
+    serve_cmd.add_argument("--cache-bytes", type=int, default=IMAGE_CACHE_BYTES)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    args = parse_args(argv)
+    if args.command == "download":
+        download_bulk(args.dest)
+    elif args.command == "build":
+        build_index(args.bulk, args.index)
+    elif args.command == "lookup":
+        index = CardIndex(args.index)
+        for name in args.names:
+            card = index.resolve(name)
+            print(f"{name!r}: " + (f"{card.name} ({card.id})" if card else "not found"))
+    else:
+        if os.path.exists(args.bulk) and (not os.path.exists(args.index)
+                                          or os.path.getmtime(args.bulk) > os.path.getmtime(args.index)):
+            build_index(args.bulk, args.index)
+        serve(CardIndex(args.index), ImageCache(args.image_dir, args.cache_bytes))
+
+if __name__ == "__main__":
+    sys.exit(main())
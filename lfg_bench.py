@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+"""
+PDH Forum LFG Bot — Offline Benchmark
+Repository: https://github.com/TryhardClay/discourse-mtg-pdhforum
+
+Measures the bot's throughput without touching pdhforum.com or Convoke.
+
+A fake forum runs in-process on 127.0.0.1 and implements every endpoint
+the bot calls:
+
+  GET    /chat/api/me/channels
+  GET    /chat/api/channels/{id}/messages
+  PUT    /chat/api/channels/{id}/read/{message_id}
+  POST   /chat/{id}
+  POST   /chat/api/direct-message-channels
+  POST   /posts.json
+  GET    /t/{id}.json            DELETE /t/{id}.json
+  GET    /posts/{id}.json        PUT /posts/{id}.json
+  GET    /polls/voters.json
+  GET    /c/{id}.json
+  POST   /api/game/create-game   (Convoke)
+
+GET responses carry an ETag and honour If-None-Match with a 304, as
+Rails does. Every response can be delayed (--latency-ms, --jitter-ms) and a fraction
+of them replaced by 503s (--error-rate) or 429s (--throttle-rate).
+
+Simulated players either DM a trigger to the bot (which seats them in a
+lobby or opens one) or, for --vote-fraction of them, browse the LFG
+category and vote on the oldest open topic like a forum visitor would.
+Anyone turned away as overflow re-queues once.
+Each scenario runs in its own subprocess so bot state never leaks from
+one run into the next.
+
+Usage:
+  python3 lfg_bench.py                            # 10, 100 and 1000 users
+  python3 lfg_bench.py --users 100 --latency-ms 80 --error-rate 0.02
+  python3 lfg_bench.py --engine async --json
+
+Reported per scenario:
+  cycle latency   p50/p95/max of each bot phase (check_dm_channels, ...)
+  requests/match  total API requests divided by completed matches
+  request->match  p50/p95/max seconds from a player's trigger DM to the
+                  group DM announcing their game
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import random
+import argparse
+import tempfile
+import itertools
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BOT_USERNAME = "PDHMatchmaker"
+BOT_USER_ID = 1
+
+# Share of players asking for each format
+FORMAT_MIX = {"casual": 0.45, "comp": 0.25, "1v1": 0.30}
+
+MESSAGE_PAGE_SIZE = 50
+TOPIC_LIST_PAGE_SIZE = 30
+
+# ============================================================
+# Fake Discourse + Convoke
+# ============================================================
+
+class FakeForum:
+    """
+    In-memory forum state shared by the HTTP handler and the player driver.
+    All access goes through self.lock.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, seed=1):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1000)
+        self.rng = random.Random(seed)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+        self.channels = {}          # channel_id -> {"members", "messages", "last_read"}
+        self.channel_by_members = {}
+        self.topics = {}            # topic_id -> {"post_id", "title", "category", "votes", "created_at"}
+        self.requests = {}          # "METHOD route" -> count
+        self.injected = {"503": 0, "429": 0}
+
+    # -- player side (no HTTP) --------------------------------------
+
+    def channel_for(self, usernames):
+        members = frozenset(u for u in usernames if u != BOT_USERNAME)
+        channel_id = self.channel_by_members.get(members)
+        if channel_id is None:
+            channel_id = next(self.ids)
+            self.channel_by_members[members] = channel_id
+            self.channels[channel_id] = {"members": members, "messages": [], "last_read": 0}
+        return channel_id
+
+    def dm_channel_for(self, username):
+        with self.lock:
+            return self.channel_by_members.get(frozenset([username]))
+
+    def user_send(self, username, text):
+        with self.lock:
+            channel_id = self.channel_for([username])
+            message_id = next(self.ids)
+            self.channels[channel_id]["messages"].append(
+                {"id": message_id, "message": text, "user": {"id": hash(username) & 0xFFFFFF, "username": username}}
+            )
+            return channel_id
+
+    def vote(self, topic_id, username):
+        with self.lock:
+            topic = self.topics.get(topic_id)
+            if topic and username not in topic["votes"]:
+                topic["votes"].append(username)
+                return True
+            return False
+
+    def oldest_topic(self, category_id):
+        with self.lock:
+            ids = [topic_id for topic_id, t in self.topics.items() if t["category"] == category_id]
+            return min(ids) if ids else None
+
+    def bot_messages_since(self, channel_id, after_id):
+        with self.lock:
+            return [
+                m for m in self.channels[channel_id]["messages"]
+                if m["id"] > after_id and m["user"]["username"] == BOT_USERNAME
+            ]
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    # -- server side ------------------------------------------------
+
+    def count(self, method, path):
+        route = re.sub(r"/\d+", "/{id}", path)
+        with self.lock:
+            key = f"{method} {route}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def delay_and_fault(self):
+        """Sleep the configured latency; return an injected status code or None."""
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            self.injected["503"] += 1
+            return 503
+        if roll < self.error_rate + self.throttle_rate:
+            self.injected["429"] += 1
+            return 429
+        return None
+
+    def unread_count(self, channel):
+        return sum(
+            1 for m in channel["messages"]
+            if m["id"] > channel["last_read"] and m["user"]["username"] != BOT_USERNAME
+        )
+
+    def me_channels(self):
+        channels, tracking = [], {}
+        for channel_id, channel in self.channels.items():
+            last = channel["messages"][-1]["id"] if channel["messages"] else 0
+            channels.append({
+                "id": channel_id,
+                "last_message": {"id": last},
+                "chatable": {"users": [{"username": u} for u in sorted(channel["members"])]},
+                "current_user_membership": {"last_read_message_id": channel["last_read"]},
+            })
+            tracking[str(channel_id)] = {"unread_count": self.unread_count(channel)}
+        return {"direct_message_channels": channels, "tracking": {"channel_tracking": tracking}}
+
+    def channel_messages(self, channel_id, query):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return None
+        messages = channel["messages"]
+        page_size = int(query.get("page_size", [MESSAGE_PAGE_SIZE])[0])
+        target = query.get("target_message_id")
+        if target and query.get("direction", [""])[0] == "future":
+            target_id = int(target[0])
+            newer = [m for m in messages if m["id"] > target_id]
+            page = newer[:page_size]
+            return {"messages": page, "meta": {"can_load_more_future": len(newer) > page_size}}
+        return {"messages": messages[-page_size:], "meta": {"can_load_more_future": False}}
+
+    def topic_json(self, topic_id):
+        topic = self.topics.get(topic_id)
+        if topic is None:
+            return None
+        poll = {"name": "poll", "status": "open", "voters": len(topic["votes"])}
+        return {
+            "id": topic_id,
+            "title": topic["title"],
+            "post_stream": {"posts": [{"id": topic["post_id"], "cooked": topic["raw"], "polls": [poll]}]},
+        }
+
+    def post_json(self, post_id):
+        for topic_id, topic in self.topics.items():
+            if topic["post_id"] == post_id:
+                poll = {"name": "poll", "status": "open", "voters": len(topic["votes"])}
+                return {"id": post_id, "topic_id": topic_id, "post_number": 1, "polls": [poll]}
+        return None
+
+    def category_topics(self, category_id, page):
+        topics = [
+            {
+                "id": topic_id,
+                "title": topic["title"],
+                "created_at": topic["created_at"],
+                "posters": [{"user_id": BOT_USER_ID, "description": "Original Poster"}],
+            }
+            for topic_id, topic in self.topics.items() if topic["category"] == category_id
+        ]
+        page_topics = topics[page * TOPIC_LIST_PAGE_SIZE:(page + 1) * TOPIC_LIST_PAGE_SIZE]
+        more = len(topics) > (page + 1) * TOPIC_LIST_PAGE_SIZE
+        return {
+            "users": [{"id": BOT_USER_ID, "username": BOT_USERNAME}],
+            "topic_list": {
+                "topics": page_topics,
+                "more_topics_url": f"/c/{category_id}.json?page={page + 1}" if more else None,
+            },
+        }
+
+    def create_topic(self, data):
+        topic_id = next(self.ids)
+        self.topics[topic_id] = {
+            "post_id": next(self.ids),
+            "title": data.get("title", ""),
+            "category": data.get("category"),
+            "votes": [],
+            "raw": data.get("raw", ""),
+            "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        }
+        return {"id": self.topics[topic_id]["post_id"], "topic_id": topic_id}
+
+    def post_chat_message(self, channel_id, data):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return None
+        message_id = next(self.ids)
+        channel["messages"].append(
+            {"id": message_id, "message": data.get("message", ""), "user": {"id": BOT_USER_ID, "username": BOT_USERNAME}}
+        )
+        return {"message_id": message_id}
+
+    def handle(self, method, path, query, data):
+        """Dispatch one request against forum state. Caller holds self.lock."""
+        if method == "GET" and path == "/chat/api/me/channels":
+            return 200, self.me_channels()
+
+        m = re.fullmatch(r"/chat/api/channels/(\d+)/messages", path)
+        if method == "GET" and m:
+            result = self.channel_messages(int(m.group(1)), query)
+            return (200, result) if result is not None else (404, None)
+
+        m = re.fullmatch(r"/chat/api/channels/(\d+)/read/(\d+)", path)
+        if method == "PUT" and m:
+            channel = self.channels.get(int(m.group(1)))
+            if channel is None:
+                return 404, None
+            channel["last_read"] = max(channel["last_read"], int(m.group(2)))
+            return 200, {"success": "OK"}
+
+        m = re.fullmatch(r"/chat/(\d+)", path)
+        if method == "POST" and m:
+            result = self.post_chat_message(int(m.group(1)), data)
+            return (200, result) if result is not None else (404, None)
+
+        if method == "POST" and path == "/chat/api/direct-message-channels":
+            return 200, {"channel": {"id": self.channel_for(data.get("target_usernames", []))}}
+
+        if method == "POST" and path == "/posts.json":
+            return 200, self.create_topic(data)
+
+        m = re.fullmatch(r"/t/(\d+)\.json", path)
+        if m:
+            topic_id = int(m.group(1))
+            if method == "GET":
+                result = self.topic_json(topic_id)
+                return (200, result) if result is not None else (404, None)
+            if method == "DELETE":
+                return (200, None) if self.topics.pop(topic_id, None) else (404, None)
+
+        m = re.fullmatch(r"/posts/(\d+)\.json", path)
+        if m and method in ("GET", "PUT"):
+            result = self.post_json(int(m.group(1)))
+            if result is not None and method == "PUT":
+                topic = self.topics[result["topic_id"]]
+                topic["raw"] = (data.get("post") or {}).get("raw", topic.get("raw", ""))
+            return (200, result) if result is not None else (404, None)
+
+        if method == "GET" and path == "/polls/voters.json":
+            topic = self.topics.get(int(query.get("topic_id", ["0"])[0]))
+            if topic is None:
+                return 404, None
+            return 200, {"voters": {"option": [{"username": u} for u in topic["votes"]]}}
+
+        m = re.fullmatch(r"/c/(\d+)\.json", path)
+        if method == "GET" and m:
+            return 200, self.category_topics(int(m.group(1)), int(query.get("page", ["0"])[0]))
+
+        if method == "POST" and path == "/api/game/create-game":
+            return 200, {"url": f"https://convoke.games/en/game/{next(self.ids)}"}
+
+        return 404, None
+
+def make_handler(forum):
+    class FakeForumHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Keep-alive with headers and body sent separately: without
+        # TCP_NODELAY every response waits out Nagle plus delayed ACK (~40 ms)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, status, payload=None, method="POST"):
+            body = json.dumps(payload if payload is not None else {}).encode()
+            etag = None
+            if method == "GET" and status == 200:
+                etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                return json.loads(raw or b"{}")
+            except ValueError:
+                return {}
+
+        def handle_request(self, method):
+            url = urlparse(self.path)
+            path, query = url.path, parse_qs(url.query)
+            data = self.read_json() if method in ("POST", "PUT") else {}
+            forum.count(method, path)
+            fault = forum.delay_and_fault()
+            if fault:
+                return self.reply(fault)
+            with forum.lock:
+                status, payload = forum.handle(method, path, query, data)
+            self.reply(status, payload, method)
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+        def do_PUT(self):
+            self.handle_request("PUT")
+
+        def do_DELETE(self):
+            self.handle_request("DELETE")
+
+    return FakeForumHandler
+
+def start_fake_forum(forum):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(forum))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-forum", daemon=True).start()
+    return server
+
+# ============================================================
+# Simulated Players
+# ============================================================
+
+class Player:
+    __slots__ = ("username", "format_key", "channel_id", "requested_at", "matched_at",
+                 "last_seen_id", "voted_on", "retries", "done")
+
+    def __init__(self, username, format_key):
+        self.username = username
+        self.format_key = format_key
+        self.channel_id = None
+        self.requested_at = None
+        self.matched_at = None
+        self.last_seen_id = 0
+        self.voted_on = None
+        self.retries = 0
+        self.done = False
+
+class PlayerDriver:
+    """
+    Sends each player's trigger at their arrival time and reacts to the
+    bot's replies by reading forum state directly (players cost no HTTP).
+    """
+
+    TOPIC_LINK = re.compile(r"/t/(\d+)")
+
+    def __init__(self, forum, players, arrivals, voters=(), categories=None):
+        self.forum = forum
+        self.players = players
+        self.arrivals = arrivals
+        self.voters = set(voters)  # usernames that vote on the forum instead of DMing
+        self.categories = categories or {}
+        self.by_username = {p.username: p for p in players}
+        self.group_cursor = 0
+
+    def step(self, elapsed):
+        for player, arrival in zip(self.players, self.arrivals):
+            if player.requested_at is None and elapsed >= arrival:
+                player.requested_at = time.time()
+                if player.username in self.voters:
+                    topic_id = self.forum.oldest_topic(self.categories.get(player.format_key))
+                    if topic_id and self.forum.vote(topic_id, player.username):
+                        player.voted_on = topic_id
+                        continue
+                player.channel_id = self.forum.user_send(player.username, player.format_key)
+
+        for player in self.players:
+            if player.channel_id is None and player.voted_on:
+                # the bot only DMs a voter if they overflow
+                player.channel_id = self.forum.dm_channel_for(player.username)
+            if player.channel_id is None or player.done:
+                continue
+            for message in self.forum.bot_messages_since(player.channel_id, player.last_seen_id):
+                player.last_seen_id = message["id"]
+                self.react(player, message["message"])
+
+        self.collect_group_matches()
+
+    def react(self, player, text):
+        if "filled up" in text and "Feel free" in text and player.retries == 0:
+            player.retries += 1
+            self.forum.user_send(player.username, player.format_key)
+        elif "expired" in text:
+            player.done = True
+
+    def collect_group_matches(self):
+        """Scan group DMs (two or more players) for new match announcements."""
+        with self.forum.lock:
+            groups = [c for c in self.forum.channels.values() if len(c["members"]) > 1]
+            announcements = [
+                (c["members"], m) for c in groups for m in c["messages"]
+                if m["id"] > self.group_cursor and "Game found" in m["message"]
+            ]
+        now = time.time()
+        for members, message in announcements:
+            self.group_cursor = max(self.group_cursor, message["id"])
+            for username in members:
+                player = self.by_username.get(username)
+                if player and player.matched_at is None:
+                    player.matched_at = now
+                    player.done = True
+
+    def all_resolved(self):
+        return all(p.done for p in self.players)
+
+# ============================================================
+# Scenario Runner (subprocess)
+# ============================================================
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(values, scale=1.0, digits=1):
+    if not values:
+        return {"p50": None, "p95": None, "max": None, "n": 0}
+    return {
+        "p50": round(percentile(values, 50) * scale, digits),
+        "p95": round(percentile(values, 95) * scale, digits),
+        "max": round(max(values) * scale, digits),
+        "n": len(values),
+    }
+
+def import_bot(workdir):
+    """Import lfg_bot against a scratch directory, with logging turned down."""
+    os.environ.setdefault("DISCOURSE_API_KEY", "bench")
+    os.environ.setdefault("CONVOKE_API_KEY", "bench")
+    os.environ["LFG_LOG_FILE"] = os.path.join(workdir, "lfg_bot.log")
+    os.environ["LFG_STATE_DB"] = os.path.join(workdir, "state.db")
+    os.environ["LFG_METRICS_PORT"] = "0"
+    os.environ["LFG_LOG_DEBUG_SAMPLE"] = "0"
+    os.environ["LFG_PROFILE_DIR"] = os.path.join(workdir, "profiles")
+    os.environ["LFG_HISTORY_DIR"] = os.path.join(workdir, "history")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import logging
+    import lfg_bot
+    lfg_bot.configure_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    return lfg_bot
+
+def record_cycle_phases(bot):
+    """Capture raw per-phase durations by wrapping the bot's cycle histogram."""
+    samples = {}
+    observe = bot.CYCLE_DURATION.observe
+
+    def recording_observe(value, **labels):
+        samples.setdefault(labels.get("phase", ""), []).append(value)
+        observe(value, **labels)
+
+    bot.CYCLE_DURATION.observe = recording_observe
+    return samples
+
+def run_sync_engine(bot, driver, duration, start):
+    while time.time() - start < duration and not driver.all_resolved():
+        driver.step(time.time() - start)
+        bot.run_cycle()
+        driver.step(time.time() - start)
+        # wake at least every 100 ms so newly arriving players are sent on time
+        bot.wait_for_events(min(0.1, max(0, bot.next_wakeup() - time.time())))
+
+def run_async_engine(bot, driver, duration, start):
+    import asyncio
+
+    async def drive():
+        while time.time() - start < duration and not driver.all_resolved():
+            driver.step(time.time() - start)
+            await asyncio.sleep(0.05)
+
+    async def run():
+        engine = asyncio.ensure_future(bot.async_main(False))
+        await drive()
+        engine.cancel()
+        try:
+            await engine
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+def run_scenario(args):
+    workdir = tempfile.mkdtemp(prefix="lfg_bench_")
+    bot = import_bot(workdir)
+    if args.rate_limit:
+        limiter = bot.RateLimiter(args.rate_limit, bot.RATE_LIMIT_BURST, bot.RATE_LIMIT_ROUTES)
+    else:
+        # measure the bot itself, not the production request budget
+        limiter = bot.RateLimiter(10 ** 9, 10 ** 6, {})
+    bot.rate_limiters["discourse"] = limiter
+
+    forum = FakeForum(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, args.seed)
+    server = start_fake_forum(forum)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    bot.DISCOURSE_URL = base_url
+    bot.CONVOKE_API_URL = f"{base_url}/api/game/create-game"
+    bot.LFG_EXPIRY_SECONDS = args.expiry
+    bot.open_state_store(os.environ["LFG_STATE_DB"])
+    bot.outbox.start()
+    if bot.ROOM_POOL_ENABLED:
+        bot.room_pool.start()
+    phases = record_cycle_phases(bot)
+
+    rng = random.Random(args.seed)
+    formats, weights = zip(*FORMAT_MIX.items())
+    players = [Player(f"player{i:05d}", rng.choices(formats, weights)[0]) for i in range(args.users)]
+    window = args.duration * args.arrival_fraction
+    arrivals = sorted(rng.uniform(0, window) for _ in players)
+    voters = [p.username for p in players if rng.random() < args.vote_fraction]
+    categories = {format_key: spec[0] for format_key, spec in bot.LFG_FORMATS.items()}
+    driver = PlayerDriver(forum, players, arrivals, voters, categories)
+
+    cpu_start = time.process_time()
+    start = time.time()
+    if args.engine == "async":
+        run_async_engine(bot, driver, args.duration, start)
+    else:
+        run_sync_engine(bot, driver, args.duration, start)
+    wall = time.time() - start
+    cpu = time.process_time() - cpu_start
+    server.shutdown()
+
+    matched = [p for p in players if p.matched_at is not None]
+    matches = bot.MATCHES._values
+    match_count = int(sum(matches.values()))
+    total_requests = forum.total_requests()
+    return {
+        "users": args.users,
+        "engine": args.engine,
+        "wall_seconds": round(wall, 1),
+        "bot_cpu_seconds": round(cpu, 2),
+        "matches": match_count,
+        "players_matched": len(matched),
+        "players_unresolved": sum(1 for p in players if not p.done),
+        "requests": total_requests,
+        "requests_per_match": round(total_requests / match_count, 1) if match_count else None,
+        "cpu_ms_per_match": round(cpu / match_count * 1000, 1) if match_count else None,
+        "request_to_match_s": summarize([p.matched_at - p.requested_at for p in matched]),
+        "cycle_phase_ms": {phase: summarize(values, 1000) for phase, values in sorted(phases.items())},
+        "requests_by_route": dict(sorted(forum.requests.items(), key=lambda kv: -kv[1])),
+        "injected_faults": forum.injected,
+    }
+
+# ============================================================
+# Reporting
+# ============================================================
+
+def print_report(result):
+    print(f"\n=== {result['users']} users ({result['engine']} engine) ===")
+    print(f"  wall {result['wall_seconds']}s, bot CPU {result['bot_cpu_seconds']}s")
+    print(
+        f"  matches {result['matches']} ({result['players_matched']} players), "
+        f"unresolved players {result['players_unresolved']}"
+    )
+    print(
+        f"  requests {result['requests']}, per match {result['requests_per_match']}, "
+        f"CPU per match {result['cpu_ms_per_match']}ms"
+    )
+    r2m = result["request_to_match_s"]
+    print(f"  request->match s: p50 {r2m['p50']}  p95 {r2m['p95']}  max {r2m['max']}")
+    for phase, stats in result["cycle_phase_ms"].items():
+        print(f"  {phase:<24} ms: p50 {stats['p50']}  p95 {stats['p95']}  max {stats['max']}  (n={stats['n']})")
+    top = list(result["requests_by_route"].items())[:6]
+    print("  busiest routes: " + ", ".join(f"{route} x{count}" for route, count in top))
+    if any(result["injected_faults"].values()):
+        print(f"  injected faults: {result['injected_faults']}")
+
+def scenario_command(args, users):
+    return [
+        sys.executable, os.path.abspath(__file__), "--run-scenario",
+        "--users", str(users),
+        "--duration", str(args.duration),
+        "--arrival-fraction", str(args.arrival_fraction),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--rate-limit", str(args.rate_limit),
+        "--expiry", str(args.expiry),
+        "--vote-fraction", str(args.vote_fraction),
+        "--engine", args.engine,
+        "--seed", str(args.seed),
+    ]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the PDH Forum LFG bot.")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100, 1000],
+                        help="concurrent players per scenario (default: 10 100 1000)")
+    parser.add_argument("--duration", type=float, default=60, help="max seconds per scenario")
+    parser.add_argument("--arrival-fraction", type=float, default=0.5,
+                        help="players arrive uniformly over this fraction of the duration")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake server response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="+/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of responses replaced by 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of responses replaced by 429")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="apply the production rate limiter with this many requests per minute "
+                             "(default 0: no client-side limiting)")
+    parser.add_argument("--vote-fraction", type=float, default=0.3,
+                        help="share of players who vote on an open topic instead of DMing the bot")
+    parser.add_argument("--expiry", type=float, default=3600, help="LFG_EXPIRY_SECONDS for the bot")
+    parser.add_argument("--engine", choices=("sync", "async"), default="sync")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    parser.add_argument("--run-scenario", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+
+    if args.run_scenario:
+        args.users = args.users[0]
+        print(json.dumps(run_scenario(args)))
+        return
+
+    results = []
+    for users in args.users:
+        proc = subprocess.run(scenario_command(args, users), capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            sys.exit(f"Scenario with {users} users failed")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        if not args.json:
+            print_report(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,338 @@ Author: TryhardClay
 ===============================================================
 VERSION HISTORY
 ===============================================================
+v2.27.0 (2026-10-16)
+  - Match history: requests, seatings, new lobbies, poll vote changes,
+    matches (with time to fill), expiries and overflow are appended to
+    a rolling event store in HISTORY_DIR (LFG_HISTORY_DIR) as fixed-size
+    binary records, one segment file per UTC day, kept for
+    HISTORY_RETENTION_DAYS
+  - lfg_history.py reads the store with NumPy and reports time-to-match
+    percentiles, fill rates and hourly demand curves per format
+
+v2.26.0 (2026-10-16)
+  - Non-blocking startup: restoring topics from the forum (empty state
+    store) runs on a background thread, so DMs are answered from the
+    first cycle; a trigger for a format whose category is still being
+    restored waits up to RESTORE_WAIT_SECONDS for it, so it can join an
+    existing lobby instead of opening a duplicate
+  - All LFG categories are crawled in parallel, following every page of
+    each listing (iter_category_topics)
+  - Restored topics keep their created_at from the listing, so their
+    expiry is not reset; ownership is checked against the Original
+    Poster (the bot account) instead of the "—" in the title
+  - The sweeper starts once restoration has finished, so it never takes
+    a not-yet-restored topic for an orphan
+  - get_lfg_topics() removed (first page only)
+
+v2.25.0 (2026-10-16)
+  - Incremental channel list: /chat/api/me/channels is fetched with
+    If-None-Match, so an unchanged list costs a bodyless 304, and a
+    changed one is pull-parsed from the stream (JsonStream) one channel
+    at a time instead of being loaded whole
+  - Only channels whose last message changed since the previous list,
+    or that still have unread messages, are handed on to the DM cache
+    and prepare_channel(); the previous list is kept as a compact
+    snapshot of last message ids
+  - Cursors (processed_message_ids) are a CursorTable: sorted array
+    columns instead of a dict, and a channel only gets a cursor once it
+    has unread messages; until then its baseline is the server-side
+    read marker
+  - Cursors untouched for DM_CHANNEL_DORMANT_SECONDS are evicted from
+    memory and the state store (checked every DM_CHANNEL_EVICT_INTERVAL)
+
+v2.24.0 (2026-10-16)
+  - Circuit breakers for Discourse and Convoke: BREAKER_FAILURE_THRESHOLD
+    consecutive failed requests (connection errors, timeouts, 5xx) open
+    a service's breaker, and its calls then fail at once with
+    CircuitOpenError instead of waiting out timeouts and retries
+  - An open breaker runs a health probe (Discourse /srv/status, the
+    Convoke API root) after BREAKER_RESET_SECONDS, doubling the wait up
+    to BREAKER_RESET_MAX while it fails; a passing probe half-opens the
+    breaker, and the first request that succeeds closes it
+  - Convoke open: match notifications use the lobby link straight away
+  - Discourse not closed: topic checks pause and the DM check is skipped
+    quietly; when the breaker closes, every active topic's expiry is
+    pushed back by the length of the outage
+  - New metrics: lfg_circuit_breaker_state (0 closed, 1 half-open,
+    2 open), lfg_circuit_breaker_trips_total, lfg_circuit_breaker_rejected_total
+
+v2.23.0 (2026-10-16)
+  - Cycle profiling: every cycle builds a span tree of the helpers it
+    ran (get_dm_channel_data, get_channel_messages, get_poll_state,
+    get_poll_voters, notify_match, ...), each with wall time, CPU time
+    and time spent waiting on the network
+  - Span totals are exported as lfg_span_seconds_total (span, kind =
+    wall / cpu / network)
+  - A cycle slower than SLOW_CYCLE_SECONDS is written to PROFILE_DIR
+    (LFG_PROFILE_DIR) as folded stacks, with network wait as its own
+    [network] frame, ready for flamegraph.pl or speedscope
+  - SIGUSR1 starts a sampling profiler that records every thread's
+    stack for PROFILE_SAMPLE_SECONDS and writes it to PROFILE_DIR in
+    the same format; only the newest PROFILE_MAX_FILES files are kept
+
+v2.22.0 (2026-10-16)
+  - Reconciliation sweeper: a background thread on the leader lists every
+    page of each LFG category every SWEEP_INTERVAL and diffs the bot's own
+    topics (Original Poster = the bot account) against tracked state
+  - Orphaned topics (listed, not tracked, no deletion pending, older
+    than SWEEP_GRACE_SECONDS) are deleted through the outbox at low
+    priority, at most SWEEP_BATCH_SIZE per sweep; a backlog shortens the
+    next sweep to SWEEP_BACKLOG_INTERVAL
+  - Tracked topics missing from the listing are re-checked (a 404
+    untracks them) and tracked topics past their expiry are expired now
+  - iter_category_topics() follows a category listing across all pages
+  - New metrics: lfg_sweeper_drift_topics (kind), lfg_sweeper_removed_total;
+    LFG_SWEEPER=0 disables the sweeper
+
+v2.21.0 (2026-10-16)
+  - Per-user request index (UserIndex): recent messages, triggers and
+    help replies per player, LRU-bounded by USER_INDEX_SIZE
+  - A player's messages beyond USER_MESSAGES_PER_MINUTE are ignored, as
+    is the same trigger repeated within TRIGGER_COOLDOWN_SECONDS (the
+    first reply already answered it); the cooldown is cleared once the
+    player's game is matched or expires
+  - The help text is sent at most once per HELP_REPLY_COOLDOWN_SECONDS
+    per player, and not at all while less than SHED_HEADROOM of the
+    Discourse rate-limit budget is left, so chatter cannot crowd out
+    match traffic
+  - A player can be in at most USER_MAX_LOBBIES lobbies (formats) at once
+  - New metric: lfg_user_messages_shed_total (reason)
+
+v2.20.0 (2026-10-16)
+  - Non-blocking logging: log calls only put the record on a bounded
+    queue (LOG_QUEUE_SIZE); a listener thread formats and writes it, so
+    slow disks never add latency to a cycle. When the queue is full,
+    records are dropped and counted (lfg_log_records_dropped_total)
+    instead of blocking
+  - The log file rotates at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT files
+  - The log file is JSON lines carrying topic_id, channel_id,
+    format_key and latency_ms where known; stderr stays human-readable
+  - Hot-path log calls use lazy %-style arguments, so filtered records
+    cost no string formatting
+  - Per-message logging is sampled debug output
+    (LFG_LOG_DEBUG_SAMPLE, default 1% of messages)
+
+v2.19.0 (2026-10-16)
+  - Traffic recording (LFG_RECORD_FILE): every Discourse and Convoke
+    request the bot makes is appended with its response to a
+    gzip-compressed JSON-lines log; API keys are never written
+  - Offline replay and load simulator (lfg_replay.py): rebuilds player
+    DMs and forum votes from a recording, replays them against the fake
+    forum from lfg_bench.py on a virtual clock at full CPU speed, and
+    can multiply the recorded players (--amplify) to project load
+  - Outbox.run_due() delivers due jobs on the calling thread, so the
+    replay runs without background workers
+
+v2.18.0 (2026-10-16)
+  - Coordination for running several bot processes at once
+    (LFG_COORDINATION=1): every process is a worker holding leases in a
+    LeaseStore (SQLite backend by default, LFG_LEASE_BACKEND selects
+    another registered in LEASE_BACKENDS)
+  - One worker holds the leader lease and owns topic lifecycle: lobbies,
+    topic checks, the outbox and the Convoke room pool. It loads that
+    state from the store when it is elected
+  - DM channels are split into LFG_SHARD_COUNT shards by channel id and
+    the shard leases are spread evenly over the live workers; a worker
+    only reads and answers channels in its own shards
+  - A trigger read by a follower is handed to the leader through the
+    forwarded_requests table; help replies are sent by the shard owner
+  - Shard handoff: a worker releases a shard only between channel
+    passes and the new owner reloads its cursors from the store, so no
+    message is handled twice or skipped
+  - SIGTERM releases every lease at once, so a restarted or replaced
+    worker takes over immediately (zero-downtime restarts); a leader
+    that loses its lease exits instead of acting on stale state
+  - New gauges: lfg_coordination_leader, lfg_coordination_shards
+
+v2.17.0 (2026-10-16)
+  - Incremental message fetching: process_channel() asks only for
+    messages after the channel's cursor (target_message_id +
+    direction=future) instead of re-downloading the latest page and
+    filtering it client-side
+  - Pages forward (MESSAGE_PAGE_SIZE) until can_load_more_future is
+    false, so a burst longer than one page no longer drops triggers
+  - The bot's read marker is moved to the last handled message
+    (PUT /chat/api/channels/{id}/read/{message_id}), so unread_count only
+    counts messages still to be handled and idle channels stop being
+    refetched every cycle
+  - MESSAGE_FETCH_BYTE_BUDGET caps message payload bytes per ingestion
+    pass; a channel cut off by the cap stays unread and resumes from its
+    cursor on the next pass
+  - New channels take their baseline from the membership's
+    last_read_message_id when the channel list provides it
+
+v2.16.0 (2026-10-16)
+  - DM channel cache: get_or_create_dm_channel() and create_group_dm()
+    look up the set of usernames in DMChannelCache before POSTing to
+    /chat/api/direct-message-channels
+  - The cache is filled for free from the chatable.users of every
+    channel in the /chat/api/me/channels response, and from each channel
+    the bot creates
+  - Bounded LRU (DM_CACHE_SIZE) with a TTL (DM_CACHE_TTL_SECONDS);
+    persisted in the dm_channels table across restarts
+  - A send that fails with a 4xx (other than 429) drops the channel from
+    the cache, and outbox jobs forget their checkpointed channel so the
+    retry resolves it again
+  - New metric: lfg_dm_cache_lookups_total (result)
+
+v2.15.0 (2026-10-16)
+  - Convoke room pool: private rooms are created ahead of time for each
+    LFG_FORMATS entry (seat limit and format) and handed out the moment
+    a lobby fills, taking Convoke latency out of time-to-match
+  - Each format's pool is sized from its recent match rate (matches in
+    the last ROOM_POOL_RATE_WINDOW scaled to ROOM_POOL_HORIZON), within
+    ROOM_POOL_MIN..ROOM_POOL_MAX, and refilled by a background thread
+    every ROOM_POOL_REFILL_INTERVAL or as soon as a room is taken
+  - Rooms older than ROOM_POOL_TTL_SECONDS are discarded as stale; the
+    pool is persisted in the convoke_rooms table across restarts
+  - Matches still create a room on demand (and fall back to the lobby
+    link) when the pool is empty; LFG_ROOM_POOL=0 disables the pool
+  - lfg_convoke_rooms_total gains outcome="pool"; new gauge
+    lfg_room_pool_size (format)
+
+v2.14.0 (2026-10-16)
+  - Notification outbox: match and expiry notifications, overflow DMs
+    and topic deletions are queued in a persistent outbox (SQLite table
+    outbox) and delivered by a pool of worker threads (OUTBOX_WORKERS),
+    so the polling cycle never waits on Convoke or chat calls
+  - Jobs are written in the same transaction that untracks the finished
+    topic, so a crash can lose neither the notification nor the topic
+  - Failed jobs retry with exponential backoff up to OUTBOX_MAX_ATTEMPTS;
+    pending jobs survive restarts
+  - Each job has a dedupe key (e.g. match:<topic_id>) so it is queued at
+    most once, and multi-step jobs checkpoint their progress: a retried
+    match reuses the Convoke room and group DM it already created
+  - New metrics: lfg_outbox_jobs_total (kind, outcome), lfg_outbox_pending
+
+v2.13.0 (2026-10-16)
+  - Multi-lobby matchmaking: each format can have several open lobbies
+    (LFG topics) at once instead of exactly one
+  - LobbyIndex keeps lobbies per format in creation order and each
+    player's lobby per format, replacing the linear scan in
+    get_active_topic_for_format()
+  - A requester is seated straight into the oldest lobby with a free seat
+    rather than being sent to vote on it; a new lobby is opened only
+    when every lobby for the format is full. A lobby counts seated
+    players plus poll voters towards its threshold
+  - Overflow voters on a filled lobby are seated in the next lobby (or a
+    new one opened in their name) instead of being turned away; the
+    courtesy DM is only sent if no lobby can be opened
+  - A match now needs seat_count distinct players; a failed voter lookup
+    no longer announces a game to the requester alone
+  - New metric: lfg_players_seated_total (format, source)
+
+v2.12.0 (2026-10-16)
+  - Batched poll-state fetching: every topic due in a pass is fetched
+    together via get_poll_states(), concurrently on a small pool
+    (POLL_FETCH_CONCURRENCY), so a pass costs one round trip of latency
+    instead of one per topic
+  - Poll state is read from the tracked first post (/posts/{id}.json)
+    instead of the whole /t/{id}.json post stream; the first post id is
+    stored with the topic when it is created or first polled
+  - Conditional requests (If-None-Match / If-Modified-Since): an
+    unchanged poll costs a bodyless 304 and no JSON parsing
+  - A topic or post that returns 404/410 is treated as deleted and
+    untracked instead of erroring every cycle
+
+v2.11.0 (2026-10-16)
+  - Offline benchmark suite (lfg_bench.py): in-process fake Discourse
+    and Convoke server with latency and error injection, and scenarios
+    for 10/100/1000 concurrent users reporting cycle latency, requests
+    per match and request-to-match times
+  - Log file path configurable via LFG_LOG_FILE so the bot module can
+    be imported by the benchmark outside the server
+
+v2.10.0 (2026-10-16)
+  - Built-in Prometheus metrics served on METRICS_BIND_ADDRESS:
+    METRICS_PORT/metrics (LFG_METRICS_PORT, 0 disables)
+  - Per-endpoint request counts, latency histograms and retries for
+    Discourse and Convoke, labelled by service/method/route/status
+  - Cycle duration histograms per phase (check_dm_channels,
+    check_active_lfg_topics, process_pending_events)
+  - Active topics per format, time-to-match histogram, matches and
+    expiries per format, Convoke room creations vs lobby fallbacks
+  - Rate-limit budget (tokens, grants, rejections) exported as gauges
+
+v2.9.0 (2026-10-16)
+  - Client-side token-bucket rate limiter in front of every Discourse
+    call: a global bucket (RATE_LIMIT_PER_MINUTE, default 60 to match
+    Discourse's admin API key limit) plus per-route buckets
+    (RATE_LIMIT_ROUTES)
+  - Requests carry a priority: replies and match notifications are
+    high, polling is normal, restore and expiry cleanup are low.
+    Lower priorities must leave a reserve of tokens untouched, so
+    background work yields to players
+  - A 429 with Retry-After pauses the whole bucket instead of letting
+    other calls keep hitting the limit
+  - Budget usage (tokens left, grants, waits, rejections, 429s) is
+    logged with the HTTP stats; rate_limit_headroom() exposes it to code
+
+v2.8.0 (2026-10-16)
+  - Adaptive poll scheduler replaces the fixed POLL_INTERVAL_SECONDS
+    sleep: every topic and the DM channel list has its own next-check
+    deadline, kept in a min-heap
+      * topics one vote from filling, or whose vote count just
+        changed, are checked every SCHED_HOT_INTERVAL
+      * fresh topics are checked every SCHED_BASE_INTERVAL
+      * idle topics and an idle channel list back off exponentially
+  - Topic expiry runs from a hashed timer wheel keyed on the new
+    expires_at field instead of comparing now - created_at on every pass
+  - The loop sleeps until the next deadline, so a long cycle no longer
+    adds a full interval on top
+  - check_lfg_topic now untracks finished topics itself and skips a
+    topic that is already being checked by another pass
+
+v2.7.0 (2026-10-16)
+  - Push-based ingestion (LFG_PUSH_SOURCES=webhook,messagebus):
+      * webhook: local HTTP receiver for Discourse chat_message
+        webhooks, verified with LFG_WEBHOOK_SECRET
+      * messagebus: long-poll subscriber on /chat/new-messages and
+        /polls/{topic_id} for every active topic
+  - Events only flag the channel or topic that changed; the main loop
+    wakes immediately and runs the same process_channel /
+    check_lfg_topic logic on just those objects
+  - With push enabled, the full polling pass becomes a reconciliation
+    fallback every RECONCILE_INTERVAL_SECONDS instead of every 5 s
+
+v2.6.0 (2026-10-16)
+  - Durable state store: processed_message_ids cursors and
+    active_lfg_topics are written incrementally to a local SQLite
+    database in WAL mode (LFG_STATE_DB, default
+    /var/lib/lfg_bot/state.db)
+  - Startup restores cursors, channel ids and the original created_at
+    of every open topic from the store with no API calls, so restarts
+    no longer reset expiry windows or re-process messages
+  - restore_active_topics() category crawl is now only a fallback for
+    an empty store (first run or lost database)
+  - All state mutations go through set_cursor / track_topic /
+    untrack_topic so memory and disk cannot drift apart
+
+v2.5.0 (2026-10-16)
+  - Optional asyncio execution engine (LFG_ASYNC_MODE=1): DM ingestion
+    and topic monitoring run as independent coroutines
+  - Per-channel message fetches and per-topic poll checks (including
+    match notifications) fan out concurrently, bounded by
+    ASYNC_CONCURRENCY, so cycle latency tracks the slowest request
+    rather than the sum of all of them
+  - check_dm_channels / check_active_lfg_topics split into
+    prepare_channel + process_channel and check_lfg_topic so both
+    engines share the same per-object logic
+  - A failure in one channel no longer aborts the rest of the cycle
+  - New-topic creation is serialised per format so concurrent
+    requests cannot open duplicate topics
+
+v2.4.0 (2026-10-16)
+  - Shared HTTP client layer: one pooled keep-alive requests.Session
+    per host (Discourse and Convoke) instead of a fresh TCP+TLS
+    handshake per call
+  - Every request now has connect/read timeouts (HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT) so a hung request can no longer stall main()
+  - Bounded retry with jittered exponential backoff on 429 and 5xx;
+    non-idempotent POSTs are only retried when the server cannot have
+    processed them (429, connect failure)
+  - Per-route latency stats logged every HTTP_STATS_LOG_INTERVAL seconds
+
 v2.3.0 (2026-02-25)
   - Convoke API room creation fully implemented and confirmed working
   - create_convoke_room() added: calls POST /api/game/create-game with
@@ -93,9 +425,42 @@ TRIGGERS (send via DM to @PDHMatchmaker)
 """
 
 import os
+import re
+import abc
+import functools
+import sys
+import gzip
+import atexit
+import signal
+import socket
+import hmac
+import json
+import struct
+import uuid
+import codecs
+import bisect
+import contextvars
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import hashlib
+import sqlite3
+import asyncio
+import math
+import random
 import requests
+import threading
 import time
+from datetime import datetime, timezone
+import queue
 import logging
+import logging.handlers
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 
 # ============================================================
 # Configuration
@@ -112,6 +477,177 @@ CONVOKE_LOBBY_URL = "https://convoke.games/en/lobby"
 POLL_INTERVAL_SECONDS = 5
 LFG_EXPIRY_SECONDS = 3600  # 1 hour
 
+# Adaptive poll scheduling. Each topic and the DM channel list has its
+# own deadline: hot topics (one vote from filling, or just voted on) are
+# checked every SCHED_HOT_INTERVAL, fresh topics every
+# SCHED_BASE_INTERVAL, and idle objects back off by SCHED_BACKOFF_FACTOR
+# up to their max interval. The DM channel list only backs off (to
+# SCHED_CHANNELS_PUSH_MAX_INTERVAL) while push ingestion is running;
+# otherwise it is polled every SCHED_CHANNELS_MAX_INTERVAL, so an idle bot
+# still answers a DM within POLL_INTERVAL_SECONDS.
+SCHED_HOT_INTERVAL = 2
+SCHED_BASE_INTERVAL = POLL_INTERVAL_SECONDS
+SCHED_BACKOFF_FACTOR = 2
+SCHED_TOPIC_MAX_INTERVAL = 60
+SCHED_CHANNELS_MAX_INTERVAL = POLL_INTERVAL_SECONDS
+SCHED_CHANNELS_PUSH_MAX_INTERVAL = 15
+SCHED_FRESH_TOPIC_SECONDS = 300  # topics younger than this never back off
+EXPIRY_WHEEL_TICK = 1.0
+EXPIRY_WHEEL_SLOTS = 512
+
+# HTTP client settings shared by every Discourse and Convoke call.
+# Timeouts are (connect, read) in seconds. Retries apply to 429 and 5xx
+# responses with jittered exponential backoff capped at HTTP_BACKOFF_MAX.
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+CONVOKE_READ_TIMEOUT = 10
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 8
+HTTP_RETRY_AFTER_MAX = 30
+HTTP_POOL_SIZE = 10  # keep >= ASYNC_CONCURRENCY
+HTTP_STATS_LOG_INTERVAL = 300  # 5 minutes
+
+# Client-side Discourse rate limiting (token buckets). Every call takes a
+# token from the global bucket and from its route bucket if it has one.
+# Normal- and low-priority calls must leave a fraction of the global
+# bucket untouched so player-facing messages always have budget.
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("LFG_RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = 20
+RATE_LIMIT_ROUTES = {
+    # "METHOD route": (requests per minute, burst)
+    "POST /posts.json": (10, 3),
+    "POST /chat/api/direct-message-channels": (30, 10),
+    "DELETE /t/{id}.json": (20, 5),
+}
+RATE_LIMIT_NORMAL_RESERVE = 0.2
+RATE_LIMIT_LOW_RESERVE = 0.5
+RATE_LIMIT_HIGH_MAX_WAIT = 30   # seconds a call may queue before giving up
+RATE_LIMIT_NORMAL_MAX_WAIT = 10
+RATE_LIMIT_LOW_MAX_WAIT = 5
+
+# Circuit breakers, one per service. BREAKER_FAILURE_THRESHOLD
+# consecutive failed requests open a breaker; after BREAKER_RESET_SECONDS
+# (doubling up to BREAKER_RESET_MAX while probes fail) a health probe
+# decides whether to let requests through again.
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 15
+BREAKER_RESET_MAX = 120
+
+# Prometheus metrics endpoint (http://METRICS_BIND_ADDRESS:METRICS_PORT/metrics).
+# Set LFG_METRICS_PORT=0 to disable.
+METRICS_BIND_ADDRESS = "127.0.0.1"
+METRICS_PORT = int(os.environ.get("LFG_METRICS_PORT", "9464"))
+
+# Profiling: cycles slower than SLOW_CYCLE_SECONDS are written to
+# PROFILE_DIR as folded stacks; SIGUSR1 samples every thread's stack for
+# PROFILE_SAMPLE_SECONDS.
+PROFILE_DIR = os.environ.get("LFG_PROFILE_DIR", "/var/lib/lfg_bot/profiles")
+SLOW_CYCLE_SECONDS = 10
+PROFILE_SAMPLE_SECONDS = 30
+PROFILE_SAMPLE_INTERVAL = 0.01
+PROFILE_MAX_FILES = 50
+
+# Poll-state fetches for all topics due in a pass run concurrently on a
+# small thread pool.
+POLL_FETCH_CONCURRENCY = 8
+
+# Notification outbox: delivery worker threads, retry backoff, and how
+# long delivered/failed jobs are kept for dedupe and inspection.
+OUTBOX_WORKERS = 4
+OUTBOX_MAX_ATTEMPTS = 20
+OUTBOX_RETRY_BASE = 2
+OUTBOX_RETRY_MAX = 300
+OUTBOX_RETENTION_SECONDS = 86400  # 1 day
+
+# Convoke room pool: pre-created rooms per format, sized to cover
+# ROOM_POOL_HORIZON seconds of matches at the recent match rate.
+ROOM_POOL_ENABLED = os.environ.get("LFG_ROOM_POOL", "1") == "1"
+ROOM_POOL_MIN = 1
+ROOM_POOL_MAX = 5
+ROOM_POOL_HORIZON = 600
+ROOM_POOL_RATE_WINDOW = 3600
+ROOM_POOL_REFILL_INTERVAL = 30
+ROOM_POOL_TTL_SECONDS = 6 * 3600  # unused rooms older than this are treated as stale
+
+# DM channel cache: username set -> channel id, least recently used
+# entries evicted beyond DM_CACHE_SIZE.
+DM_CACHE_SIZE = 5000
+DM_CACHE_TTL_SECONDS = 7 * 86400
+
+# Per-user limits on DMs to the bot. Messages beyond
+# USER_MESSAGES_PER_MINUTE are ignored; a trigger repeated within
+# TRIGGER_COOLDOWN_SECONDS gets one low-priority "already queued" reply
+# instead of a second request. The help text goes out at most
+# once per HELP_REPLY_COOLDOWN_SECONDS per player, and is skipped while
+# less than SHED_HEADROOM of the rate-limit budget is left.
+USER_MESSAGES_PER_MINUTE = 10
+TRIGGER_COOLDOWN_SECONDS = 30
+HELP_REPLY_COOLDOWN_SECONDS = 600
+USER_MAX_LOBBIES = 2
+SHED_HEADROOM = 0.3
+USER_INDEX_SIZE = 20000
+
+# Reconciliation sweeper: how often category listings are diffed against
+# tracked topics, how many orphans one sweep may delete, and how old an
+# untracked topic must be before it counts as orphaned.
+SWEEP_ENABLED = os.environ.get("LFG_SWEEPER", "1") == "1"
+SWEEP_INTERVAL = 600
+SWEEP_BACKLOG_INTERVAL = 60
+SWEEP_BATCH_SIZE = 20
+SWEEP_GRACE_SECONDS = 300
+CATEGORY_MAX_PAGES = 50
+# An LFG trigger that arrives while its format is still being restored
+# at startup is set aside until the format is restored, or for at most
+# this long; after that the format's triggers are handled straight away.
+RESTORE_WAIT_SECONDS = 15
+
+# Incremental message fetching: page size for forward paging, and the
+# most message payload one ingestion pass may download.
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_FETCH_BYTE_BUDGET = 2 * 1024 * 1024
+
+# DM channel ingestion: the channel list is parsed in CHANNEL_LIST_CHUNK_SIZE
+# pieces, and a channel whose cursor has not moved for
+# DM_CHANNEL_DORMANT_SECONDS is forgotten (its baseline falls back to the
+# server-side read marker if it wakes up).
+CHANNEL_LIST_CHUNK_SIZE = 64 * 1024
+DM_CHANNEL_DORMANT_SECONDS = 7 * 86400
+DM_CHANNEL_EVICT_INTERVAL = 3600
+
+# Async engine: runs DM ingestion and topic monitoring as independent
+# coroutines with per-channel / per-topic work fanned out concurrently.
+# ASYNC_CONCURRENCY bounds the number of in-flight API calls.
+ASYNC_MODE = os.environ.get("LFG_ASYNC_MODE", "0") == "1"
+ASYNC_CONCURRENCY = 8
+
+# Push ingestion: comma-separated event sources ("webhook", "messagebus").
+# Events wake the loop to process only the channel or topic that changed;
+# the full polling pass then only runs every RECONCILE_INTERVAL_SECONDS.
+# Both sources push chat messages, but only MessageBus pushes poll votes,
+# so topic polls only back off while the MessageBus subscriber is live.
+# The webhook receiver does not start without LFG_WEBHOOK_SECRET.
+PUSH_SOURCES = {s.strip() for s in os.environ.get("LFG_PUSH_SOURCES", "").split(",") if s.strip()}
+RECONCILE_INTERVAL_SECONDS = 60  # scheduler floor for what push events cover
+WEBHOOK_BIND_ADDRESS = "127.0.0.1"
+WEBHOOK_PORT = 8787
+WEBHOOK_SECRET = os.environ.get("LFG_WEBHOOK_SECRET", "")
+MESSAGEBUS_CHAT_CHANNEL = "/chat/new-messages"
+MESSAGEBUS_READ_TIMEOUT = 60  # must exceed Discourse's 25 s long-poll hold
+
+# Coordination between several bot processes (LFG_COORDINATION=1).
+# Leases expire LEASE_TTL_SECONDS after their last renewal; workers renew
+# every LEASE_RENEW_INTERVAL. DM channels are split into SHARD_COUNT
+# shards by channel id, so SHARD_COUNT caps the useful number of workers.
+COORDINATION_ENABLED = os.environ.get("LFG_COORDINATION", "0") == "1"
+WORKER_ID = os.environ.get("LFG_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_BACKEND = os.environ.get("LFG_LEASE_BACKEND", "sqlite")
+SHARD_COUNT = int(os.environ.get("LFG_SHARD_COUNT", "16"))
+LEASE_TTL_SECONDS = 30
+LEASE_RENEW_INTERVAL = 5
+FORWARDED_REQUEST_POLL_INTERVAL = 1  # how often the leader picks up forwarded triggers
+FORWARDED_REQUEST_MAX_ATTEMPTS = 5  # failed forwarded triggers are retried on later polls
+
 # LFG category config:
 # trigger -> (category_id, seat_count, poll_threshold, convoke_format, label)
 #
@@ -126,520 +662,4509 @@ LFG_FORMATS = {
 
 LFG_TAG = "lfg"
 
-# ============================================================
-# Logging
-# ============================================================
+LOG_FILE = os.environ.get("LFG_LOG_FILE", "/var/log/lfg_bot.log")
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000  # records waiting for the writer; beyond this they are dropped
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LFG_LOG_DEBUG_SAMPLE", "0.01"))
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("/var/log/lfg_bot.log"),
-        logging.StreamHandler()
-    ]
-)
-log = logging.getLogger(__name__)
+# Traffic recording for offline replay (lfg_replay.py). When set, every
+# HTTP exchange is appended to this gzip-compressed JSON-lines file.
+RECORD_FILE = os.environ.get("LFG_RECORD_FILE", "")
+
+# Match history for capacity planning (lfg_history.py): lobby events are
+# buffered and appended to one segment file per UTC day in HISTORY_DIR at
+# least every HISTORY_FLUSH_INTERVAL seconds. Set LFG_HISTORY_DIR= (empty)
+# to disable.
+HISTORY_DIR = os.environ.get("LFG_HISTORY_DIR", "/var/lib/lfg_bot/history")
+HISTORY_RETENTION_DAYS = 180
+HISTORY_FLUSH_INTERVAL = 60
+HISTORY_FLUSH_RECORDS = 512
+
+# Durable bot state (SQLite, WAL mode). Cursors and active topics are
+# written incrementally so a restart resumes exactly where it left off.
+STATE_DB_PATH = os.environ.get("LFG_STATE_DB", "/var/lib/lfg_bot/state.db")
 
 # ============================================================
-# Discourse API Helpers
+# Logging
 # ============================================================
+#
+# Callers only enqueue records. A QueueListener thread formats them and
+# writes the rotating JSON log file and stderr, so neither formatting nor
+# disk I/O happens on the polling cycle. Structured fields are passed as
+# extra=, e.g. log.info("...", topic_id, extra={"topic_id": topic_id}).
 
-HEADERS = {
-    "Api-Key": DISCOURSE_API_KEY,
-    "Api-Username": DISCOURSE_BOT_USERNAME,
-    "Content-Type": "application/json"
-}
+LOG_FIELDS = ("topic_id", "channel_id", "format_key", "latency_ms")
 
-def discourse_get(path, params=None):
-    r = requests.get(f"{DISCOURSE_URL}{path}", headers=HEADERS, params=params)
-    r.raise_for_status()
-    return r.json()
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any LOG_FIELDS the call supplied."""
 
-def discourse_post(path, data):
-    r = requests.post(f"{DISCOURSE_URL}{path}", headers=HEADERS, json=data)
-    r.raise_for_status()
-    return r.json()
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
 
-def discourse_delete(path):
-    r = requests.delete(f"{DISCOURSE_URL}{path}", headers=HEADERS)
-    r.raise_for_status()
-    return r
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
 
-# ============================================================
-# Chat API Helpers
-# ============================================================
+    def prepare(self, record):
+        # Message formatting is left to the listener thread. Tracebacks
+        # are rendered now because they reference live frames.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-def get_dm_channel_data():
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(level=record.levelname)
+
+def configure_logging():
     """
-    Fetch all DM channels and tracking data for the bot account.
-    Returns (channels list, channel_tracking dict).
-    channel_tracking is keyed by string channel ID and contains unread_count.
-    This is a single API call that provides everything needed to decide
-    whether any given channel requires further attention.
+    Route every log record through a bounded queue to the file and stderr
+    writers. Called by main(), so importing the module (lfg_bench,
+    lfg_replay) installs no handlers and starts no listener thread.
     """
-    data = discourse_get("/chat/api/me/channels")
-    channels = data.get("direct_message_channels", [])
-    channel_tracking = data.get("tracking", {}).get("channel_tracking", {})
-    return channels, channel_tracking
+    file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonFormatter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
 
-def get_channel_messages(channel_id):
-    """Fetch messages from a chat DM channel."""
-    data = discourse_get(f"/chat/api/channels/{channel_id}/messages")
-    return data.get("messages", [])
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(DroppingQueueHandler(records))
+    listener = logging.handlers.QueueListener(records, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # drain what is queued before exiting
 
-def send_chat_message(channel_id, message):
-    """Send a message to a chat channel."""
-    data = {"message": message}
-    return discourse_post(f"/chat/{channel_id}", data)
+log = logging.getLogger(__name__)
 
-def get_or_create_dm_channel(username):
-    """Get or create a 1:1 DM channel with a specific user."""
-    data = {"target_usernames": [username]}
-    result = discourse_post("/chat/api/direct-message-channels", data)
-    return result.get("channel", {}).get("id")
+# Per-message records are debug output, logged for a random sample of messages.
+message_log = logging.getLogger(f"{__name__}.messages")
+message_log.setLevel(logging.DEBUG if LOG_DEBUG_SAMPLE_RATE > 0 else logging.INFO)
 
-def create_group_dm(usernames):
-    """
-    Create a group DM channel containing all provided usernames.
-    The bot account is included automatically as the API actor.
-    Returns the channel ID or None on failure.
-    usernames should be a list of Discourse username strings.
-    """
-    try:
-        data = {"target_usernames": usernames}
-        result = discourse_post("/chat/api/direct-message-channels", data)
-        channel_id = result.get("channel", {}).get("id")
-        if channel_id:
-            log.info(f"Created group DM channel {channel_id} for: {usernames}")
-        else:
-            log.error(f"Group DM creation returned no channel ID for: {usernames}")
-        return channel_id
-    except Exception as e:
-        log.error(f"Failed to create group DM for {usernames}: {e}")
-        return None
+def log_sampled(msg, *args, **kwargs):
+    """Log a debug record for roughly LOG_DEBUG_SAMPLE_RATE of calls."""
+    if LOG_DEBUG_SAMPLE_RATE > 0 and random.random() < LOG_DEBUG_SAMPLE_RATE:
+        message_log.debug(msg, *args, **kwargs)
 
 # ============================================================
-# Convoke API Helper
+# Metrics
 # ============================================================
+#
+# A minimal Prometheus client: counters, gauges and histograms with
+# labels, rendered in the text exposition format. Gauges can be backed
+# by a callback so values like active topics per format are computed at
+# scrape time instead of being maintained on every change.
 
-def create_convoke_room(label, seat_count, convoke_format):
-    """
-    Call the Convoke API to create a game room.
-    Returns the join URL on success, None on failure.
-    """
-    try:
-        payload = {
-            "apiKey": CONVOKE_API_KEY,
-            "name": f"PDH Forum — {label}",
-            "isPublic": False,
-            "seatLimit": seat_count,
-            "format": convoke_format
-        }
-        resp = requests.post(CONVOKE_API_URL, json=payload, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        url = data.get("url")
-        if url:
-            log.info(f"Convoke room created: {url}")
-            return url
-        else:
-            log.error(f"Convoke response missing url field: {data}")
-            return None
-    except Exception as e:
-        log.error(f"Convoke API error: {e}")
-        return None
-
-# ============================================================
-# Topic Helpers
-# ============================================================
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MATCH_TIME_BUCKETS = (30, 60, 120, 300, 600, 900, 1800, 3600)
 
-def create_lfg_topic(requester_username, format_key):
-    """Create a Looking for Game topic for the given format."""
-    category_id, seat_count, poll_threshold, _, label = LFG_FORMATS[format_key]
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
 
-    title = f"Looking for a {label} Game — {requester_username}"
+class Metric:
+    kind = "untyped"
 
-    if poll_threshold == 1:
-        poll_line = "Vote below — 1 spot available!"
-        seat_text = "Once a second player joins the poll, both players will receive a Convoke link via DM."
-    else:
-        poll_line = f"Vote below — {poll_threshold} spots available!"
-        seat_text = f"Once all {poll_threshold} spots are filled, everyone will receive a Convoke link via DM."
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
 
-    body = f"""@{requester_username} is looking for a {label} game on Convoke! {poll_line}
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
 
-> ⏱ This post expires in 1 hour. {seat_text} If the poll doesn't fill in time, it will be removed automatically and all participants will be notified via DM. No Discord required.
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
 
-**Format:** {label}
-**Platform:** Convoke (webcam)
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
 
-[poll type=regular results=always public=true chartType=bar]
-* Join me
-[/poll]"""
+class Counter(Metric):
+    kind = "counter"
 
-    data = {
-        "title": title,
-        "raw": body,
-        "category": category_id,
-        "tags": [LFG_TAG]
-    }
-    return discourse_post("/posts.json", data)
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
 
-def get_lfg_topics(category_id):
-    """Fetch all open topics in an LFG category."""
-    data = discourse_get(f"/c/{category_id}.json")
-    return data.get("topic_list", {}).get("topics", [])
+class Gauge(Metric):
+    kind = "gauge"
 
-def get_poll_data(topic_id):
-    """Fetch poll voter count and status from a topic."""
-    data = discourse_get(f"/t/{topic_id}.json")
-    posts = data.get("post_stream", {}).get("posts", [])
-    if not posts:
-        return None, None, None, data
-    first_post = posts[0]
-    post_id = first_post.get("id")
-    polls = first_post.get("polls", [])
-    if not polls:
-        return None, None, None, data
-    poll = polls[0]
-    voters = poll.get("voters", 0)
-    is_closed = poll.get("status") == "closed"
-    return voters, is_closed, post_id, data
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
 
-def get_poll_voters(topic_id, post_id):
-    """
-    Get usernames of all poll voters.
-    option_id is intentionally omitted — Discourse uses hashed option IDs,
-    not sequential integers. Omitting it returns all voters across all options.
-    voters is guarded with `or {}` since Discourse may return null for empty polls.
-    """
-    try:
-        data = discourse_get(
-            "/polls/voters.json",
-            params={
-                "topic_id": topic_id,
-                "post_id": post_id,
-                "poll_name": "poll",
-            }
-        )
-        voters = data.get("voters") or {}
-        all_voters = []
-        for option_voters in voters.values():
-            all_voters.extend([v.get("username") for v in option_voters if v.get("username")])
-        return all_voters
-    except Exception as e:
-        log.error(f"Failed to get poll voters for topic {topic_id}: {e}")
-        return []
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
 
-def delete_topic(topic_id):
-    """Delete a topic."""
-    return discourse_delete(f"/t/{topic_id}.json")
+    def _samples(self):
+        if self.callback:
+            try:
+                values = self.callback()
+            except Exception as e:
+                log.error("Metric callback for %s failed: %s", self.name, e)
+                values = {}
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values.items()]
+        return super()._samples()
 
-# ============================================================
-# Bot State
-# ============================================================
+class Histogram(Metric):
+    kind = "histogram"
 
-# channel_id -> last processed message id
-# Only populated for channels that have had unread activity.
-# Channels with no unread messages are never fetched.
-processed_message_ids = {}
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
 
-# topic_id -> {requester, format_key, channel_id, created_at}
-active_lfg_topics = {}
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
 
-# ============================================================
-# Core Logic
-# ============================================================
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
 
-def get_active_topic_for_format(format_key):
-    """Return the topic_id of an existing active topic for this format, or None."""
-    for topic_id, info in active_lfg_topics.items():
-        if info["format_key"] == format_key:
-            return topic_id
-    return None
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state["counts"]):
+                    labels = _format_labels(self.labelnames + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {state['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
 
-def notify_match(all_players, label, seat_count, convoke_format):
-    """
-    Send a match notification to all players via a single group DM.
-    Attempts Convoke room creation — falls back to lobby link on failure.
-    """
-    room_url = create_convoke_room(label, seat_count, convoke_format)
-    if room_url:
-        msg = (
-            f"✅ **Game found!** Your {label} game is ready.\n\n"
-            f"Join your Convoke room here:\n"
-            f"**{room_url}**\n\n"
-            f"Good luck and have fun! No Discord required."
-        )
-    else:
-        msg = (
-            f"✅ **Game found!** Your {label} game is ready.\n\n"
-            f"Convoke room creation failed — elect one person to set up manually:\n"
-            f"**{CONVOKE_LOBBY_URL}**\n\n"
-            f"Good luck and have fun! No Discord required."
-        )
+metrics_registry = []
 
-    group_channel = create_group_dm(all_players)
-    if group_channel:
-        send_chat_message(group_channel, msg)
-        log.info(f"Match notification sent to group DM {group_channel}: {all_players}")
-    else:
-        log.error(f"Failed to create group DM for match — players were: {all_players}")
+def register_metric(metric):
+    metrics_registry.append(metric)
+    return metric
 
-def notify_expiry(all_players, label, voters, poll_threshold):
-    """
-    Send an expiry notification to all involved players.
-    Uses a group DM if multiple players are present,
-    individual DM if only the requester remains.
-    """
-    msg = (
-        f"Unfortunately your {label} LFG post expired before it could fill "
-        f"({voters}/{poll_threshold} additional players joined). "
-        f"Feel free to try again anytime!"
-    )
+def render_metrics():
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
 
-    if len(all_players) > 1:
-        group_channel = create_group_dm(all_players)
-        if group_channel:
-            send_chat_message(group_channel, msg)
-            log.info(f"Expiry notification sent to group DM for: {all_players}")
-        else:
-            log.error(f"Failed to create group DM for expiry — players were: {all_players}")
-    else:
-        try:
-            dm_channel = get_or_create_dm_channel(all_players[0])
-            if dm_channel:
-                send_chat_message(dm_channel, msg)
-                log.info(f"Expiry notification sent to {all_players[0]}")
-        except Exception as e:
-            log.error(f"Failed to notify {all_players[0]} of expiry: {e}")
+HTTP_REQUESTS = register_metric(Counter(
+    "lfg_http_requests_total", "HTTP requests by service, endpoint and status.",
+    ("service", "method", "route", "status")))
+HTTP_LATENCY = register_metric(Histogram(
+    "lfg_http_request_duration_seconds", "HTTP request latency by service and endpoint.",
+    ("service", "method", "route")))
+HTTP_RETRIES = register_metric(Counter(
+    "lfg_http_retries_total", "HTTP request attempts that were retried.",
+    ("service", "method", "route")))
+CYCLE_DURATION = register_metric(Histogram(
+    "lfg_cycle_phase_duration_seconds", "Time spent in each phase of the polling cycle.",
+    ("phase",)))
+TIME_TO_MATCH = register_metric(Histogram(
+    "lfg_time_to_match_seconds", "Time from LFG topic creation to a filled match.",
+    ("format",), buckets=MATCH_TIME_BUCKETS))
+MATCHES = register_metric(Counter(
+    "lfg_matches_total", "Filled LFG topics.", ("format",)))
+EXPIRIES = register_metric(Counter(
+    "lfg_expiries_total", "LFG topics that expired before filling.", ("format",)))
+CONVOKE_ROOMS = register_metric(Counter(
+    "lfg_convoke_rooms_total", "Match notifications by Convoke outcome (pool, room or lobby_fallback).",
+    ("outcome",)))
+SEATED = register_metric(Counter(
+    "lfg_players_seated_total", "Players seated into an existing lobby (source: request or overflow).",
+    ("format", "source")))
 
-def handle_lfg_request(channel_id, requester_username, format_key):
-    """Create an LFG topic and confirm via chat DM, or point to existing topic."""
-    _, _, _, _, label = LFG_FORMATS[format_key]
-    log.info(f"LFG request from {requester_username} for {label} (channel {channel_id})")
-
-    existing_topic_id = get_active_topic_for_format(format_key)
-    if existing_topic_id:
-        topic_url = f"{DISCOURSE_URL}/t/{existing_topic_id}"
-        log.info(f"Active {label} topic already exists ({existing_topic_id}), pointing {requester_username} to it")
-        send_chat_message(
-            channel_id,
-            f"There's already a {label} game looking for players! Head over and join the poll:\n\n"
-            f"➡️ {topic_url}"
-        )
-        return
+LOG_RECORDS_DROPPED = register_metric(Counter(
+    "lfg_log_records_dropped_total", "Log records dropped because the log queue was full.", ("level",)))
+SWEEPER_DRIFT = register_metric(Gauge(
+    "lfg_sweeper_drift_topics",
+    "Topics out of step with the forum at the last sweep (orphaned, missing or overdue).", ("kind",)))
+SWEEPER_REMOVED = register_metric(Counter(
+    "lfg_sweeper_removed_total", "Orphaned LFG topics queued for deletion by the sweeper."))
+USER_MESSAGES_SHED = register_metric(Counter(
+    "lfg_user_messages_shed_total", "Player messages ignored, left unanswered or refused, by reason.", ("reason",)))
+DM_CACHE_LOOKUPS = register_metric(Counter(
+    "lfg_dm_cache_lookups_total", "DM channel cache lookups (hit or miss).", ("result",)))
+SPAN_SECONDS = register_metric(Counter(
+    "lfg_span_seconds_total", "Time spent in each profiled helper during cycles (kind: wall, cpu, network).",
+    ("span", "kind")))
+BREAKER_TRIPS = register_metric(Counter(
+    "lfg_circuit_breaker_trips_total", "Times a service's circuit breaker opened.", ("service",)))
+BREAKER_REJECTED = register_metric(Counter(
+    "lfg_circuit_breaker_rejected_total", "Requests refused because the service's circuit breaker was open.",
+    ("service",)))
+OUTBOX_JOBS = register_metric(Counter(
+    "lfg_outbox_jobs_total", "Outbox job attempts by kind and outcome (delivered, retried, parked, failed).",
+    ("kind", "outcome")))
 
-    try:
-        result = create_lfg_topic(requester_username, format_key)
-        topic_id = result.get("topic_id")
+def _active_topics_by_format():
+    return {(format_key,): len(lobby_index.lobbies(format_key)) for format_key in LFG_FORMATS}
 
-        if not topic_id:
-            log.error(f"Failed to create LFG topic for {requester_username}")
-            send_chat_message(channel_id, "Sorry, I couldn't create your LFG post right now. Please try again in a moment.")
-            return
+def _rate_limit_gauge(field):
+    def collect():
+        values = {}
+        for service, limiter in rate_limiters.items():
+            for bucket, state in limiter.usage()["buckets"].items():
+                values[(service, bucket)] = state[field]
+        return values
+    return collect
 
-        active_lfg_topics[topic_id] = {
-            "requester": requester_username,
-            "format_key": format_key,
-            "channel_id": channel_id,
-            "created_at": time.time()
-        }
+def _rate_limit_counter(field):
+    def collect():
+        values = {}
+        for service, limiter in rate_limiters.items():
+            for priority, count in limiter.usage()[field].items():
+                values[(service, priority)] = count
+        return values
+    return collect
 
-        topic_url = f"{DISCOURSE_URL}/t/{topic_id}"
-        send_chat_message(
-            channel_id,
-            f"Your LFG post is live! ➡️ {topic_url}\n\n"
-            f"I'll DM you as soon as the game fills. "
-            f"If no one joins within 1 hour the post will be removed and I'll let you know."
-        )
-        log.info(f"Created LFG topic {topic_id} for {requester_username} ({label})")
+register_metric(Gauge(
+    "lfg_active_topics", "Active LFG topics per format.", ("format",), callback=_active_topics_by_format))
+register_metric(Gauge(
+    "lfg_room_pool_size", "Pre-created Convoke rooms ready per format.", ("format",),
+    callback=lambda: {(format_key,): room_pool.size(format_key) for format_key in LFG_FORMATS}))
+register_metric(Gauge(
+    "lfg_outbox_pending", "Outbox jobs waiting for delivery.", callback=lambda: {(): outbox.pending()}))
+register_metric(Gauge(
+    "lfg_circuit_breaker_state", "Circuit breaker state per service (0 closed, 1 half-open, 2 open).",
+    ("service",), callback=lambda: {(service,): BREAKER_STATES.index(b.state) for service, b in circuit_breakers.items()}))
+register_metric(Gauge(
+    "lfg_coordination_leader", "1 if this worker holds the leader lease (always 1 without coordination).",
+    callback=lambda: {(): int(coordinator.is_leader())}))
+register_metric(Gauge(
+    "lfg_coordination_shards", "DM channel shards owned by this worker.",
+    callback=lambda: {(): coordinator.shard_count()}))
+register_metric(Gauge(
+    "lfg_rate_limit_tokens", "Tokens currently available per rate-limit bucket.",
+    ("service", "bucket"), callback=_rate_limit_gauge("tokens")))
+register_metric(Gauge(
+    "lfg_rate_limit_granted", "Calls granted by the rate limiter, by priority.",
+    ("service", "priority"), callback=_rate_limit_counter("granted")))
+register_metric(Gauge(
+    "lfg_rate_limit_rejected", "Calls rejected by the rate limiter, by priority.",
+    ("service", "priority"), callback=_rate_limit_counter("rejected")))
 
-    except Exception as e:
-        log.error(f"Error creating LFG topic for {requester_username}: {e}")
-        send_chat_message(channel_id, "Sorry, something went wrong. Please try again.")
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-def check_dm_channels():
-    """
-    Check DM channels for new LFG trigger messages.
+    def log_message(self, format, *args):
+        pass
 
-    Scalability design:
-    - One API call per cycle fetches all channel data including unread counts.
-    - Channels with unread_count == 0 are skipped with no further API calls.
-    - New channels (never seen before) use last_message.id from the channel
-      list response to set their last_seen baseline — no extra fetch needed.
-    - New channels that already have unread_count > 0 on first sight are
-      processed immediately rather than skipped until next cycle.
-    - Result: idle state costs one API call per cycle regardless of user count.
-      Active state costs one additional API call per channel with unread messages.
-    """
+def start_metrics_server():
+    if not METRICS_PORT:
+        return None
     try:
-        channels, channel_tracking = get_dm_channel_data()
-
-        for channel in channels:
-            channel_id = channel.get("id")
-            unread = channel_tracking.get(str(channel_id), {}).get("unread_count", 0)
+        server = ThreadingHTTPServer((METRICS_BIND_ADDRESS, METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        log.error("Could not start metrics server on port %s: %s", METRICS_PORT, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Metrics available at http://%s:%s/metrics", METRICS_BIND_ADDRESS, METRICS_PORT)
+    return server
 
-            if channel_id not in processed_message_ids:
-                last_msg_id = channel.get("last_message", {}).get("id", 0)
+# ============================================================
+# Profiling
+# ============================================================
+#
+# The current span lives in a context variable. profile_cycle() opens a
+# root span for a cycle; every @profiled helper called inside it adds a
+# child span. Outside a cycle (outbox workers, the room pool) @profiled
+# is a single context-variable lookup. Worker threads started with a
+# copied context (get_poll_states, asyncio.to_thread) attach their spans
+# to the same tree.
 
-                if unread == 0:
-                    processed_message_ids[channel_id] = last_msg_id
-                    log.info(f"Initialized channel {channel_id}, last message id: {last_msg_id}")
-                    continue
-                else:
-                    processed_message_ids[channel_id] = last_msg_id - unread
-                    log.info(f"Initialized channel {channel_id} with {unread} unread messages")
+_current_span = contextvars.ContextVar("current_span", default=None)
 
-            elif unread == 0:
-                continue
+class Span:
+    """One timed call: wall and thread CPU time, plus network wait reported by http_request()."""
 
-            messages = get_channel_messages(channel_id)
-            last_seen = processed_message_ids.get(channel_id, 0)
+    __slots__ = ("name", "children", "start", "cpu_start", "wall", "cpu", "network", "_lock")
 
-            for msg in messages:
-                msg_id = msg.get("id", 0)
-                if msg_id <= last_seen:
-                    continue
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.wall = self.cpu = self.network = 0.0
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
 
-                sender = msg.get("user", {}).get("username")
-                if sender == DISCOURSE_BOT_USERNAME:
-                    processed_message_ids[channel_id] = max(last_seen, msg_id)
-                    continue
+    def child(self, name):
+        span = Span(name)
+        with self._lock:
+            self.children.append(span)
+        return span
 
-                text = msg.get("message", "").strip().lower()
-                processed_message_ids[channel_id] = max(last_seen, msg_id)
+    def add_network(self, seconds):
+        with self._lock:
+            self.network += seconds
 
-                log.info(f"New message in channel {channel_id} from {sender}: {text!r}")
+    def finish(self):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.thread_time() - self.cpu_start
 
-                if text in LFG_FORMATS:
-                    handle_lfg_request(channel_id, sender, text)
-                else:
-                    send_chat_message(
-                        channel_id,
-                        "Hi! I can help you find a PDH game on Convoke.\n\n"
-                        "Send me one of these:\n"
-                        "• **casual** — find a Casual PDH game (4 players)\n"
-                        "• **comp** — find a Competitive PDH game (4 players)\n"
-                        "• **1v1** — find a 1v1 PDH match (2 players)"
-                    )
+    def walk(self, path=()):
+        """Yield (path, span) for this span and every descendant."""
+        path = path + (self.name,)
+        yield path, self
+        for child in self.children:
+            yield from child.walk(path)
 
-    except Exception as e:
-        log.error(f"Error checking DM channels: {e}")
+    def folded(self):
+        """
+        Folded-stack lines ("root;child;leaf microseconds"). Each span's
+        own time is split into network wait, as a [network] frame, and
+        everything else.
+        """
+        totals = {}
+        for path, span in self.walk():
+            own = max(0.0, span.wall - sum(c.wall for c in span.children))
+            network = min(own, span.network)
+            stack = ";".join(path)
+            totals[stack] = totals.get(stack, 0) + own - network
+            if network:
+                totals[stack + ";[network]"] = totals.get(stack + ";[network]", 0) + network
+        return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in totals.items() if seconds > 0]
 
-def check_active_lfg_topics():
-    """Check all active LFG topics for fulfilled or expired polls."""
-    stale_topics = []
-    now = time.time()
+@contextmanager
+def span(name):
+    """Time the enclosed block as a child of the current span (no-op outside a profiled cycle)."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = parent.child(name)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+        current.finish()
 
-    for topic_id, info in list(active_lfg_topics.items()):
-        requester = info["requester"]
-        format_key = info["format_key"]
-        created_at = info["created_at"]
-        _, seat_count, poll_threshold, convoke_format, label = LFG_FORMATS[format_key]
+def profiled(func):
+    """Record each call of func as a span named after it."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_span.get() is None:
+            return func(*args, **kwargs)
+        with span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
 
-        try:
-            voters, is_closed, post_id, topic_data = get_poll_data(topic_id)
+def add_network_time(seconds):
+    current = _current_span.get()
+    if current is not None:
+        current.add_network(seconds)
 
-            if voters is None:
-                stale_topics.append(topic_id)
-                continue
+@contextmanager
+def profile_cycle(name):
+    """Profile one cycle: export its span totals and capture it to PROFILE_DIR if it was slow."""
+    root = Span(name)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        _current_span.reset(token)
+        root.finish()
+        for _, current in root.walk():
+            SPAN_SECONDS.inc(current.wall, span=current.name, kind="wall")
+            SPAN_SECONDS.inc(current.cpu, span=current.name, kind="cpu")
+            if current.network:
+                SPAN_SECONDS.inc(current.network, span=current.name, kind="network")
+        if root.wall >= SLOW_CYCLE_SECONDS:
+            breakdown = ", ".join(f"{c.name} {c.wall:.1f}s" for c in sorted(root.children, key=lambda c: -c.wall)[:5])
+            log.warning("Slow %s: %.1fs (%s)", name, root.wall, breakdown, extra={"latency_ms": round(root.wall * 1000)})
+            # written off the cycle thread
+            threading.Thread(target=write_profile, args=(f"slow-{name}", root.folded()), daemon=True).start()
 
-            if voters >= poll_threshold:
-                voter_usernames = get_poll_voters(topic_id, post_id) if post_id else []
-                capped_voters = voter_usernames[:poll_threshold]
-                all_players = list(dict.fromkeys([requester] + capped_voters))
-                overflow = [u for u in voter_usernames[poll_threshold:] if u not in all_players]
-
-                log.info(f"Match found! Topic {topic_id} ({label}): {all_players}")
-                if overflow:
-                    log.info(f"Overflow voters for topic {topic_id}: {overflow}")
-
-                notify_match(all_players, label, seat_count, convoke_format)
-
-                for username in overflow:
-                    try:
-                        dm_channel = get_or_create_dm_channel(username)
-                        if dm_channel:
-                            send_chat_message(
-                                dm_channel,
-                                f"Sorry, the {label} game you voted on just filled up a moment before "
-                                f"we could grab your spot! Feel free to send me **{format_key}** to start "
-                                f"a new search anytime."
-                            )
-                            log.info(f"Overflow courtesy DM sent to {username}")
-                    except Exception as e:
-                        log.error(f"Failed to send overflow DM to {username}: {e}")
+def write_profile(kind, lines):
+    """Write folded stacks to PROFILE_DIR and keep only the newest PROFILE_MAX_FILES profiles."""
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.folded")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        profiles = sorted(
+            (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".folded")),
+            key=os.path.getmtime
+        )
+        for old in profiles[:-PROFILE_MAX_FILES]:
+            os.remove(old)
+        log.info("Profile written to %s", path)
+    except OSError as e:
+        log.error("Could not write profile: %s", e)
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread each PROFILE_SAMPLE_INTERVAL for
+    PROFILE_SAMPLE_SECONDS and writes the counts as folded stacks
+    (thread name as the root frame). trigger() is safe to call from a
+    signal handler; a trigger while sampling is ignored.
+    """
+
+    def __init__(self):
+        self._running = threading.Event()
+
+    def trigger(self):
+        if not self._running.is_set():
+            self._running.set()
+            threading.Thread(target=self._run, name="sampler", daemon=True).start()
+
+    def _run(self):
+        log.info("Sampling profiler running for %ss", PROFILE_SAMPLE_SECONDS)
+        counts = {}
+        me = threading.get_ident()
+        deadline = time.perf_counter() + PROFILE_SAMPLE_SECONDS
+        try:
+            while time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    frames = []
+                    while frame is not None:
+                        code = frame.f_code
+                        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    stack = ";".join([names.get(ident, str(ident))] + frames[::-1])
+                    counts[stack] = counts.get(stack, 0) + 1
+                time.sleep(PROFILE_SAMPLE_INTERVAL)
+            write_profile("sample", [f"{stack} {count}" for stack, count in counts.items()])
+        finally:
+            self._running.clear()
+
+sampling_profiler = SamplingProfiler()
+
+# ============================================================
+# HTTP Client
+# ============================================================
+
+# Statuses worth retrying. 429 means the request was rejected before
+# being processed, so it is safe to retry for every method. 5xx is only
+# retried for idempotent methods — a POST that timed out server-side may
+# already have created a topic or a Convoke room.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
+# service -> requests.Session, created lazily and reused for the
+# lifetime of the process so connections stay pooled between cycles.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# (service, method, route) -> {count, errors, retries, total, max}
+http_stats = {}
+_http_stats_lock = threading.Lock()
+
+def route_key(path):
+    """
+    Collapse numeric path segments so stats group by endpoint rather
+    than by individual topic or channel, e.g. /t/123.json -> /t/{id}.json
+    """
+    return re.sub(r"/\d+", "/{id}", path.split("?", 1)[0])
+
+def get_session(service):
+    """
+    Return the shared keep-alive session for a service.
+    The Discourse session carries the API auth headers by default.
+    """
+    with _sessions_lock:
+        session = _sessions.get(service)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if service == "discourse":
+                session.headers.update(HEADERS)
+            _sessions[service] = session
+        return session
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header (seconds or HTTP date). Returns None if absent."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def record_http_stat(service, method, route, elapsed, status, error=False, retried=False):
+    HTTP_REQUESTS.inc(service=service, method=method, route=route, status=status)
+    HTTP_LATENCY.observe(elapsed, service=service, method=method, route=route)
+    if retried:
+        HTTP_RETRIES.inc(service=service, method=method, route=route)
+
+    key = (service, method, route)
+    with _http_stats_lock:
+        stat = http_stats.get(key)
+        if stat is None:
+            stat = http_stats[key] = {"count": 0, "errors": 0, "retries": 0, "total": 0.0, "max": 0.0}
+        stat["count"] += 1
+        stat["total"] += elapsed
+        stat["max"] = max(stat["max"], elapsed)
+        if error:
+            stat["errors"] += 1
+        if retried:
+            stat["retries"] += 1
+
+def http_request(service, method, url, route, timeout=None, **kwargs):
+    """
+    Send a request through the pooled session for a service, guarded by
+    the service's circuit breaker: raises CircuitOpenError without
+    sending anything while the breaker is open, and reports the outcome
+    to it otherwise. See send_with_retries() for timeouts and retries.
+    """
+    breaker = circuit_breakers.get(service)
+    if breaker is None:
+        return send_with_retries(service, method, url, route, timeout, **kwargs)
+    if not breaker.allow():
+        BREAKER_REJECTED.inc(service=service)
+        raise CircuitOpenError(service, breaker.state)
+    healthy = None
+    try:
+        r = send_with_retries(service, method, url, route, timeout, **kwargs)
+        healthy = r.status_code < 500
+        return r
+    except (requests.ConnectionError, requests.Timeout):
+        healthy = False
+        raise
+    finally:
+        breaker.record(healthy)
+
+def send_with_retries(service, method, url, route, timeout=None, **kwargs):
+    """
+    Send a request through the pooled session for a service.
+
+    - Every call has a (connect, read) timeout.
+    - 429 is retried for any method, honouring Retry-After.
+    - 5xx and dropped connections are retried for idempotent methods only.
+    - A connect timeout is retried for any method (nothing was sent).
+    - Retries are bounded by HTTP_MAX_RETRIES with jittered backoff.
+    - Services with a rate limiter take a token before every attempt.
+    Returns the final response; callers decide whether to raise_for_status().
+    """
+    session = get_session(service)
+    limiter = rate_limiters.get(service)
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    idempotent = method in IDEMPOTENT_METHODS
+
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(f"{method} {route}")
+        start = time.perf_counter()
+        try:
+            r = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            elapsed = time.perf_counter() - start
+            add_network_time(elapsed)
+            if traffic_recorder:
+                traffic_recorder.record(service, method, url, kwargs, error=e.__class__.__name__,
+                                        elapsed=elapsed, attempt=attempt)
+            can_retry = idempotent or isinstance(e, requests.ConnectTimeout)
+            if not can_retry or attempt >= HTTP_MAX_RETRIES:
+                record_http_stat(service, method, route, elapsed, e.__class__.__name__, error=True)
+                raise
+            record_http_stat(service, method, route, elapsed, e.__class__.__name__, error=True, retried=True)
+            delay = backoff_delay(attempt)
+            log.warning(
+                "%s %s %s failed (%s), retrying in %.1fs", service, method, route, e.__class__.__name__, delay,
+                extra={"latency_ms": round(elapsed * 1000)}
+            )
+        else:
+            elapsed = time.perf_counter() - start
+            add_network_time(elapsed)
+            if traffic_recorder:
+                traffic_recorder.record(service, method, url, kwargs, r, elapsed=elapsed, attempt=attempt)
+            status = r.status_code
+            can_retry = status in RETRY_STATUSES and (idempotent or status == 429)
+            if status == 429 and limiter and attempt >= HTTP_MAX_RETRIES:
+                limiter.block_for(retry_after_seconds(r) or HTTP_BACKOFF_MAX)
+            if not can_retry or attempt >= HTTP_MAX_RETRIES:
+                record_http_stat(service, method, route, elapsed, status, error=status >= 400)
+                return r
+            delay = backoff_delay(attempt)
+            retry_after = retry_after_seconds(r) if status == 429 else None
+            if retry_after is not None:
+                if limiter:
+                    limiter.block_for(retry_after)
+                if retry_after > HTTP_RETRY_AFTER_MAX:
+                    record_http_stat(service, method, route, elapsed, status, error=True)
+                    return r
+                delay = max(delay, retry_after)
+            record_http_stat(service, method, route, elapsed, status, error=True, retried=True)
+            log.warning(
+                "%s %s %s returned %s, retrying in %.1fs", service, method, route, status, delay,
+                extra={"latency_ms": round(elapsed * 1000)}
+            )
+
+        attempt += 1
+        with span("backoff"):  # its own frame in profiles, not network wait
+            time.sleep(delay)
+
+class TrafficRecorder:
+    """
+    Appends each HTTP attempt, retries included, to a gzip-compressed
+    JSON-lines log for lfg_replay.py. One line per attempt:
+      t  wall-clock time        s  service       m  method
+      p  URL path               q  query params  b  JSON request body
+      st status or exception    h  caching headers and Retry-After
+      d  latency in ms          a  retry number (omitted on the first attempt)
+      r  JSON response body (omitted when empty or not JSON)
+    API keys in request bodies are replaced before writing.
+    """
+
+    KEPT_HEADERS = ("ETag", "Last-Modified", "Retry-After")
+    FLUSH_EVERY = 50
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        atexit.register(self.close)
+
+    def record(self, service, method, url, kwargs, response=None, error=None, elapsed=0.0, attempt=0):
+        entry = {"t": round(time.time(), 3), "s": service, "m": method, "p": urlsplit(url).path,
+                 "d": round(elapsed * 1000, 1)}
+        if attempt:
+            entry["a"] = attempt
+        if kwargs.get("params"):
+            entry["q"] = kwargs["params"]
+        body = kwargs.get("json")
+        if isinstance(body, dict):
+            entry["b"] = {k: ("<redacted>" if k.lower() == "apikey" else v) for k, v in body.items()}
+        if response is None:
+            entry["st"] = error
+        else:
+            entry["st"] = response.status_code
+            headers = {h: response.headers[h] for h in self.KEPT_HEADERS if h in response.headers}
+            if headers:
+                entry["h"] = headers
+            if response.content:
+                try:
+                    entry["r"] = response.json()
+                except ValueError:
+                    pass
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._unflushed += 1
+            if self._unflushed >= self.FLUSH_EVERY:
+                self._file.flush()
+                self._unflushed = 0
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+traffic_recorder = TrafficRecorder(RECORD_FILE) if RECORD_FILE else None
+
+def get_http_stats():
+    """Return a snapshot of per-route latency stats."""
+    with _http_stats_lock:
+        return {key: dict(stat) for key, stat in http_stats.items()}
+
+def log_http_stats():
+    """Log per-route call counts and latencies, slowest total first."""
+    stats = get_http_stats()
+    if not stats:
+        return
+    log.info("HTTP stats since startup:")
+    for (service, method, route), stat in sorted(stats.items(), key=lambda kv: -kv[1]["total"]):
+        avg_ms = stat["total"] / stat["count"] * 1000
+        log.info(
+            "  %s %s %s: %s calls, avg %.0fms, max %.0fms, %s retries, %s errors",
+            service, method, route, stat["count"], avg_ms, stat["max"] * 1000, stat["retries"], stat["errors"]
+        )
+
+# ============================================================
+# Rate Limiting
+# ============================================================
+#
+# Priority is carried in a context variable, so a whole flow can be
+# marked with `with request_priority(PRIORITY_HIGH):` without threading
+# an argument through every helper. asyncio.to_thread copies the
+# context, so the async engine inherits it too.
+
+PRIORITY_HIGH = 0    # replies to players, match notifications
+PRIORITY_NORMAL = 1  # routine polling
+PRIORITY_LOW = 2     # restore, expiry cleanup, reconciliation
+
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+PRIORITY_RESERVE = {PRIORITY_HIGH: 0.0, PRIORITY_NORMAL: RATE_LIMIT_NORMAL_RESERVE, PRIORITY_LOW: RATE_LIMIT_LOW_RESERVE}
+PRIORITY_MAX_WAIT = {
+    PRIORITY_HIGH: RATE_LIMIT_HIGH_MAX_WAIT,
+    PRIORITY_NORMAL: RATE_LIMIT_NORMAL_MAX_WAIT,
+    PRIORITY_LOW: RATE_LIMIT_LOW_MAX_WAIT,
+}
+
+_request_priority = contextvars.ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+@contextmanager
+def request_priority(priority):
+    """Run the enclosed API calls at the given priority."""
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+class RateLimitedError(Exception):
+    """Raised when a call could not get rate-limit budget within its max wait."""
+
+class TokenBucket:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now, reserve=0.0):
+        """Seconds until a token can be taken while leaving `reserve` of capacity untouched."""
+        self.refill(now)
+        needed = 1.0 + reserve * self.capacity
+        wait = 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+class RateLimiter:
+    """
+    Global token bucket plus optional per-route buckets for one service.
+    acquire() blocks until budget is available or raises RateLimitedError
+    once the caller's priority-specific max wait would be exceeded.
+    """
+
+    def __init__(self, per_minute, burst, routes):
+        self.global_bucket = TokenBucket(per_minute, burst)
+        self.route_buckets = {route: TokenBucket(*limits) for route, limits in routes.items()}
+        self._cond = threading.Condition()
+        self.granted = {p: 0 for p in PRIORITY_NAMES}
+        self.rejected = {p: 0 for p in PRIORITY_NAMES}
+        self.wait_seconds = 0.0
+        self.throttled = 0
+
+    def acquire(self, route):
+        priority = _request_priority.get()
+        route_bucket = self.route_buckets.get(route)
+        start = time.monotonic()
+        deadline = start + PRIORITY_MAX_WAIT[priority]
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self.global_bucket.wait_time(now, PRIORITY_RESERVE[priority])
+                if route_bucket:
+                    wait = max(wait, route_bucket.wait_time(now))
+                if wait <= 0:
+                    self.global_bucket.tokens -= 1
+                    if route_bucket:
+                        route_bucket.tokens -= 1
+                    self.granted[priority] += 1
+                    self.wait_seconds += now - start
+                    return
+                if now + wait > deadline:
+                    self.rejected[priority] += 1
+                    raise RateLimitedError(
+                        f"{route}: no rate-limit budget for {PRIORITY_NAMES[priority]} priority within "
+                        f"{PRIORITY_MAX_WAIT[priority]}s"
+                    )
+                self._cond.wait(wait)
+
+    def block_for(self, seconds):
+        """Pause all calls for `seconds` after the server signalled Retry-After."""
+        with self._cond:
+            self.throttled += 1
+            self.global_bucket.blocked_until = max(self.global_bucket.blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def headroom(self):
+        """Fraction of the global bucket currently available (0.0 - 1.0); 0.0 during a Retry-After pause."""
+        with self._cond:
+            now = time.monotonic()
+            if self.global_bucket.blocked_until > now:
+                return 0.0
+            self.global_bucket.refill(now)
+            return self.global_bucket.tokens / self.global_bucket.capacity
+
+    def usage(self):
+        with self._cond:
+            now = time.monotonic()
+            buckets = {"global": self.global_bucket, **self.route_buckets}
+            for bucket in buckets.values():
+                bucket.refill(now)
+            return {
+                "buckets": {
+                    name: {
+                        "tokens": round(bucket.tokens, 2),
+                        "capacity": bucket.capacity,
+                        "blocked_for": round(max(0.0, bucket.blocked_until - now), 1),
+                    }
+                    for name, bucket in buckets.items()
+                },
+                "granted": {PRIORITY_NAMES[p]: n for p, n in self.granted.items()},
+                "rejected": {PRIORITY_NAMES[p]: n for p, n in self.rejected.items()},
+                "wait_seconds": round(self.wait_seconds, 1),
+                "throttled_429": self.throttled,
+            }
+
+rate_limiters = {
+    "discourse": RateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST, RATE_LIMIT_ROUTES),
+}
+
+def rate_limit_headroom(service="discourse"):
+    """Fraction of the service's global bucket currently available (0.0 - 1.0)."""
+    return rate_limiters[service].headroom()
+
+def log_rate_limit_usage():
+    for service, limiter in rate_limiters.items():
+        usage = limiter.usage()
+        log.info(
+            "Rate limit %s: granted %s, rejected %s, waited %ss, %s Retry-After pauses",
+            service, usage["granted"], usage["rejected"], usage["wait_seconds"], usage["throttled_429"]
+        )
+        for name, bucket in usage["buckets"].items():
+            log.info(
+                "  %s: %s/%.0f tokens, blocked %ss",
+                name, bucket["tokens"], bucket["capacity"], bucket["blocked_for"]
+            )
+
+# ============================================================
+# Circuit Breakers
+# ============================================================
+
+BREAKER_CLOSED = "closed"
+BREAKER_HALF_OPEN = "half-open"
+BREAKER_OPEN = "open"
+BREAKER_STATES = (BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN)
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request while the service's circuit breaker is open."""
+
+    def __init__(self, service, state):
+        super().__init__(f"{service} circuit breaker is {state}")
+        self.service = service
+
+class CircuitBreaker:
+    """
+    Closed: requests flow; BREAKER_FAILURE_THRESHOLD consecutive failures
+    open the breaker. Open: requests are refused while a probe thread
+    checks the service's health URL every reset interval. Half-open (the
+    probe passed): one request at a time goes through as a trial — success
+    closes the breaker, failure reopens it with a doubled interval.
+
+    on_recovery() callbacks get the outage length in seconds when the
+    breaker closes again.
+    """
+
+    def __init__(self, service, probe_url):
+        self.service = service
+        self.probe_url = probe_url  # callable, so a changed base URL is picked up
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._reset = BREAKER_RESET_SECONDS
+        self._probe_at = 0.0
+        self._trial = False
+        self._prober = None
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def on_recovery(self, callback):
+        self._listeners.append(callback)
+
+    def is_closed(self):
+        return self.state == BREAKER_CLOSED
+
+    def allow(self):
+        """Whether a request may be sent now."""
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return True
+            if self.state == BREAKER_OPEN or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record(self, healthy):
+        """Report a request's outcome: True, False, or None when it ended without reaching the service."""
+        outage = None
+        with self._lock:
+            if self.state == BREAKER_HALF_OPEN:
+                self._trial = False
+            if healthy is None:
+                return
+            if healthy:
+                self.failures = 0
+                if self.state != BREAKER_CLOSED:
+                    outage = time.time() - self.opened_at
+                    self.state = BREAKER_CLOSED
+                    self.opened_at = None
+            else:
+                self.failures += 1
+                if self.state == BREAKER_HALF_OPEN or (
+                        self.state == BREAKER_CLOSED and self.failures >= BREAKER_FAILURE_THRESHOLD):
+                    self._open()
+        if outage is not None:
+            log.info("%s circuit breaker closed after %.0fs", self.service, outage)
+            for callback in self._listeners:
+                try:
+                    callback(outage)
+                except Exception as e:
+                    log.error("%s recovery callback failed: %s", self.service, e)
+
+    def _open(self):
+        """Called with the lock held."""
+        if self.state == BREAKER_CLOSED:
+            self.opened_at = time.time()
+            self._reset = BREAKER_RESET_SECONDS
+            BREAKER_TRIPS.inc(service=self.service)
+        else:
+            self._reset = min(BREAKER_RESET_MAX, self._reset * 2)
+        self.state = BREAKER_OPEN
+        self._probe_at = time.monotonic() + self._reset
+        log.warning(
+            "%s circuit breaker open after %s failures, probing in %ss",
+            self.service, self.failures, self._reset
+        )
+        if self._prober is None:
+            self._prober = threading.Thread(target=self._run_probes, name=f"{self.service}-probe", daemon=True)
+            self._prober.start()
+
+    def _run_probes(self):
+        while True:
+            with self._lock:
+                if self.state != BREAKER_OPEN:
+                    self._prober = None
+                    return
+                wait = self._probe_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            healthy = self.probe()
+            with self._lock:
+                if self.state != BREAKER_OPEN:
+                    continue
+                if healthy:
+                    self.state = BREAKER_HALF_OPEN
+                    self._trial = False
+                    log.info("%s health probe passed, circuit breaker half-open", self.service)
+                    continue
+                self._reset = min(BREAKER_RESET_MAX, self._reset * 2)
+                self._probe_at = time.monotonic() + self._reset
+
+    def probe(self):
+        """True if the service's health URL answers without a server error."""
+        try:
+            r = get_session(self.service).get(self.probe_url(), timeout=(HTTP_CONNECT_TIMEOUT, HTTP_CONNECT_TIMEOUT))
+        except requests.RequestException:
+            return False
+        return r.status_code < 500
+
+circuit_breakers = {
+    "discourse": CircuitBreaker("discourse", lambda: f"{DISCOURSE_URL}/srv/status"),
+    "convoke": CircuitBreaker("convoke", lambda: "{0.scheme}://{0.netloc}/".format(urlsplit(CONVOKE_API_URL))),
+}
+
+def topic_checks_paused():
+    """Topic checks wait while Discourse is unreachable, so no poll reads as empty and no clock runs out."""
+    return not circuit_breakers["discourse"].is_closed()
+
+# ============================================================
+# Discourse API Helpers
+# ============================================================
+
+HEADERS = {
+    "Api-Key": DISCOURSE_API_KEY,
+    "Api-Username": DISCOURSE_BOT_USERNAME,
+    "Content-Type": "application/json"
+}
+
+def discourse_request(method, path, **kwargs):
+    """Send a request to the Discourse API through the pooled client."""
+    r = http_request("discourse", method, f"{DISCOURSE_URL}{path}", route_key(path), **kwargs)
+    r.raise_for_status()
+    return r
+
+def discourse_get(path, params=None):
+    return discourse_request("GET", path, params=params).json()
+
+def discourse_post(path, data):
+    return discourse_request("POST", path, json=data).json()
+
+def discourse_put(path, data):
+    return discourse_request("PUT", path, json=data).json()
+
+def discourse_delete(path):
+    return discourse_request("DELETE", path)
+
+# ============================================================
+# Chat API Helpers
+# ============================================================
+
+def dm_members_key(usernames):
+    """Cache key for a DM: the lower-cased usernames, bot excluded, sorted."""
+    bot = DISCOURSE_BOT_USERNAME.lower()
+    return ",".join(sorted({u.lower() for u in usernames if u and u.lower() != bot}))
+
+class DMChannelCache:
+    """
+    Username set -> DM channel id, so repeat notifications reuse a known
+    channel instead of POSTing to /chat/api/direct-message-channels.
+    An OrderedDict in least-recently-used order, bounded by DM_CACHE_SIZE;
+    entries not seen or used for DM_CACHE_TTL_SECONDS are ignored.
+    Only new or changed entries are written to the state store.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # members key -> (channel_id, cached_at)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Restore cached channels from the state store. Returns how many were loaded."""
+        cutoff = time.time() - DM_CACHE_TTL_SECONDS
+        state_execute("DELETE FROM dm_channels WHERE cached_at < ?", (cutoff,))
+        rows = state_query("SELECT members, channel_id, cached_at FROM dm_channels ORDER BY cached_at")
+        with self._lock:
+            for members, channel_id, cached_at in rows[-DM_CACHE_SIZE:]:
+                self._entries[members] = (channel_id, cached_at)
+        return len(rows)
+
+    def get(self, usernames):
+        key = dm_members_key(usernames)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[1] < DM_CACHE_TTL_SECONDS:
+                self._entries.move_to_end(key)
+                DM_CACHE_LOOKUPS.inc(result="hit")
+                return entry[0]
+        DM_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def put(self, usernames, channel_id):
+        key = dm_members_key(usernames)
+        if not key or not channel_id:
+            return
+        now = time.time()
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = (channel_id, now)
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > DM_CACHE_SIZE:
+                evicted.append(self._entries.popitem(last=False)[0])
+        # a confirmed existing entry only refreshes its TTL in memory
+        if previous is None or previous[0] != channel_id:
+            state_execute(
+                "INSERT INTO dm_channels (members, channel_id, cached_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(members) DO UPDATE SET channel_id = excluded.channel_id, cached_at = excluded.cached_at",
+                (key, channel_id, now)
+            )
+        for key in evicted:
+            state_execute("DELETE FROM dm_channels WHERE members = ?", (key,))
+
+    def observe(self, channels):
+        """
+        Record every channel in a /chat/api/me/channels response. On a cold
+        start every channel is new, so the writes share one transaction.
+        """
+        try:
+            with state_transaction():
+                for channel in channels:
+                    users = channel.get("chatable", {}).get("users") or []
+                    usernames = [u.get("username") for u in users]
+                    if usernames:
+                        self.put(usernames, channel.get("id"))
+        except sqlite3.Error as e:
+            # the in-memory cache is still current; only persistence was lost
+            log.error("Could not save observed DM channels: %s", e)
+
+    def invalidate(self, channel_id):
+        with self._lock:
+            keys = [key for key, (cached_id, _) in self._entries.items() if cached_id == channel_id]
+            for key in keys:
+                del self._entries[key]
+        for key in keys:
+            state_execute("DELETE FROM dm_channels WHERE members = ?", (key,))
+        if keys:
+            log.info("Dropped DM channel %s from the cache", channel_id, extra={"channel_id": channel_id})
+
+dm_cache = DMChannelCache()
+
+def is_channel_error(error):
+    """True if a failed send means the channel itself is unusable (4xx other than 429)."""
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code != 429
+
+class JsonStream:
+    """
+    Pull parser over chunks of JSON text. items() and elements() step
+    into an object or array one member at a time; the caller must read
+    each member with value() or skip() before asking for the next. Only
+    what is read is decoded, so memory is bounded by the largest single
+    value rather than the whole document.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ""
+        self._pos = 0
+
+    def _fill(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("JSON ended unexpectedly")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"expected {char!r} in JSON, found {self._buf[self._pos]!r}")
+        self._pos += 1
+
+    # what may follow a number or literal
+    _scalar_end = re.compile(r"[\s,\]}]")
+
+    def value(self):
+        """Decode the next value."""
+        if self._peek() not in '{["':
+            # a number or literal may go on in the next chunk ("5.5" + "e3"),
+            # so it is only complete once a delimiter or the end follows it
+            while not self._scalar_end.search(self._buf, self._pos) and self._fill():
+                pass
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self._pos = end
+            return value
+
+    def skip(self):
+        """Step over the next value without keeping it."""
+        char = self._peek()
+        if char == "{":
+            for _ in self.items():
+                self.skip()
+        elif char == "[":
+            for _ in self.elements():
+                self.skip()
+        else:
+            self.value()
+
+    def items(self):
+        """Yield each key of the next object, positioned at its value."""
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            char = self._peek()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"expected ',' or '}}' in JSON, found {char!r}")
+
+    def elements(self):
+        """Yield once per element of the next array, positioned at the element."""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self._peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"expected ',' or ']' in JSON, found {char!r}")
+
+def iter_channel_list(response):
+    """
+    Yield ("channel", channel) for each DM channel and ("tracking",
+    (channel_id, tracking)) for each channel-tracking entry of a
+    /chat/api/me/channels response, streaming it in CHANNEL_LIST_CHUNK_SIZE
+    pieces. Everything else in the response is skipped.
+    """
+    stream = JsonStream(codecs.iterdecode(response.iter_content(CHANNEL_LIST_CHUNK_SIZE), "utf-8"))
+    for key in stream.items():
+        if key == "direct_message_channels":
+            for _ in stream.elements():
+                yield "channel", stream.value()
+        elif key == "tracking":
+            for tracking_key in stream.items():
+                if tracking_key == "channel_tracking":
+                    for channel_id in stream.items():
+                        yield "tracking", (channel_id, stream.value())
+                else:
+                    stream.skip()
+        else:
+            stream.skip()
+
+# The previous channel list: its ETag, the channels that still had unread
+# messages (served again on a 304), and last_message.id per channel in
+# listed_message_ids, which decides which channels changed.
+_channel_list = {"etag": None, "unread": ([], {})}
+
+@profiled
+def get_dm_channel_data():
+    """
+    Fetch the bot's DM channel list and return the channels that need
+    attention: (channels list, channel_tracking dict).
+
+    Only channels whose last message changed since the previous list, and
+    channels with unread messages, are returned (unchanged ones as just
+    {"id", "last_message"}); channel_tracking holds the entries with
+    unread_count > 0, keyed by string channel ID. An unchanged list is a
+    bodyless 304, and a changed one is parsed as it streams in, so cost
+    does not grow with every player who ever messaged the bot.
+    """
+    headers = {"If-None-Match": _channel_list["etag"]} if _channel_list["etag"] else {}
+    with discourse_request("GET", "/chat/api/me/channels", headers=headers, stream=True) as r:
+        if r.status_code == 304:
+            return _channel_list["unread"]
+        changed = []
+        unchanged = {}  # channel id -> last message id
+        listed = []
+        channel_tracking = {}
+        for kind, item in iter_channel_list(r):
+            if kind == "tracking":
+                channel_id, tracking = item
+                if tracking.get("unread_count"):
+                    channel_tracking[channel_id] = tracking
+                continue
+            channel_id = item.get("id")
+            last_id = (item.get("last_message") or {}).get("id", 0)
+            listed.append((channel_id, last_id))
+            if listed_message_ids.get(channel_id) == last_id:
+                unchanged[channel_id] = last_id
+            else:
+                changed.append(item)
+        etag = r.headers.get("ETag")
+
+    dm_cache.observe(changed)
+    listed_message_ids.replace(listed)
+    channels = changed + [
+        {"id": channel_id, "last_message": {"id": unchanged[channel_id]}}
+        for channel_id in (int(c) for c in channel_tracking if c.isdigit())
+        if channel_id in unchanged
+    ]
+    unread = [c for c in channels if str(c.get("id")) in channel_tracking]
+    _channel_list["etag"] = etag
+    _channel_list["unread"] = (unread, channel_tracking)
+    return channels, channel_tracking
+
+def evict_dormant_channels():
+    """Forget cursors that have not moved for DM_CHANNEL_DORMANT_SECONDS. Returns how many were dropped."""
+    dormant = processed_message_ids.dormant(time.time() - DM_CHANNEL_DORMANT_SECONDS)
+    for channel_id in dormant:
+        processed_message_ids.pop(channel_id)
+        state_execute("DELETE FROM channel_cursors WHERE channel_id = ?", (channel_id,))
+    if dormant:
+        log.info("Evicted %s dormant DM channel cursors (%s left)", len(dormant), len(processed_message_ids))
+    return len(dormant)
+
+class FetchBudget:
+    """Bytes of message payload the current ingestion pass may still download."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.remaining = limit
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.remaining = self.limit
+
+    def spend(self, size):
+        with self._lock:
+            self.remaining -= size
+
+    def exhausted(self):
+        return self.remaining <= 0
+
+message_fetch_budget = FetchBudget(MESSAGE_FETCH_BYTE_BUDGET)
+
+@profiled
+def get_channel_messages(channel_id, after_id=None):
+    """
+    Fetch one page of messages from a chat DM channel.
+    With after_id, only messages newer than it are returned (oldest
+    first); without it, the latest page.
+    Returns (messages, more) where more is True if further newer pages exist.
+    """
+    params = {"page_size": MESSAGE_PAGE_SIZE}
+    if after_id:
+        params.update(target_message_id=after_id, direction="future")
+    r = discourse_request("GET", f"/chat/api/channels/{channel_id}/messages", params=params)
+    message_fetch_budget.spend(len(r.content))
+    data = r.json()
+    messages = sorted(data.get("messages", []), key=lambda m: m.get("id", 0))
+    return messages, bool(data.get("meta", {}).get("can_load_more_future"))
+
+def iter_new_messages(channel_id, after_id):
+    """
+    Yield the channel's messages newer than after_id, oldest first,
+    paging forward until caught up or the byte budget runs out.
+    """
+    while not message_fetch_budget.exhausted():
+        messages, more = get_channel_messages(channel_id, after_id)
+        yield from messages
+        if not (more and messages):
+            return
+        after_id = messages[-1].get("id", after_id)
+    log.warning(
+        "Message fetch budget spent; channel %s resumes next pass from message %s", channel_id, after_id,
+        extra={"channel_id": channel_id}
+    )
+
+@profiled
+def mark_channel_read(channel_id, message_id):
+    """Move the bot's read marker so unread_count only counts messages still to be handled."""
+    discourse_request("PUT", f"/chat/api/channels/{channel_id}/read/{message_id}")
+
+@profiled
+def send_chat_message(channel_id, message):
+    """Send a message to a chat channel. A channel the send is refused on is dropped from the DM cache."""
+    data = {"message": message}
+    try:
+        return discourse_post(f"/chat/{channel_id}", data)
+    except requests.HTTPError as e:
+        if is_channel_error(e):
+            dm_cache.invalidate(channel_id)
+        raise
+
+@profiled
+def get_or_create_dm_channel(username):
+    """Get or create a 1:1 DM channel with a specific user."""
+    channel_id = dm_cache.get([username])
+    if channel_id:
+        return channel_id
+    data = {"target_usernames": [username]}
+    result = discourse_post("/chat/api/direct-message-channels", data)
+    channel_id = result.get("channel", {}).get("id")
+    dm_cache.put([username], channel_id)
+    return channel_id
+
+@profiled
+def create_group_dm(usernames):
+    """
+    Create a group DM channel containing all provided usernames.
+    The bot account is included automatically as the API actor.
+    Returns the channel ID or None on failure; a 4xx refusal (a player
+    who does not accept DMs) is raised.
+    usernames should be a list of Discourse username strings.
+    """
+    channel_id = dm_cache.get(usernames)
+    if channel_id:
+        return channel_id
+    try:
+        data = {"target_usernames": usernames}
+        result = discourse_post("/chat/api/direct-message-channels", data)
+        channel_id = result.get("channel", {}).get("id")
+        if channel_id:
+            dm_cache.put(usernames, channel_id)
+            log.info("Created group DM channel %s for: %s", channel_id, usernames, extra={"channel_id": channel_id})
+        else:
+            log.error("Group DM creation returned no channel ID for: %s", usernames)
+        return channel_id
+    except requests.HTTPError as e:
+        if is_channel_error(e):
+            raise
+        log.error("Failed to create group DM for %s: %s", usernames, e)
+        return None
+    except Exception as e:
+        log.error("Failed to create group DM for %s: %s", usernames, e)
+        return None
+
+# ============================================================
+# Convoke API Helper
+# ============================================================
+
+@profiled
+def create_convoke_room(label, seat_count, convoke_format):
+    """
+    Call the Convoke API to create a game room.
+    Returns the join URL on success, None on failure.
+    """
+    try:
+        payload = {
+            "apiKey": CONVOKE_API_KEY,
+            "name": f"PDH Forum — {label}",
+            "isPublic": False,
+            "seatLimit": seat_count,
+            "format": convoke_format
+        }
+        resp = http_request(
+            "convoke", "POST", CONVOKE_API_URL, "/api/game/create-game", json=payload,
+            timeout=(HTTP_CONNECT_TIMEOUT, CONVOKE_READ_TIMEOUT)
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        url = data.get("url")
+        if url:
+            log.info("Convoke room created: %s", url)
+            return url
+        else:
+            log.error("Convoke response missing url field: %s", data)
+            return None
+    except CircuitOpenError:
+        return None
+    except Exception as e:
+        log.error("Convoke API error: %s", e)
+        return None
+
+# ============================================================
+# Topic Helpers
+# ============================================================
+
+def lfg_post_body(requester_username, format_key, seated=()):
+    """
+    Raw text of an LFG topic's first post. Players seated by the bot are
+    listed and their seats no longer advertised, so forum visitors only
+    vote for spots that are really open. The poll markup never changes,
+    so the post can be edited while the poll has votes.
+    """
+    _, seat_count, poll_threshold, _, label = LFG_FORMATS[format_key]
+    spots = max(0, poll_threshold - len(seated))
+
+    if poll_threshold == 1:
+        seat_text = "Once a second player joins the poll, both players will receive a Convoke link via DM."
+    else:
+        seat_text = f"Once all {poll_threshold} spots are filled, everyone will receive a Convoke link via DM."
+    poll_line = f"Vote below — {spots} spot{'' if spots == 1 else 's'} available!"
+    seated_line = f"**Already seated:** {', '.join(seated)}\n" if seated else ""
+
+    return f"""@{requester_username} is looking for a {label} game on Convoke! {poll_line}
+
+> ⏱ This post expires in 1 hour. {seat_text} If the poll doesn't fill in time, it will be removed automatically and all participants will be notified via DM. No Discord required.
+
+**Format:** {label}
+**Platform:** Convoke (webcam)
+{seated_line}
+[poll type=regular results=always public=true chartType=bar]
+* Join me
+[/poll]"""
+
+@profiled
+def create_lfg_topic(requester_username, format_key):
+    """Create a Looking for Game topic for the given format."""
+    category_id, _, _, _, label = LFG_FORMATS[format_key]
+
+    data = {
+        "title": f"Looking for a {label} Game — {requester_username}",
+        "raw": lfg_post_body(requester_username, format_key),
+        "category": category_id,
+        "tags": [LFG_TAG]
+    }
+    return discourse_post("/posts.json", data)
+
+def update_lfg_post(topic_id, info):
+    """Rewrite a lobby's first post to show its current seated players."""
+    discourse_put(f"/posts/{info['post_id']}.json", {
+        "post": {
+            "raw": lfg_post_body(info["requester"], info["format_key"], info.get("seated", [])),
+            "edit_reason": "Seats updated",
+        }
+    })
+
+def parse_timestamp(value):
+    """Epoch seconds for an ISO 8601 timestamp from the Discourse API, or None."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+def is_bot_topic(topic, user_ids):
+    """True if the bot account is the topic's Original Poster. user_ids maps listing user ids to usernames."""
+    for poster in topic.get("posters", []):
+        if "Original Poster" in (poster.get("description") or ""):
+            return user_ids.get(poster.get("user_id")) == DISCOURSE_BOT_USERNAME
+    return False
+
+def lfg_requester(post):
+    """
+    The player an LFG first post was opened for: lfg_post_body() starts
+    with their @mention, which the cooked HTML keeps as the first "@name".
+    None if the post has no mention.
+    """
+    match = re.search(r"@([\w.\-]+)", post.get("raw") or post.get("cooked") or "")
+    return match.group(1) if match else None
+
+def iter_category_topics(category_id):
+    """
+    Yield every topic the bot opened in a category, following the
+    listing's pages (up to CATEGORY_MAX_PAGES).
+    """
+    for page in range(CATEGORY_MAX_PAGES):
+        data = discourse_get(f"/c/{category_id}.json", params={"page": page} if page else None)
+        user_ids = {u.get("id"): u.get("username") for u in data.get("users", [])}
+        topic_list = data.get("topic_list", {})
+        topics = topic_list.get("topics", [])
+        for topic in topics:
+            if is_bot_topic(topic, user_ids):
+                yield topic
+        if not topics or not topic_list.get("more_topics_url"):
+            return
+
+@profiled
+def get_poll_data(topic_id):
+    """Fetch poll voter count and status from a topic."""
+    data = discourse_get(f"/t/{topic_id}.json")
+    posts = data.get("post_stream", {}).get("posts", [])
+    if not posts:
+        return None, None, None, data
+    first_post = posts[0]
+    post_id = first_post.get("id")
+    polls = first_post.get("polls", [])
+    if not polls:
+        return None, None, None, data
+    poll = polls[0]
+    voters = poll.get("voters", 0)
+    is_closed = poll.get("status") == "closed"
+    return voters, is_closed, post_id, data
+
+# topic_id -> {"etag", "last_modified", "state"} from the last poll fetch,
+# used to send conditional requests and to serve 304 responses.
+_poll_cache = {}
+_poll_cache_lock = threading.Lock()
+_poll_fetch_pool = None
+
+def is_gone(error):
+    """True if an HTTPError means the topic or post no longer exists."""
+    return error.response is not None and error.response.status_code in (404, 410)
+
+@profiled
+def get_poll_state(topic_id, post_id=None):
+    """
+    Fetch (voters, is_closed, post_id) for a topic.
+    With a known first-post id this reads /posts/{post_id}.json — one post
+    rather than the whole post stream — and sends If-None-Match /
+    If-Modified-Since so an unchanged poll costs a bodyless 304.
+    Without a post id it falls back to get_poll_data() to learn it.
+    A deleted topic or post returns (None, None, post_id).
+    """
+    try:
+        if not post_id:
+            voters, is_closed, post_id, _ = get_poll_data(topic_id)
+            return voters, is_closed, post_id
+
+        with _poll_cache_lock:
+            cached = _poll_cache.get(topic_id)
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        r = discourse_request("GET", f"/posts/{post_id}.json", headers=headers)
+    except requests.HTTPError as e:
+        if is_gone(e):
+            return None, None, post_id
+        raise
+
+    if r.status_code == 304 and cached:
+        return cached["state"]
+
+    polls = r.json().get("polls", [])
+    if polls:
+        state = (polls[0].get("voters", 0), polls[0].get("status") == "closed", post_id)
+    else:
+        state = (None, None, post_id)
+    with _poll_cache_lock:
+        _poll_cache[topic_id] = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "state": state,
+        }
+    return state
+
+@profiled
+def get_poll_states(topic_posts):
+    """
+    Fetch poll state for many topics in one batch.
+    topic_posts maps topic_id -> first post id (or None if unknown).
+    Returns topic_id -> (voters, is_closed, post_id), or the exception
+    raised for that topic so the caller can handle it per topic.
+    """
+    global _poll_fetch_pool
+    if not topic_posts:
+        return {}
+    if _poll_fetch_pool is None:
+        _poll_fetch_pool = ThreadPoolExecutor(max_workers=POLL_FETCH_CONCURRENCY, thread_name_prefix="poll-fetch")
+
+    context = contextvars.copy_context()
+    futures = {
+        topic_id: _poll_fetch_pool.submit(context.copy().run, get_poll_state, topic_id, post_id)
+        for topic_id, post_id in topic_posts.items()
+    }
+    states = {}
+    for topic_id, future in futures.items():
+        try:
+            states[topic_id] = future.result()
+        except Exception as e:
+            states[topic_id] = e
+    return states
+
+def forget_poll_state(topic_id):
+    with _poll_cache_lock:
+        _poll_cache.pop(topic_id, None)
+
+@profiled
+def get_poll_voters(topic_id, post_id):
+    """
+    Get usernames of all poll voters.
+    option_id is intentionally omitted — Discourse uses hashed option IDs,
+    not sequential integers. Omitting it returns all voters across all options.
+    voters is guarded with `or {}` since Discourse may return null for empty polls.
+    Errors propagate: an empty list would drop every voter from the match
+    or expiry notification, so the caller retries the topic instead.
+    """
+    data = discourse_get(
+        "/polls/voters.json",
+        params={
+            "topic_id": topic_id,
+            "post_id": post_id,
+            "poll_name": "poll",
+        }
+    )
+    voters = data.get("voters") or {}
+    all_voters = []
+    for option_voters in voters.values():
+        all_voters.extend([v.get("username") for v in option_voters if v.get("username")])
+    return all_voters
+
+def delete_topic(topic_id):
+    """Delete a topic."""
+    return discourse_delete(f"/t/{topic_id}.json")
+
+# ============================================================
+# Bot State
+# ============================================================
+
+class CursorTable:
+    """
+    channel_id -> message id, stored as parallel array columns sorted by
+    channel id (24 bytes a channel instead of a dict entry and its int
+    objects). Supports the mapping operations the bot uses; touched
+    records when each entry was last set, for dormant().
+    """
+
+    __slots__ = ("_ids", "_values", "_touched", "_lock")
+
+    def __init__(self):
+        self._ids = array("q")
+        self._values = array("q")
+        self._touched = array("d")
+        self._lock = threading.Lock()
+
+    def _find(self, channel_id):
+        i = bisect.bisect_left(self._ids, channel_id)
+        return i, i < len(self._ids) and self._ids[i] == channel_id
+
+    def __contains__(self, channel_id):
+        with self._lock:
+            return self._find(channel_id)[1]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(self._ids.tolist())
+
+    def get(self, channel_id, default=None):
+        with self._lock:
+            i, found = self._find(channel_id)
+            return self._values[i] if found else default
+
+    def __setitem__(self, channel_id, value):
+        now = time.time()
+        with self._lock:
+            i, found = self._find(channel_id)
+            if found:
+                self._values[i] = value
+                self._touched[i] = now
+            else:
+                self._ids.insert(i, channel_id)
+                self._values.insert(i, value)
+                self._touched.insert(i, now)
+
+    def pop(self, channel_id, default=None):
+        with self._lock:
+            i, found = self._find(channel_id)
+            if not found:
+                return default
+            value = self._values[i]
+            del self._ids[i], self._values[i], self._touched[i]
+            return value
+
+    def __delitem__(self, channel_id):
+        with self._lock:
+            i, found = self._find(channel_id)
+            if not found:
+                raise KeyError(channel_id)
+            del self._ids[i], self._values[i], self._touched[i]
+
+    def update(self, pairs):
+        """Set many (channel_id, value) pairs at once, e.g. when loading from the state store."""
+        now = time.time()
+        with self._lock:
+            entries = {c: (v, t) for c, v, t in zip(self._ids, self._values, self._touched)}
+            entries.update((channel_id, (value, now)) for channel_id, value in pairs)
+            self._rebuild(entries)
+
+    def replace(self, pairs):
+        """Replace the whole table with (channel_id, value) pairs."""
+        now = time.time()
+        with self._lock:
+            self._rebuild({channel_id: (value, now) for channel_id, value in pairs})
+
+    def _rebuild(self, entries):
+        ids = sorted(entries)
+        self._ids = array("q", ids)
+        self._values = array("q", (entries[c][0] for c in ids))
+        self._touched = array("d", (entries[c][1] for c in ids))
+
+    def dormant(self, before):
+        """Channel ids whose entry was last set before the given time."""
+        with self._lock:
+            return [c for c, t in zip(self._ids, self._touched) if t < before]
+
+# channel_id -> last processed message id
+# Only populated for channels that have had unread activity; the rest
+# are never fetched, and their baseline is the server-side read marker.
+processed_message_ids = CursorTable()
+
+# channel_id -> last_message.id as of the previous channel list
+listed_message_ids = CursorTable()
+
+# topic_id -> {requester, format_key, channel_id, post_id, seated, voters,
+#              created_at, expires_at}
+# seated: players placed in the lobby by the bot (they never vote);
+# voters: poll vote count as of the last check.
+active_lfg_topics = {}
+
+# Serialises "find a lobby with a free seat" with seating a player or
+# reserving a new lobby (LobbyIndex.reserve), so concurrent requests
+# cannot overfill a lobby or open two lobbies for one player. The topic
+# itself is created outside the lock; only tracking it re-takes it.
+_topic_creation_lock = threading.Lock()
+
+# ============================================================
+# State Store
+# ============================================================
+#
+# Every change to processed_message_ids or active_lfg_topics goes
+# through set_cursor / track_topic / untrack_topic, which update the
+# in-memory dict and write the same change to SQLite. Until
+# open_state_store() is called the writes are skipped, so the helpers
+# work unchanged in scripts that never open a store.
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_cursors (
+    channel_id      INTEGER PRIMARY KEY,
+    last_message_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lfg_topics (
+    topic_id INTEGER PRIMARY KEY,
+    info     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dm_channels (
+    members    TEXT PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    cached_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS convoke_rooms (
+    url        TEXT PRIMARY KEY,
+    format_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS forwarded_requests (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    username   TEXT NOT NULL,
+    format_key TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    dedupe_key      TEXT PRIMARY KEY,
+    kind            TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    priority        INTEGER NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at      REAL NOT NULL,
+    delivered_at    REAL,
+    last_error      TEXT
+);
+"""
+
+_state_db = None
+_state_lock = threading.RLock()
+
+def open_state_store(path=STATE_DB_PATH):
+    """Open (or create) the SQLite state database in WAL mode."""
+    global _state_db
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # isolation_level=None: autocommit, with explicit BEGIN in state_transaction()
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")  # other workers may share the database
+    conn.executescript(STATE_SCHEMA)
+    # Databases created before forwarded requests were retried lack the column
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(forwarded_requests)")}
+    if "attempts" not in columns:
+        conn.execute("ALTER TABLE forwarded_requests ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    _state_db = conn
+    log.info("State store opened at %s", path)
+
+def state_execute(sql, params=()):
+    """
+    Run a single write against the state store. Outside a transaction,
+    failures are logged, never raised. Inside state_transaction() they
+    raise, so the whole transaction rolls back instead of committing the
+    writes around the failed one.
+    """
+    if _state_db is None:
+        return
+    with _state_lock:
+        try:
+            _state_db.execute(sql, params)
+        except sqlite3.Error as e:
+            if _state_db.in_transaction:
+                raise
+            log.error("State store write failed: %s", e)
+
+def state_query(sql, params=()):
+    """Run a read against the state store and return all rows."""
+    if _state_db is None:
+        return []
+    with _state_lock:
+        return _state_db.execute(sql, params).fetchall()
+
+# Hooks registered with on_commit() by the thread running a state_transaction()
+_transaction = threading.local()
+
+@contextmanager
+def state_transaction():
+    """
+    Group several state writes into one atomic commit. Hooks registered
+    with on_commit() inside the block run once it has committed, or
+    their rollback side runs if it raises.
+    """
+    with _state_lock:
+        hooks = _transaction.hooks = []
+        try:
+            if _state_db is None:
+                yield
+            else:
+                _state_db.execute("BEGIN")
+                try:
+                    yield
+                except BaseException:
+                    _state_db.execute("ROLLBACK")
+                    raise
+                _state_db.execute("COMMIT")
+        except BaseException:
+            _transaction.hooks = None
+            for _, rolled_back in hooks:
+                if rolled_back:
+                    rolled_back()
+            raise
+        _transaction.hooks = None
+    for committed, _ in hooks:
+        committed()
+
+def on_commit(committed, rolled_back=None):
+    """
+    Run committed() once the calling thread's state_transaction() commits
+    (rolled_back() instead if it rolls back). Outside a transaction the
+    write has already happened, so committed() runs at once.
+    """
+    hooks = getattr(_transaction, "hooks", None)
+    if hooks is None:
+        committed()
+    else:
+        hooks.append((committed, rolled_back))
+
+def set_cursor(channel_id, message_id):
+    """Record the last processed message id for a DM channel."""
+    processed_message_ids[channel_id] = message_id
+    state_execute(
+        "INSERT INTO channel_cursors (channel_id, last_message_id) VALUES (?, ?) "
+        "ON CONFLICT(channel_id) DO UPDATE SET last_message_id = excluded.last_message_id",
+        (channel_id, message_id)
+    )
+
+def track_topic(topic_id, info):
+    """Start (or update) tracking of an active LFG topic."""
+    info.setdefault("expires_at", info["created_at"] + LFG_EXPIRY_SECONDS)
+    is_new = topic_id not in active_lfg_topics
+    active_lfg_topics[topic_id] = info
+    lobby_index.add(topic_id, info)
+    if is_new:
+        schedule_new_topic(topic_id, info)
+    state_execute(
+        "INSERT INTO lfg_topics (topic_id, info) VALUES (?, ?) "
+        "ON CONFLICT(topic_id) DO UPDATE SET info = excluded.info",
+        (topic_id, json.dumps(info))
+    )
+
+def untrack_topic(topic_id):
+    """Stop tracking a finished LFG topic."""
+    active_lfg_topics.pop(topic_id, None)
+    lobby_index.remove(topic_id)
+    poll_scheduler.remove_topic(topic_id)
+    expiry_wheel.cancel(topic_id)
+    forget_poll_state(topic_id)
+    state_execute("DELETE FROM lfg_topics WHERE topic_id = ?", (topic_id,))
+
+def load_cursors(shard=None):
+    """
+    Load channel cursors from the state store into memory, only those in
+    one DM shard if given. Returns how many were loaded.
+    """
+    if shard is None:
+        cursors = state_query("SELECT channel_id, last_message_id FROM channel_cursors")
+    else:
+        cursors = state_query(
+            "SELECT channel_id, last_message_id FROM channel_cursors WHERE channel_id % ? = ?",
+            (SHARD_COUNT, shard)
+        )
+    processed_message_ids.update(cursors)
+    return len(cursors)
+
+def load_topic_state():
+    """
+    Load active topics, pending outbox jobs and pooled rooms — the state
+    owned by whoever runs topic lifecycle. Returns (topics, jobs, rooms) counts.
+    """
+    topics = state_query("SELECT topic_id, info FROM lfg_topics")
+    for topic_id, info in topics:
+        info = json.loads(info)
+        info.setdefault("expires_at", info["created_at"] + LFG_EXPIRY_SECONDS)
+        active_lfg_topics[topic_id] = info
+        lobby_index.add(topic_id, info)
+        schedule_new_topic(topic_id, info)
+    return len(topics), outbox.load(), room_pool.load()
+
+def load_state():
+    """
+    Load cursors and active topics from the state store into memory.
+    Returns True if the store held any state, False if it was empty.
+    """
+    cursors = load_cursors()
+    topics, jobs, rooms = load_topic_state()
+    dms = dm_cache.load()
+    log.info(
+        "Loaded %s channel cursors, %s active topics, %s pending outbox jobs, %s pooled rooms "
+        "and %s DM channels from state store", cursors, topics, jobs, rooms, dms
+    )
+    return bool(cursors or topics or jobs)
+
+# ============================================================
+# Outbox
+# ============================================================
+#
+# Side effects of a finished topic — the match or expiry notification,
+# overflow DMs, deleting the topic — are queued here instead of being
+# run inline, and delivered by OUTBOX_WORKERS background threads.
+# Each job kind has a handler in OUTBOX_HANDLERS (see Core Logic).
+
+class UndeliverableError(Exception):
+    """Raised by an outbox handler when retrying cannot help; the job fails at once."""
+
+class Outbox:
+    """
+    Persistent queue of delivery jobs, keyed by a dedupe key.
+
+    Queueing a key that is already pending, or was delivered within
+    OUTBOX_RETENTION_SECONDS, is a no-op. A job queued inside a
+    state_transaction() is only handed to the workers once it commits,
+    and forgotten if it rolls back. A failed job is retried with
+    exponential backoff and given up after OUTBOX_MAX_ATTEMPTS (its row
+    stays in the table with status 'failed'). A job refused by an open
+    circuit breaker does not use up an attempt: it is parked until the
+    breaker closes and then re-queued. A handler raising
+    UndeliverableError (Discourse refusing a player's DMs) fails the job
+    without retrying. Handlers call checkpoint()
+    after each completed step, so a retry resumes instead of repeating
+    work that already succeeded.
+    Like the other state helpers, the queue works in memory only until
+    open_state_store() is called.
+    """
+
+    def __init__(self):
+        self._jobs = {}       # dedupe_key -> job
+        self._heap = []       # (next_attempt_at, seq, dedupe_key)
+        self._done = {}       # dedupe_key -> finished_at, for dedupe
+        self._parked = {}     # service -> dedupe keys waiting for its circuit breaker to close
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def enqueue(self, kind, dedupe_key, payload, priority=None):
+        """Queue a job. Runs at the caller's request priority unless one is given."""
+        if priority is None:
+            priority = _request_priority.get()
+        now = time.time()
+        job = {
+            "key": dedupe_key, "kind": kind, "payload": payload,
+            "priority": priority, "attempts": 0,
+        }
+        with self._cond:
+            if dedupe_key in self._jobs or dedupe_key in self._done:
+                log.info("Outbox job %s already queued, skipping", dedupe_key)
+                return False
+            self._jobs[dedupe_key] = job  # reserves the key; workers only see it once pushed
+        # outside the condition lock: callers may hold the state lock
+        try:
+            state_execute(
+                "INSERT OR IGNORE INTO outbox (dedupe_key, kind, payload, priority, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (dedupe_key, kind, json.dumps(payload), priority, now, now)
+            )
+        except sqlite3.Error:
+            self._discard(job)
+            raise
+        # inside the caller's state_transaction(), deliver only what it commits
+        on_commit(functools.partial(self._release, job, now), functools.partial(self._discard, job))
+        return True
+
+    def _release(self, job, when):
+        with self._cond:
+            if self._jobs.get(job["key"]) is job:
+                self._push(job, when)
+
+    def _discard(self, job):
+        with self._cond:
+            if self._jobs.get(job["key"]) is job:
+                del self._jobs[job["key"]]
+
+    def checkpoint(self, job):
+        """Persist a job's payload after a completed step."""
+        state_execute("UPDATE outbox SET payload = ? WHERE dedupe_key = ?", (json.dumps(job["payload"]), job["key"]))
+
+    def pending(self):
+        with self._cond:
+            return len(self._jobs)
+
+    def is_pending(self, dedupe_key):
+        with self._cond:
+            return dedupe_key in self._jobs
+
+    def load(self):
+        """Re-queue pending jobs from the state store. Returns how many were loaded."""
+        cutoff = time.time() - OUTBOX_RETENTION_SECONDS
+        state_execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (cutoff,))
+        rows = state_query(
+            "SELECT dedupe_key, kind, payload, priority, attempts, next_attempt_at, status, delivered_at FROM outbox"
+        )
+        loaded = 0
+        with self._cond:
+            for key, kind, payload, priority, attempts, next_attempt_at, status, delivered_at in rows:
+                if status != "pending":
+                    self._done[key] = delivered_at or cutoff
+                    continue
+                job = {"key": key, "kind": kind, "payload": json.loads(payload),
+                       "priority": priority, "attempts": attempts}
+                self._jobs[key] = job
+                self._push(job, next_attempt_at)
+                loaded += 1
+        return loaded
+
+    def prune(self):
+        """Forget delivered and failed jobs older than OUTBOX_RETENTION_SECONDS."""
+        cutoff = time.time() - OUTBOX_RETENTION_SECONDS
+        with self._cond:
+            for key in [k for k, finished_at in self._done.items() if finished_at < cutoff]:
+                del self._done[key]
+        state_execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (cutoff,))
+
+    def start(self, workers=OUTBOX_WORKERS):
+        for _ in range(workers - len(self._workers)):
+            worker = threading.Thread(target=self._work, name=f"outbox-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _push(self, job, when):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, job["key"]))
+        self._cond.notify()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, key = heapq.heappop(self._heap)
+                    if key in self._jobs:
+                        return self._jobs[key]
+                    continue
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _work(self):
+        while True:
+            self._deliver(self._next_job())
+
+    def run_due(self):
+        """Deliver every job that is due on the calling thread (for runs without worker threads)."""
+        while True:
+            with self._cond:
+                if not self._heap or self._heap[0][0] > time.time():
+                    return
+                _, _, key = heapq.heappop(self._heap)
+                job = self._jobs.get(key)
+            if job:
+                self._deliver(job)
+
+    def _deliver(self, job):
+        try:
+            with request_priority(job["priority"]):
+                OUTBOX_HANDLERS[job["kind"]](job)
+        except Exception as e:
+            self._failed(job, e)
+        else:
+            self._finish(job, "delivered")
+
+    def _failed(self, job, error):
+        if isinstance(error, CircuitOpenError):
+            self._park(job, error.service)
+            return
+        job["attempts"] += 1
+        if isinstance(error, UndeliverableError):
+            log.error("Outbox job %s cannot be delivered, giving up: %s", job["key"], error)
+            self._finish(job, "failed", str(error))
+            return
+        if job["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            log.error("Outbox job %s failed after %s attempts, giving up: %s", job["key"], job["attempts"], error)
+            self._finish(job, "failed", str(error))
+            return
+        delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * (2 ** (job["attempts"] - 1)))
+        delay = random.uniform(delay / 2, delay)
+        log.warning(
+            "Outbox job %s failed (attempt %s), retrying in %.0fs: %s",
+            job["key"], job["attempts"], delay, error
+        )
+        OUTBOX_JOBS.inc(kind=job["kind"], outcome="retried")
+        state_execute(
+            "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ?, payload = ? WHERE dedupe_key = ?",
+            (job["attempts"], time.time() + delay, str(error), json.dumps(job["payload"]), job["key"])
+        )
+        with self._cond:
+            self._push(job, time.time() + delay)
+
+    def _park(self, job, service):
+        with self._cond:
+            if circuit_breakers[service].is_closed():
+                # closed again since the rejection; resume() has already run
+                self._push(job, time.time())
+                return
+            self._parked.setdefault(service, set()).add(job["key"])
+        log.info("Outbox job %s parked until the %s circuit breaker closes", job["key"], service)
+        OUTBOX_JOBS.inc(kind=job["kind"], outcome="parked")
+
+    def resume(self, service, outage=None):
+        """Re-queue the jobs parked on a service's circuit breaker (its on_recovery callback)."""
+        now = time.time()
+        with self._cond:
+            keys = self._parked.pop(service, ())
+            for key in keys:
+                if key in self._jobs:
+                    self._push(self._jobs[key], now)
+        if keys:
+            log.info("Re-queued %s outbox jobs parked on the %s circuit breaker", len(keys), service)
+
+    def _finish(self, job, status, error=None):
+        now = time.time()
+        state_execute(
+            "UPDATE outbox SET status = ?, delivered_at = ?, attempts = ?, last_error = ?, payload = ? "
+            "WHERE dedupe_key = ?",
+            (status, now, job["attempts"], error, json.dumps(job["payload"]), job["key"])
+        )
+        with self._cond:
+            self._jobs.pop(job["key"], None)
+            self._done[job["key"]] = now
+        OUTBOX_JOBS.inc(kind=job["kind"], outcome=status)
+
+outbox = Outbox()
+for _service, _breaker in circuit_breakers.items():
+    _breaker.on_recovery(functools.partial(outbox.resume, _service))
+
+# ============================================================
+# Convoke Room Pool
+# ============================================================
+
+class RoomPool:
+    """
+    Pre-created Convoke rooms, per format, oldest first.
+
+    take() hands out the oldest room that has not gone stale and wakes
+    the refill thread. The refill thread tops each format up to
+    target_size(), which scales with the format's recent match rate so
+    busy formats keep more rooms warm and quiet ones keep ROOM_POOL_MIN.
+    """
+
+    def __init__(self):
+        self._rooms = {format_key: [] for format_key in LFG_FORMATS}  # format_key -> [(created_at, url)]
+        self._matches = {format_key: [] for format_key in LFG_FORMATS}  # format_key -> match timestamps
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def size(self, format_key):
+        with self._lock:
+            return len(self._rooms.get(format_key, ()))
+
+    def load(self):
+        """Restore pooled rooms from the state store. Returns how many were loaded."""
+        rows = state_query("SELECT url, format_key, created_at FROM convoke_rooms ORDER BY created_at")
+        with self._lock:
+            for url, format_key, created_at in rows:
+                if format_key in self._rooms:
+                    self._rooms[format_key].append((created_at, url))
+        return len(rows)
+
+    def take(self, format_key):
+        """Return a ready room URL for this format, or None if the pool is empty."""
+        now = time.time()
+        with self._lock:
+            self._matches.setdefault(format_key, []).append(now)
+            rooms = self._rooms.get(format_key, [])
+            url = None
+            while rooms and url is None:
+                created_at, candidate = rooms.pop(0)
+                if now - created_at < ROOM_POOL_TTL_SECONDS:
+                    url = candidate
+        if url:
+            state_execute("DELETE FROM convoke_rooms WHERE url = ?", (url,))
+        self._wake.set()
+        return url
+
+    def target_size(self, format_key):
+        """Rooms needed to cover ROOM_POOL_HORIZON seconds at the recent match rate."""
+        cutoff = time.time() - ROOM_POOL_RATE_WINDOW
+        with self._lock:
+            recent = [t for t in self._matches.get(format_key, []) if t >= cutoff]
+            self._matches[format_key] = recent
+        expected = len(recent) * ROOM_POOL_HORIZON / ROOM_POOL_RATE_WINDOW
+        return max(ROOM_POOL_MIN, min(ROOM_POOL_MAX, math.ceil(expected)))
+
+    def refill(self):
+        """Drop stale rooms and create rooms until every format reaches its target size."""
+        cutoff = time.time() - ROOM_POOL_TTL_SECONDS
+        with self._lock:
+            for format_key, rooms in self._rooms.items():
+                self._rooms[format_key] = [(t, url) for t, url in rooms if t >= cutoff]
+        state_execute("DELETE FROM convoke_rooms WHERE created_at < ?", (cutoff,))
+
+        for format_key, (_, seat_count, _, convoke_format, label) in LFG_FORMATS.items():
+            while self.size(format_key) < self.target_size(format_key):
+                url = create_convoke_room(label, seat_count, convoke_format)
+                if not url:
+                    break  # Convoke is struggling; try again next round
+                now = time.time()
+                with self._lock:
+                    self._rooms[format_key].append((now, url))
+                state_execute(
+                    "INSERT OR IGNORE INTO convoke_rooms (url, format_key, created_at) VALUES (?, ?, ?)",
+                    (url, format_key, now)
+                )
+                log.info(
+                    "Pooled Convoke room for %s (%s ready)", label, self.size(format_key),
+                    extra={"format_key": format_key}
+                )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="room-pool", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refill()
+            except Exception as e:
+                log.error("Room pool refill failed: %s", e)
+            self._wake.wait(ROOM_POOL_REFILL_INTERVAL)
+            self._wake.clear()
+
+room_pool = RoomPool()
+
+# ============================================================
+# Reconciliation Sweeper
+# ============================================================
+
+class ReconciliationSweeper:
+    """
+    Periodically diffs the LFG category listings against tracked topics.
+
+    orphaned: the bot's topic is listed but not tracked (a deletion that
+              never went through, or state lost in a crash) — deleted
+    missing:  tracked but no longer listed (removed by a moderator) —
+              re-checked, and untracked once it returns 404
+    overdue:  tracked past its expiry (the timer never completed) —
+              expired now
+    """
+
+    def __init__(self):
+        self._thread = None
+
+    def sweep(self):
+        """Run one sweep. Returns the number of orphans still waiting for deletion."""
+        now = time.time()
+        listed = {}
+        with request_priority(PRIORITY_LOW):
+            for category_id, *_ in LFG_FORMATS.values():
+                for topic in iter_category_topics(category_id):
+                    listed[topic.get("id")] = topic
+
+        tracked = dict(active_lfg_topics)
+        orphaned = [
+            topic_id for topic_id, topic in listed.items()
+            if topic_id not in tracked
+            and not outbox.is_pending(f"delete:{topic_id}")
+            and now - (parse_timestamp(topic.get("created_at")) or now) > SWEEP_GRACE_SECONDS
+        ]
+        missing = [
+            topic_id for topic_id, info in tracked.items()
+            if topic_id not in listed and now - info["created_at"] > SWEEP_GRACE_SECONDS
+        ]
+        overdue = [topic_id for topic_id, info in tracked.items() if now > info["expires_at"] + SWEEP_GRACE_SECONDS]
+
+        for kind, topic_ids in (("orphaned", orphaned), ("missing", missing), ("overdue", overdue)):
+            SWEEPER_DRIFT.set(len(topic_ids), kind=kind)
+        if orphaned or missing or overdue:
+            log.info(
+                "Sweep: %s listed, %s tracked — %s orphaned, %s missing, %s overdue",
+                len(listed), len(tracked), len(orphaned), len(missing), len(overdue)
+            )
+
+        for topic_id in orphaned[:SWEEP_BATCH_SIZE]:
+            if outbox.enqueue("delete_topic", f"sweep:{topic_id}", {"topic_id": topic_id}, PRIORITY_LOW):
+                SWEEPER_REMOVED.inc()
+        for topic_id in missing:
+            mark_topic_dirty(topic_id)
+        for topic_id in overdue:
+            expiry_wheel.add(topic_id, now)
+        return max(0, len(orphaned) - SWEEP_BATCH_SIZE)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sweeper", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            backlog = 0
+            try:
+                backlog = self.sweep()
+            except Exception as e:
+                log.error("Reconciliation sweep failed: %s", e)
+            time.sleep(SWEEP_BACKLOG_INTERVAL if backlog else SWEEP_INTERVAL)
+
+sweeper = ReconciliationSweeper()
+
+def log_outbox_stats():
+    """Log the outbox backlog and drop expired dedupe records."""
+    outbox.prune()
+    log.info("Outbox: %s jobs pending", outbox.pending())
+
+# ============================================================
+# Poll Scheduler
+# ============================================================
+
+class PollScheduler:
+    """
+    Per-object poll deadlines for active topics and the DM channel list.
+
+    Topic deadlines live in a min-heap of (deadline, topic_id). Rescheduling
+    pushes a new entry and leaves the old one behind; stale entries are
+    recognised and skipped when they reach the top of the heap.
+    channels_floor and topic_floor are lower bounds on the intervals,
+    raised to RECONCILE_INTERVAL_SECONDS while push ingestion delivers
+    chat messages and poll votes respectively; channels_max_interval
+    likewise rises to SCHED_CHANNELS_PUSH_MAX_INTERVAL.
+    """
+
+    def __init__(self):
+        self.channels_floor = 0
+        self.topic_floor = 0
+        self.channels_max_interval = SCHED_CHANNELS_MAX_INTERVAL
+        self.channels_due_at = 0.0
+        self._channels_interval = SCHED_BASE_INTERVAL
+        self._heap = []
+        self._deadlines = {}
+        self._intervals = {}
+        self._last_voters = {}
+        self._lock = threading.Lock()
+
+    def schedule_topic(self, topic_id, delay):
+        deadline = time.time() + max(delay, self.topic_floor)
+        with self._lock:
+            self._deadlines[topic_id] = deadline
+            heapq.heappush(self._heap, (deadline, topic_id))
+
+    def remove_topic(self, topic_id):
+        with self._lock:
+            self._deadlines.pop(topic_id, None)
+            self._intervals.pop(topic_id, None)
+            self._last_voters.pop(topic_id, None)
+
+    def pop_due_topics(self, now):
+        """Remove and return every topic whose deadline has passed."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, topic_id = heapq.heappop(self._heap)
+                if self._deadlines.get(topic_id) == deadline:
+                    del self._deadlines[topic_id]
+                    due.append(topic_id)
+        return due
+
+    def next_topic_deadline(self):
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def record_topic(self, topic_id, info, voters):
+        """Schedule a topic's next check based on its latest vote count."""
+        poll_threshold = LFG_FORMATS[info["format_key"]][2]
+        with self._lock:
+            previous = self._last_voters.get(topic_id)
+            self._last_voters[topic_id] = voters
+            interval = self._intervals.get(topic_id, SCHED_BASE_INTERVAL)
+
+        age = time.time() - info["created_at"]
+        if (previous is not None and voters != previous) or (poll_threshold > 1 and voters >= poll_threshold - 1):
+            interval = SCHED_HOT_INTERVAL
+        elif previous is None or age < SCHED_FRESH_TOPIC_SECONDS:
+            interval = SCHED_BASE_INTERVAL
+        else:
+            interval = min(interval * SCHED_BACKOFF_FACTOR, SCHED_TOPIC_MAX_INTERVAL)
+
+        with self._lock:
+            self._intervals[topic_id] = interval
+        self.schedule_topic(topic_id, interval)
+
+    def record_channels(self, active):
+        """Schedule the next channel-list fetch; any unread activity resets the backoff."""
+        if active:
+            self._channels_interval = SCHED_BASE_INTERVAL
+        else:
+            self._channels_interval = min(
+                self._channels_interval * SCHED_BACKOFF_FACTOR, self.channels_max_interval
+            )
+        self.channels_due_at = time.time() + max(self._channels_interval, self.channels_floor)
+
+    def set_topic_floor(self, floor):
+        """
+        Change the topic floor. Lowering it (vote pushes stopped) pulls
+        deadlines set under the old floor in to SCHED_BASE_INTERVAL.
+        Returns True if any deadline moved.
+        """
+        with self._lock:
+            lowered = floor < self.topic_floor
+            self.topic_floor = floor
+            if not lowered:
+                return False
+            cap = time.time() + SCHED_BASE_INTERVAL
+            moved = [topic_id for topic_id, deadline in self._deadlines.items() if deadline > cap]
+            for topic_id in moved:
+                self._deadlines[topic_id] = cap
+                heapq.heappush(self._heap, (cap, topic_id))
+        return bool(moved)
+
+class TimerWheel:
+    """
+    Hashed timing wheel used for topic expiry.
+
+    Items hash into slot int(deadline / tick) % slots. add() and cancel()
+    are O(1); advance() only visits the slots for ticks that completed since
+    the previous call, and items more than one revolution away stay put
+    until their own round comes up. Expiry therefore fires at most one
+    tick late.
+    """
+
+    def __init__(self, tick=EXPIRY_WHEEL_TICK, slots=EXPIRY_WHEEL_SLOTS):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._slot_of = {}
+        self._last_tick = int(time.time() // tick)
+        self._lock = threading.Lock()
+
+    def add(self, item, deadline):
+        with self._lock:
+            self._remove(item)
+            # a deadline in an already-processed tick fires on the next advance
+            item_tick = max(int(deadline // self.tick), self._last_tick + 1)
+            slot = item_tick % len(self._slots)
+            self._slots[slot][item] = (item_tick, deadline)
+            self._slot_of[item] = slot
+
+    def cancel(self, item):
+        with self._lock:
+            self._remove(item)
+
+    def _remove(self, item):
+        slot = self._slot_of.pop(item, None)
+        if slot is not None:
+            self._slots[slot].pop(item, None)
+
+    def advance(self, now):
+        """Return every item whose tick completed by `now`, removing it from the wheel."""
+        fired = []
+        target = int(now // self.tick)
+        with self._lock:
+            ticks = range(self._last_tick + 1, target)
+            if len(ticks) > len(self._slots):
+                ticks = range(target - len(self._slots), target)
+            for t in ticks:
+                slot = self._slots[t % len(self._slots)]
+                for item, (item_tick, _) in list(slot.items()):
+                    if item_tick <= t:
+                        del slot[item]
+                        del self._slot_of[item]
+                        fired.append(item)
+            self._last_tick = max(self._last_tick, target - 1)
+        return fired
+
+    def next_deadline(self):
+        """Time at which the next item will fire, or None if the wheel is empty."""
+        with self._lock:
+            if not self._slot_of:
+                return None
+            for t in range(self._last_tick + 1, self._last_tick + 1 + len(self._slots)):
+                if any(item_tick == t for item_tick, _ in self._slots[t % len(self._slots)].values()):
+                    return (t + 1) * self.tick
+            earliest = min(item_tick for slot in self._slots for item_tick, _ in slot.values())
+            return (earliest + 1) * self.tick
+
+poll_scheduler = PollScheduler()
+expiry_wheel = TimerWheel()
+
+def extend_expiry_clocks(outage):
+    """
+    Push every active topic's expiry back by an outage, so no lobby loses
+    time to it. Runs on whichever request thread closed the breaker, so it
+    takes the topic-check lock (passes starting now see the new deadline)
+    and writes every topic in one transaction.
+    """
+    with _topics_in_check_lock, state_transaction():
+        topics = list(active_lfg_topics.items())
+        for topic_id, info in topics:
+            info["expires_at"] += outage
+            track_topic(topic_id, info)
+            expiry_wheel.add(topic_id, info["expires_at"])
+    if topics:
+        log.info("Extended expiry of %s topics by %.0fs after the Discourse outage", len(topics), outage)
+
+circuit_breakers["discourse"].on_recovery(extend_expiry_clocks)
+
+def schedule_new_topic(topic_id, info):
+    """Register a newly tracked topic with the poll scheduler and expiry wheel."""
+    poll_scheduler.schedule_topic(topic_id, SCHED_BASE_INTERVAL)
+    expiry_wheel.add(topic_id, info["expires_at"])
+
+def next_wakeup():
+    """Earliest deadline across the channel list, topic polls and topic expiry."""
+    deadlines = [poll_scheduler.channels_due_at]
+    if topic_checks_paused():
+        # due topics stay due; look again once a health probe may have run
+        deadlines.append(time.time() + BREAKER_RESET_SECONDS)
+    else:
+        deadlines += [poll_scheduler.next_topic_deadline(), expiry_wheel.next_deadline()]
+    if coordinator.enabled:
+        # followers hand triggers to the leader, who picks them up promptly
+        deadlines.append(time.time() + FORWARDED_REQUEST_POLL_INTERVAL)
+    return min(d for d in deadlines if d is not None)
+
+# ============================================================
+# Lobby Index
+# ============================================================
+#
+# Every active LFG topic is a lobby. The index answers the two questions
+# matchmaking asks on every request — "which lobbies are open for this
+# format?" and "is this player already in a lobby?" — without scanning
+# active_lfg_topics.
+
+def lobby_members(info):
+    """The requester plus every player the bot has seated in the lobby."""
+    return [info["requester"]] + info.get("seated", [])
+
+def open_seats(info):
+    """
+    Seats still free, counting seated players and the last known poll
+    votes. Lobby members who also voted (voted_members, recorded by
+    complete_match) count once.
+    """
+    poll_threshold = LFG_FORMATS[info["format_key"]][2]
+    double_counted = len(set(info.get("voted_members", ())) & set(lobby_members(info)))
+    return poll_threshold - len(info.get("seated", [])) - info.get("voters", 0) + double_counted
+
+class LobbyIndex:
+    """
+    by_format: format_key -> topic ids in creation order (a dict used as
+    an ordered set), so the oldest lobby is always tried first.
+    by_user: username -> {format_key: topic_id} for requesters and seated
+    players. Kept in sync by track_topic / untrack_topic / load_state.
+    opening: username -> format keys of lobbies reserved for the player
+    while their topic is being created (see open_lobby).
+    """
+
+    def __init__(self):
+        self.by_format = {}
+        self.by_user = {}
+        self.opening = {}
+        self._members = {}  # topic_id -> (format_key, usernames) as last indexed
+        self._lock = threading.Lock()
+
+    def add(self, topic_id, info):
+        format_key = info["format_key"]
+        members = lobby_members(info)
+        with self._lock:
+            self._unindex_members(topic_id)
+            self.by_format.setdefault(format_key, {})[topic_id] = None
+            for username in members:
+                self.by_user.setdefault(username, {})[format_key] = topic_id
+            self._members[topic_id] = (format_key, members)
+
+    def remove(self, topic_id):
+        with self._lock:
+            entry = self._unindex_members(topic_id)
+            if entry:
+                self.by_format.get(entry[0], {}).pop(topic_id, None)
+
+    def _unindex_members(self, topic_id):
+        entry = self._members.pop(topic_id, None)
+        if entry:
+            format_key, members = entry
+            for username in members:
+                lobbies = self.by_user.get(username, {})
+                if lobbies.get(format_key) == topic_id:
+                    del lobbies[format_key]
+                    if not lobbies:
+                        del self.by_user[username]
+        return entry
+
+    def lobbies(self, format_key):
+        with self._lock:
+            return list(self.by_format.get(format_key, ()))
+
+    def lobby_for_user(self, username, format_key):
+        with self._lock:
+            return self.by_user.get(username, {}).get(format_key)
+
+    def lobbies_for_user(self, username):
+        """format_key -> topic_id for every lobby the player is in."""
+        with self._lock:
+            return dict(self.by_user.get(username, {}))
+
+    def held_count(self, username):
+        """Formats the player is in a lobby for, or has one being opened for."""
+        with self._lock:
+            return len(set(self.by_user.get(username, ())) | self.opening.get(username, set()))
+
+    def reserve(self, username, format_key):
+        """Reserve a new lobby for the player. False if one is already being opened."""
+        with self._lock:
+            opening = self.opening.setdefault(username, set())
+            if format_key in opening:
+                return False
+            opening.add(format_key)
+            return True
+
+    def release(self, username, format_key):
+        with self._lock:
+            opening = self.opening.get(username, set())
+            opening.discard(format_key)
+            if not opening:
+                self.opening.pop(username, None)
+
+lobby_index = LobbyIndex()
+
+# ============================================================
+# User Index
+# ============================================================
+
+class UserActivity:
+    __slots__ = ("messages", "triggers", "last_help")
+
+    def __init__(self):
+        self.messages = []   # timestamps of messages in the last minute
+        self.triggers = {}   # format_key -> time of the last accepted trigger
+        self.last_help = 0.0
+
+class UserIndex:
+    """
+    Recent activity per player, used to decide which DMs deserve a reply.
+    An OrderedDict in least-recently-active order, bounded by
+    USER_INDEX_SIZE; evicted players simply start with a clean slate.
+    """
+
+    def __init__(self):
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _activity(self, username):
+        activity = self._users.get(username)
+        if activity is None:
+            activity = self._users[username] = UserActivity()
+            while len(self._users) > USER_INDEX_SIZE:
+                self._users.popitem(last=False)
+        self._users.move_to_end(username)
+        return activity
+
+    def screen(self, username, text):
+        """
+        Record a message and decide whether to act on it. Returns None to
+        handle it, or the reason it should be ignored: rate_limited,
+        duplicate_trigger, help_coalesced or shed.
+        """
+        now = time.time()
+        with self._lock:
+            activity = self._activity(username)
+            activity.messages = [t for t in activity.messages if now - t < 60]
+            activity.messages.append(now)
+            if len(activity.messages) > USER_MESSAGES_PER_MINUTE:
+                return "rate_limited"
+            if text in LFG_FORMATS:
+                if now - activity.triggers.get(text, 0.0) < TRIGGER_COOLDOWN_SECONDS:
+                    return "duplicate_trigger"
+                activity.triggers[text] = now
+                return None
+            if now - activity.last_help < HELP_REPLY_COOLDOWN_SECONDS:
+                return "help_coalesced"
+            if rate_limit_headroom() < SHED_HEADROOM:
+                return "shed"
+            activity.last_help = now
+            return None
+
+    def clear_triggers(self, usernames):
+        """Lift trigger cooldowns once the players' request has been answered by a match or expiry."""
+        with self._lock:
+            for username in usernames:
+                activity = self._users.get(username)
+                if activity:
+                    activity.triggers.clear()
+
+user_index = UserIndex()
+
+# ============================================================
+# Match History
+# ============================================================
+#
+# One fixed-size record per event, so a segment is a flat array that
+# lfg_history.py loads with numpy.fromfile. Each segment starts with
+# HISTORY_MAGIC, a uint32 length and a JSON header naming the formats and
+# kinds the record codes refer to, and the record layout; the segment
+# name carries a hash of the header, so a config change starts a new file.
+#
+#   kind     topic_id          count                  value
+#   request  0                 0                      0
+#   opened   new lobby         1                      0
+#   seated   lobby             players in the lobby   lobby age (s)
+#   votes    lobby             poll votes             lobby age (s)
+#   match    lobby             players matched        time to match (s)
+#   expiry   lobby             votes + seated         lobby age (s)
+#   overflow filled lobby      overflow voters        0
+
+HISTORY_MAGIC = b"LFGHIST1"
+HISTORY_FIELDS = ("t", "kind", "format", "count", "topic_id", "value")
+HISTORY_RECORD = struct.Struct("<dBBHIf")
+HISTORY_KINDS = ("request", "opened", "seated", "votes", "match", "expiry", "overflow")
+
+class MatchHistory:
+    """
+    Rolling event store for lobby activity. record() only packs the event
+    into a buffer; the buffer is appended to the day's segment once it
+    holds HISTORY_FLUSH_RECORDS events, by a background thread every
+    HISTORY_FLUSH_INTERVAL, and at exit. A torn final record (crash mid-write) is cut off
+    when the segment is next appended to. Starting a new segment deletes
+    those older than HISTORY_RETENTION_DAYS.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._kinds = {kind: code for code, kind in enumerate(HISTORY_KINDS)}
+        self._formats = {format_key: code for code, format_key in enumerate(LFG_FORMATS)}
+        header = json.dumps({
+            "formats": list(LFG_FORMATS),
+            "kinds": list(HISTORY_KINDS),
+            "fields": list(HISTORY_FIELDS),
+            "record": HISTORY_RECORD.format,
+        }, separators=(",", ":")).encode()
+        self._header = HISTORY_MAGIC + struct.pack("<I", len(header)) + header
+        self._suffix = hashlib.sha1(self._header).hexdigest()[:8]
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._flushed_at = time.time()
+        self._segment = None  # segment last appended to
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def record(self, kind, format_key, topic_id=0, count=0, value=0.0):
+        now = time.time()
+        data = HISTORY_RECORD.pack(
+            now, self._kinds[kind], self._formats.get(format_key, 255),
+            min(count, 0xFFFF), topic_id or 0, value
+        )
+        with self._lock:
+            self._buffer += data
+            self._buffered += 1
+            due = self._buffered >= HISTORY_FLUSH_RECORDS or now - self._flushed_at >= HISTORY_FLUSH_INTERVAL
+            if self._thread is None:
+                # started with the first event, so importing the module starts no thread
+                self._thread = threading.Thread(target=self._run, name="history-flush", daemon=True)
+                self._thread.start()
+        if due:
+            self.flush()
+
+    def _run(self):
+        wait = threading.Event().wait  # not time.sleep: replays swap the bot's clock for a virtual one
+        while not wait(HISTORY_FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            self._flushed_at = time.time()
+        if not data:
+            return
+        path = self.segment_path(time.time())
+        with self._write_lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                is_new = not os.path.exists(path)
+                with open(path, "ab") as f:
+                    if is_new:
+                        f.write(self._header)
+                    elif path != self._segment:
+                        # drop a torn record left by a crash, or every later record is misaligned
+                        torn = (f.tell() - len(self._header)) % HISTORY_RECORD.size
+                        if torn:
+                            f.truncate(f.tell() - torn)
+                    f.write(data)
+                self._segment = path
+            except OSError as e:
+                log.error("Could not write match history to %s: %s", path, e)
+                return
+        if is_new:
+            self.prune()
+
+    def segment_path(self, t):
+        return os.path.join(self.directory, f"events-{time.strftime('%Y%m%d', time.gmtime(t))}-{self._suffix}.lfgh")
+
+    def prune(self):
+        """Delete segments older than HISTORY_RETENTION_DAYS (by file date)."""
+        cutoff = time.strftime("%Y%m%d", time.gmtime(time.time() - HISTORY_RETENTION_DAYS * 86400))
+        try:
+            for name in os.listdir(self.directory):
+                if name.startswith("events-") and name.endswith(".lfgh") and name[7:15] < cutoff:
+                    os.remove(os.path.join(self.directory, name))
+        except OSError as e:
+            log.warning("Could not prune match history: %s", e)
+
+match_history = MatchHistory(HISTORY_DIR) if HISTORY_DIR else None
+
+def record_event(kind, format_key, topic_id=0, count=0, value=0.0):
+    """Append an event to the match history, if it is enabled."""
+    if match_history:
+        match_history.record(kind, format_key, topic_id, count, value)
+
+def topic_age(info):
+    """Seconds since a tracked topic was opened (0 if unknown)."""
+    return time.time() - info["created_at"] if info else 0.0
+
+# ============================================================
+# Core Logic
+# ============================================================
+
+def find_open_lobby(format_key, exclude=None):
+    """Return the oldest lobby for this format with a free seat, or None."""
+    for topic_id in lobby_index.lobbies(format_key):
+        info = active_lfg_topics.get(topic_id)
+        if topic_id != exclude and info and open_seats(info) > 0:
+            return topic_id
+    return None
+
+def seat_player(topic_id, username):
+    """
+    Seat a player in a lobby. Fails if the lobby has gone, is full, or is
+    being checked right now (its match may already be in progress).
+    Returns True if the player was seated.
+    """
+    with _topics_in_check_lock:
+        info = active_lfg_topics.get(topic_id)
+        if info is None or topic_id in _topics_in_check or open_seats(info) <= 0:
+            return False
+        info.setdefault("seated", []).append(username)
+        track_topic(topic_id, info)
+    queue_seat_update(topic_id, info)
+    return True
+
+def unseat_player(username, format_key, keep_topic_id):
+    """Release a matched player's seat in any other lobby of the same format."""
+    topic_id = lobby_index.lobby_for_user(username, format_key)
+    if topic_id is None or topic_id == keep_topic_id:
+        return
+    with _topics_in_check_lock:
+        info = active_lfg_topics.get(topic_id)
+        if info is None or topic_id in _topics_in_check or username not in info.get("seated", []):
+            return
+        info["seated"].remove(username)
+        track_topic(topic_id, info)
+    queue_seat_update(topic_id, info)
+    log.info("Released %s's seat in lobby %s — matched elsewhere", username, topic_id, extra={"topic_id": topic_id})
+
+def queue_seat_update(topic_id, info):
+    """Queue an edit of the lobby's post for its new seat count (background work)."""
+    outbox.enqueue(
+        "seat_update", f"seats:{topic_id}:{len(info.get('seated', []))}", {"topic_id": topic_id}, PRIORITY_LOW
+    )
+
+def open_lobby(requester_username, format_key, channel_id):
+    """
+    Create the LFG topic for a lobby reserved with lobby_index.reserve()
+    and start tracking it. Called without _topic_creation_lock, which is
+    only taken to swap the reservation for the tracked topic (or drop it
+    if creation failed). Returns the topic id or None.
+    """
+    result = {}
+    try:
+        result = create_lfg_topic(requester_username, format_key)
+    finally:
+        topic_id = result.get("topic_id")
+        with _topic_creation_lock:
+            if topic_id:
+                track_topic(topic_id, {
+                    "requester": requester_username,
+                    "format_key": format_key,
+                    "channel_id": channel_id,
+                    "post_id": result.get("id"),
+                    "seated": [],
+                    "created_at": time.time()
+                })
+            lobby_index.release(requester_username, format_key)
+    return topic_id
+
+def check_if_full(topic_id):
+    """Run the match check now if seating filled the lobby, instead of waiting for its next poll."""
+    info = active_lfg_topics.get(topic_id)
+    if info and open_seats(info) <= 0:
+        check_lfg_topic(topic_id, info)
+
+@profiled
+def notify_match(topic_id, all_players, format_key):
+    """
+    Queue the match notification for delivery by the outbox.
+    Taking a Convoke room and the group DM happen in deliver_match().
+    """
+    _, seat_count, _, convoke_format, label = LFG_FORMATS[format_key]
+    record_event("match", format_key, topic_id, len(all_players), topic_age(active_lfg_topics.get(topic_id)))
+    outbox.enqueue("match", f"match:{topic_id}", {
+        "players": all_players,
+        "format_key": format_key,
+        "label": label,
+        "seat_count": seat_count,
+        "convoke_format": convoke_format,
+    })
+
+def deliver_match(job):
+    """
+    Send a match notification to all players via a single group DM.
+    Uses a pre-created room from the pool if one is ready, otherwise
+    attempts Convoke room creation — falls back to lobby link on failure.
+    The room and group DM are checkpointed, so a retry never creates a
+    second room or channel.
+    """
+    payload = job["payload"]
+    label = payload["label"]
+    all_players = payload["players"]
+
+    if "room_url" not in payload:
+        room_url = room_pool.take(payload["format_key"]) if ROOM_POOL_ENABLED and "format_key" in payload else None
+        if room_url:
+            CONVOKE_ROOMS.inc(outcome="pool")
+        else:
+            room_url = create_convoke_room(label, payload["seat_count"], payload["convoke_format"])
+            CONVOKE_ROOMS.inc(outcome="room" if room_url else "lobby_fallback")
+        payload["room_url"] = room_url or ""
+        outbox.checkpoint(job)
+
+    room_url = payload["room_url"]
+    if room_url:
+        msg = (
+            f"✅ **Game found!** Your {label} game is ready.\n\n"
+            f"Join your Convoke room here:\n"
+            f"**{room_url}**\n\n"
+            f"Good luck and have fun! No Discord required."
+        )
+    else:
+        msg = (
+            f"✅ **Game found!** Your {label} game is ready.\n\n"
+            f"Convoke room creation failed — elect one person to set up manually:\n"
+            f"**{CONVOKE_LOBBY_URL}**\n\n"
+            f"Good luck and have fun! No Discord required."
+        )
+
+    if not payload.get("channel_id"):
+        open_job_channel(job, all_players)
+
+    send_to_job_channel(job, msg)
+    log.info(
+        "Match notification sent to group DM %s: %s", payload["channel_id"], all_players,
+        extra={"channel_id": payload["channel_id"], "format_key": payload.get("format_key")}
+    )
+
+def open_job_channel(job, usernames):
+    """
+    Open the DM channel a job sends to and checkpoint it. Discourse
+    refusing the channel with a 4xx (a player who does not accept DMs)
+    is permanent, so the job fails instead of retrying.
+    """
+    try:
+        if len(usernames) > 1:
+            channel_id = create_group_dm(usernames)
+        else:
+            channel_id = get_or_create_dm_channel(usernames[0])
+    except requests.HTTPError as e:
+        if is_channel_error(e):
+            raise UndeliverableError(f"DM channel with {usernames} refused: {e}") from e
+        raise
+    if not channel_id:
+        raise RuntimeError(f"could not open a DM channel with {usernames}")
+    job["payload"]["channel_id"] = channel_id
+    outbox.checkpoint(job)
+
+def send_to_job_channel(job, message):
+    """
+    Send to a job's checkpointed channel. If the channel refuses it, the
+    retry resolves a new one, once: a second refusal fails the job.
+    """
+    payload = job["payload"]
+    try:
+        send_chat_message(payload["channel_id"], message)
+    except requests.HTTPError as e:
+        if not is_channel_error(e):
+            raise
+        if payload.get("channel_refused"):
+            raise UndeliverableError(f"channel {payload['channel_id']} refused the message: {e}") from e
+        payload.pop("channel_id", None)
+        payload["channel_refused"] = True
+        outbox.checkpoint(job)
+        raise
+
+@profiled
+def notify_expiry(topic_id, all_players, label, voters, poll_threshold):
+    """
+    Queue an expiry notification to all involved players.
+    Uses a group DM if multiple players are present,
+    individual DM if only the requester remains.
+    """
+    msg = (
+        f"Unfortunately your {label} LFG post expired before it could fill "
+        f"({voters}/{poll_threshold} additional players joined). "
+        f"Feel free to try again anytime!"
+    )
+    info = active_lfg_topics.get(topic_id)
+    if info:
+        record_event("expiry", info["format_key"], topic_id, voters, topic_age(info))
+    outbox.enqueue("chat", f"expiry:{topic_id}", {"usernames": all_players, "message": msg})
+
+def deliver_chat(job):
+    """Send a message to one player (1:1 DM) or several (group DM)."""
+    payload = job["payload"]
+    usernames = payload["usernames"]
+    if not payload.get("channel_id"):
+        open_job_channel(job, usernames)
+    send_to_job_channel(job, payload["message"])
+    log.info("Outbox message %s sent to %s", job["key"], usernames, extra={"channel_id": payload["channel_id"]})
+
+def deliver_seat_update(job):
+    """Edit a lobby's post to list its seated players. The post is rendered from the lobby's state at delivery time."""
+    topic_id = job["payload"]["topic_id"]
+    info = active_lfg_topics.get(topic_id)
+    if not info or not info.get("post_id"):
+        return  # finished, or restored without a post id yet; nothing to show
+    try:
+        update_lfg_post(topic_id, info)
+    except requests.HTTPError as e:
+        if not is_gone(e):
+            raise
+
+def deliver_topic_deletion(job):
+    """Delete a finished LFG topic. A topic that is already gone counts as deleted."""
+    topic_id = job["payload"]["topic_id"]
+    try:
+        delete_topic(topic_id)
+    except requests.HTTPError as e:
+        if not is_gone(e):
+            raise
+    log.info("Deleted LFG topic %s", topic_id, extra={"topic_id": topic_id})
+
+OUTBOX_HANDLERS = {
+    "match": deliver_match,
+    "chat": deliver_chat,
+    "delete_topic": deliver_topic_deletion,
+    "seat_update": deliver_seat_update,
+}
+
+@profiled
+def handle_lfg_request(channel_id, requester_username, format_key):
+    """
+    Seat the requester in the oldest open lobby for the format, or open a
+    new lobby if every existing one is full, and confirm via chat DM.
+    """
+    _, seat_count, _, _, label = LFG_FORMATS[format_key]
+    fields = {"channel_id": channel_id, "format_key": format_key}
+    if defer_until_restored(channel_id, requester_username, format_key):
+        log.info("Deferred LFG request from %s until %s lobbies are restored", requester_username, label, extra=fields)
+        return
+    log.info("LFG request from %s for %s (channel %s)", requester_username, label, channel_id, extra=fields)
+    record_event("request", format_key)
+
+    reserved = already_opening = False
+    with _topic_creation_lock:
+        own_topic_id = lobby_index.lobby_for_user(requester_username, format_key)
+        held = lobby_index.lobbies_for_user(requester_username)
+        at_limit = not own_topic_id and lobby_index.held_count(requester_username) >= USER_MAX_LOBBIES
+        seated_topic_id = None
+        if not own_topic_id and not at_limit:
+            seated_topic_id = find_open_lobby(format_key)
+            if seated_topic_id and not seat_player(seated_topic_id, requester_username):
+                seated_topic_id = None
+            if not seated_topic_id:
+                reserved = lobby_index.reserve(requester_username, format_key)
+                already_opening = not reserved
+
+    topic_id = None
+    if reserved:
+        try:
+            topic_id = open_lobby(requester_username, format_key, channel_id)
+        except Exception as e:
+            log.error("Error creating LFG topic for %s: %s", requester_username, e, extra=fields)
+            send_chat_message(channel_id, "Sorry, something went wrong. Please try again.")
+            return
+
+    if already_opening:
+        log.info("%s's %s lobby is already being opened", requester_username, label, extra=fields)
+        send_chat_message(
+            channel_id, f"I'm already setting up your {label} lobby — I'll send you the link in a moment."
+        )
+        return
+
+    if own_topic_id:
+        log.info(
+            "%s is already in %s lobby %s", requester_username, label, own_topic_id,
+            extra={**fields, "topic_id": own_topic_id}
+        )
+        send_chat_message(
+            channel_id,
+            f"You're already in a {label} lobby:\n\n"
+            f"➡️ {DISCOURSE_URL}/t/{own_topic_id}\n\n"
+            f"I'll DM you as soon as the game fills."
+        )
+        return
 
-                try:
-                    delete_topic(topic_id)
-                    log.info(f"Deleted fulfilled LFG topic {topic_id}")
-                except Exception as e:
-                    log.error(f"Failed to delete topic {topic_id}: {e}")
+    if at_limit:
+        USER_MESSAGES_SHED.inc(reason="lobby_limit")
+        links = "\n".join(f"➡️ {DISCOURSE_URL}/t/{t}" for t in held.values())
+        send_chat_message(
+            channel_id,
+            f"You're already looking for {len(held)} games — that's the most I can hold for one player:\n\n"
+            f"{links}\n\n"
+            f"I'll DM you as soon as one fills."
+        )
+        return
 
-                stale_topics.append(topic_id)
+    if seated_topic_id:
+        info = active_lfg_topics.get(seated_topic_id, {})
+        players = seat_count - max(0, open_seats(info)) if info else seat_count
+        log.info(
+            "Seated %s in %s lobby %s", requester_username, label, seated_topic_id,
+            extra={**fields, "topic_id": seated_topic_id}
+        )
+        SEATED.inc(format=format_key, source="request")
+        record_event("seated", format_key, seated_topic_id, players, topic_age(info))
+        send_chat_message(
+            channel_id,
+            f"There's already a {label} game looking for players, so I've saved you a seat "
+            f"({players}/{seat_count} players):\n\n"
+            f"➡️ {DISCOURSE_URL}/t/{seated_topic_id}\n\n"
+            f"I'll DM you as soon as the game fills."
+        )
+        check_if_full(seated_topic_id)
+        return
 
-            elif now - created_at >= LFG_EXPIRY_SECONDS:
-                log.info(f"LFG topic {topic_id} expired with {voters}/{poll_threshold} poll votes")
+    if not topic_id:
+        log.error("Failed to create LFG topic for %s", requester_username, extra=fields)
+        send_chat_message(channel_id, "Sorry, I couldn't create your LFG post right now. Please try again in a moment.")
+        return
 
-                voter_usernames = get_poll_voters(topic_id, post_id) if post_id else []
-                all_players = list(set(voter_usernames + [requester]))
+    record_event("opened", format_key, topic_id, 1)
+    topic_url = f"{DISCOURSE_URL}/t/{topic_id}"
+    send_chat_message(
+        channel_id,
+        f"Your LFG post is live! ➡️ {topic_url}\n\n"
+        f"I'll DM you as soon as the game fills. "
+        f"If no one joins within 1 hour the post will be removed and I'll let you know."
+    )
+    log.info(
+        "Created LFG topic %s for %s (%s)", topic_id, requester_username, label,
+        extra={**fields, "topic_id": topic_id}
+    )
 
-                notify_expiry(all_players, label, voters, poll_threshold)
+HELP_MESSAGE = (
+    "Hi! I can help you find a PDH game on Convoke.\n\n"
+    "Send me one of these:\n"
+    "• **casual** — find a Casual PDH game (4 players)\n"
+    "• **comp** — find a Competitive PDH game (4 players)\n"
+    "• **1v1** — find a 1v1 PDH match (2 players)"
+)
 
-                try:
-                    delete_topic(topic_id)
-                    log.info(f"Deleted expired LFG topic {topic_id}")
-                except Exception as e:
-                    log.error(f"Failed to delete expired topic {topic_id}: {e}")
+def reply_to_duplicate_trigger(channel_id, username, format_key):
+    """
+    Tell a player who repeats a trigger within TRIGGER_COOLDOWN_SECONDS
+    where their request stands. The reply goes through the outbox at low
+    priority, at most once per player and format per cooldown window.
+    """
+    label = LFG_FORMATS[format_key][4]
+    topic_id = lobby_index.lobby_for_user(username, format_key)
+    if topic_id:
+        msg = (
+            f"You're already in a {label} lobby:\n\n"
+            f"➡️ {DISCOURSE_URL}/t/{topic_id}\n\n"
+            f"I'll DM you as soon as the game fills."
+        )
+    else:
+        msg = f"I've already got your {label} request — I'll send you the link in a moment."
+    window = int(time.time() // TRIGGER_COOLDOWN_SECONDS)
+    outbox.enqueue(
+        "chat", f"duplicate:{username}:{format_key}:{window}",
+        {"usernames": [username], "channel_id": channel_id, "message": msg}, PRIORITY_LOW
+    )
+
+def dispatch_lfg_request(channel_id, requester_username, format_key):
+    """
+    Run matchmaking for a trigger here if this worker is the leader,
+    otherwise hand it to the leader through the forwarded_requests table.
+    """
+    if coordinator.is_leader():
+        handle_lfg_request(channel_id, requester_username, format_key)
+        return
+    state_execute(
+        "INSERT INTO forwarded_requests (channel_id, username, format_key, created_at) VALUES (?, ?, ?, ?)",
+        (channel_id, requester_username, format_key, time.time())
+    )
+    log.info(
+        "Forwarded %s request from %s to the leader", format_key, requester_username,
+        extra={"channel_id": channel_id, "format_key": format_key}
+    )
+
+@profiled
+def process_forwarded_requests():
+    """
+    Handle triggers forwarded by follower workers, oldest first (leader
+    only). A trigger that fails stays queued and is retried on later
+    polls; after FORWARDED_REQUEST_MAX_ATTEMPTS the player is told to
+    try again, as for a trigger that fails on its own worker.
+    """
+    rows = state_query("SELECT id, channel_id, username, format_key, attempts FROM forwarded_requests ORDER BY id")
+    for row_id, channel_id, username, format_key, attempts in rows:
+        try:
+            with request_priority(PRIORITY_HIGH):
+                handle_lfg_request(channel_id, username, format_key)
+        except Exception as e:
+            attempts += 1
+            if attempts < FORWARDED_REQUEST_MAX_ATTEMPTS:
+                log.warning(
+                    "Error handling forwarded request from %s (attempt %d), will retry: %s", username, attempts, e,
+                    extra={"channel_id": channel_id, "format_key": format_key}
+                )
+                state_execute("UPDATE forwarded_requests SET attempts = ? WHERE id = ?", (attempts, row_id))
+                continue
+            log.error(
+                "Giving up on forwarded request from %s after %d attempts: %s", username, attempts, e,
+                extra={"channel_id": channel_id, "format_key": format_key}
+            )
+            send_chat_message(channel_id, "Sorry, something went wrong. Please try again.")
+        state_execute("DELETE FROM forwarded_requests WHERE id = ?", (row_id,))
+
+def prepare_channel(channel, channel_tracking):
+    """
+    Decide whether a channel from the channel list needs its messages fetched.
+    A channel gets a cursor the first time it has unread messages, with
+    its baseline taken from the list response (no extra API call).
+    Returns True if the channel has unread messages that should be
+    processed this cycle. Channels in another worker's shard are left alone.
+    """
+    channel_id = channel.get("id")
+    if not coordinator.owns_channel(channel_id):
+        return False
+    unread = channel_tracking.get(str(channel_id), {}).get("unread_count", 0)
+
+    if channel_id not in processed_message_ids:
+        if unread == 0:
+            return False
+
+        last_msg_id = (channel.get("last_message") or {}).get("id", 0)
+        last_read = (channel.get("current_user_membership") or {}).get("last_read_message_id")
+        set_cursor(channel_id, last_read or last_msg_id - unread)
+        log.info("Initialized channel %s with %s unread messages", channel_id, unread, extra={"channel_id": channel_id})
+        return True
+
+    return unread != 0
+
+@profiled
+def process_channel(channel_id):
+    """
+    Fetch a channel's messages newer than last_seen and handle each one,
+    then move the server-side read marker up to the last handled message.
+    The channel's shard is held for the whole pass, so it cannot be handed
+    to another worker halfway through.
+    """
+    with coordinator.hold_channel(channel_id) as owned:
+        if owned:
+            handle_channel_messages(channel_id)
+
+def handle_channel_messages(channel_id):
+    last_seen = processed_message_ids.get(channel_id, 0)
+
+    for msg in iter_new_messages(channel_id, last_seen):
+        msg_id = msg.get("id", 0)
+        if msg_id <= last_seen:
+            continue
+
+        sender = msg.get("user", {}).get("username")
+        if sender == DISCOURSE_BOT_USERNAME:
+            set_cursor(channel_id, max(last_seen, msg_id))
+            continue
+
+        text = msg.get("message", "").strip().lower()
+        set_cursor(channel_id, max(last_seen, msg_id))
 
-                stale_topics.append(topic_id)
+        log_sampled("New message in channel %s from %s: %r", channel_id, sender, text, extra={"channel_id": channel_id})
+
+        reason = user_index.screen(sender, text)
+        if reason:
+            USER_MESSAGES_SHED.inc(reason=reason)
+            if text in LFG_FORMATS:
+                log.info(
+                    "Dropped %s trigger from %s: %s", text, sender, reason,
+                    extra={"channel_id": channel_id, "format_key": text}
+                )
+                if reason == "duplicate_trigger":
+                    reply_to_duplicate_trigger(channel_id, sender, text)
+            continue
+
+        with request_priority(PRIORITY_HIGH):
+            if text in LFG_FORMATS:
+                dispatch_lfg_request(channel_id, sender, text)
+            else:
+                send_chat_message(channel_id, HELP_MESSAGE)
+
+    handled = processed_message_ids.get(channel_id, 0)
+    if handled > last_seen:
+        try:
+            mark_channel_read(channel_id, handled)
+        except Exception as e:
+            log.warning(
+                "Failed to mark channel %s read up to %s: %s", channel_id, handled, e, extra={"channel_id": channel_id}
+            )
+
+_last_eviction = time.time()
+
+def maybe_evict_dormant_channels():
+    global _last_eviction
+    if time.time() - _last_eviction >= DM_CHANNEL_EVICT_INTERVAL:
+        _last_eviction = time.time()
+        evict_dormant_channels()
+
+def check_dm_channels():
+    """
+    Check DM channels for new LFG trigger messages.
+
+    Scalability design:
+    - One conditional API call per cycle fetches the channel list; an
+      unchanged list is a 304, a changed one is parsed as it streams.
+    - Only channels that changed since the previous list or have unread
+      messages are looked at; the rest cost nothing beyond parsing.
+    - Channels with unread_count == 0 are skipped with no further API calls.
+    - A channel seen with unread messages for the first time takes its
+      baseline from the list response — no extra fetch needed — and is
+      processed immediately.
+    - Cursors of dormant channels are evicted every DM_CHANNEL_EVICT_INTERVAL.
+    - Result: idle state costs one API call per cycle regardless of user count.
+      Active state costs one fetch per page of new messages plus one read
+      marker update per channel with unread messages.
+    Returns the number of channels that had unread messages.
+    """
+    message_fetch_budget.reset()
+    maybe_evict_dormant_channels()
+    try:
+        channels, channel_tracking = get_dm_channel_data()
+    except CircuitOpenError:
+        return 0
+    except Exception as e:
+        log.error("Error checking DM channels: %s", e)
+        return 0
 
+    active = 0
+    for channel in channels:
+        channel_id = channel.get("id")
+        try:
+            if prepare_channel(channel, channel_tracking):
+                active += 1
+                process_channel(channel_id)
         except Exception as e:
-            log.error(f"Error checking LFG topic {topic_id}: {e}")
+            log.error("Error processing DM channel %s: %s", channel_id, e, extra={"channel_id": channel_id})
+    return active
+
+# Topics currently being checked, so overlapping passes (scheduled poll,
+# push event, expiry) never act on the same topic twice.
+_topics_in_check = set()
+_topics_in_check_lock = threading.Lock()
+
+@profiled
+def check_lfg_topic(topic_id, info, expired=False, poll_state=None):
+    """
+    Check one active LFG topic for a filled or expired poll and act on it.
+    expired is set when the topic's expiry timer has fired.
+    poll_state is a prefetched result from get_poll_states(); when omitted
+    the topic's poll is fetched here.
+    Finished topics are untracked; returns True if the topic finished.
+    """
+    with _topics_in_check_lock:
+        if topic_id not in active_lfg_topics:
+            return False
+        if topic_id in _topics_in_check:
+            if expired:
+                # the wheel already gave this expiry up; re-arm it for the next tick
+                expiry_wheel.add(topic_id, time.time())
+            return False
+        _topics_in_check.add(topic_id)
+    try:
+        finished = evaluate_lfg_topic(topic_id, info, expired, poll_state)
+        if finished:
+            untrack_topic(topic_id)
+        return finished
+    finally:
+        with _topics_in_check_lock:
+            _topics_in_check.discard(topic_id)
+
+@profiled
+def complete_match(topic_id, info, post_id):
+    """
+    Queue the match notification and topic deletion, untrack the topic,
+    and seat overflow voters in the next lobby. Returns False (topic stays open) if the lobby does
+    not actually hold seat_count distinct players, e.g. a seated player
+    also voted. A failed voter fetch raises, so the topic is retried.
+    """
+    requester = info["requester"]
+    format_key = info["format_key"]
+    _, seat_count, _, _, label = LFG_FORMATS[format_key]
+
+    voter_usernames = get_poll_voters(topic_id, post_id) if post_id else []
+    candidates = list(dict.fromkeys(lobby_members(info) + voter_usernames))
+    all_players = candidates[:seat_count]
+    overflow = candidates[seat_count:]
+    if len(all_players) < seat_count:
+        # members who also voted hold one seat, not two; open_seats() stops
+        # counting them twice until the votes change
+        info["voted_members"] = [u for u in lobby_members(info) if u in voter_usernames]
+        track_topic(topic_id, info)
+        log.info(
+            "Topic %s (%s) has %s/%s distinct players, waiting", topic_id, label, len(all_players), seat_count,
+            extra={"topic_id": topic_id, "format_key": format_key}
+        )
+        return False
+
+    time_to_match = time.time() - info["created_at"]
+    log.info(
+        "Match found! Topic %s (%s): %s", topic_id, label, all_players,
+        extra={"topic_id": topic_id, "format_key": format_key, "latency_ms": round(time_to_match * 1000)}
+    )
+    MATCHES.inc(format=format_key)
+    TIME_TO_MATCH.observe(time_to_match, format=format_key)
+
+    user_index.clear_triggers(all_players)
+    with state_transaction():
+        notify_match(topic_id, all_players, format_key)
+        outbox.enqueue("delete_topic", f"delete:{topic_id}", {"topic_id": topic_id}, PRIORITY_LOW)
+        untrack_topic(topic_id)
+
+    for username in all_players:
+        unseat_player(username, format_key, topic_id)
+
+    if overflow:
+        log.info(
+            "Overflow voters for topic %s: %s", topic_id, overflow,
+            extra={"topic_id": topic_id, "format_key": format_key}
+        )
+        record_event("overflow", format_key, topic_id, len(overflow))
+        seat_overflow(format_key, overflow, topic_id)
+    return True
+
+def seat_overflow(format_key, overflow, filled_topic_id):
+    """
+    Move voters who missed a filled lobby into the next lobby for the
+    format: the oldest one with a free seat, or a new lobby opened in the
+    player's name. The old "filled up" courtesy DM is only sent if
+    neither works.
+    """
+    label = LFG_FORMATS[format_key][4]
+    touched = set()
+    for username in overflow:
+        if lobby_index.lobby_for_user(username, format_key) not in (None, filled_topic_id):
+            continue  # already queued in another lobby
+
+        opened = False
+        with _topic_creation_lock:
+            topic_id = find_open_lobby(format_key, exclude=filled_topic_id)
+            if topic_id and not seat_player(topic_id, username):
+                topic_id = None
+            if not topic_id and not lobby_index.reserve(username, format_key):
+                continue  # a lobby is already being opened for them
+        if not topic_id:
+            try:
+                topic_id = open_lobby(username, format_key, None)
+                opened = True
+            except Exception as e:
+                log.error(
+                    "Failed to open a lobby for overflow voter %s: %s", username, e,
+                    extra={"format_key": format_key}
+                )
+                topic_id = None
+
+        if topic_id and opened:
+            msg = (
+                f"The {label} game you voted on filled up a moment before we could grab your "
+                f"spot, so I've started a new lobby for you:\n\n➡️ {DISCOURSE_URL}/t/{topic_id}\n\n"
+                f"I'll DM you as soon as it fills."
+            )
+            log.info(
+                "Opened lobby %s for overflow voter %s", topic_id, username,
+                extra={"topic_id": topic_id, "format_key": format_key}
+            )
+        elif topic_id:
+            msg = (
+                f"The {label} game you voted on filled up a moment before we could grab your "
+                f"spot, so I've moved you to the next lobby:\n\n➡️ {DISCOURSE_URL}/t/{topic_id}\n\n"
+                f"I'll DM you as soon as it fills."
+            )
+            SEATED.inc(format=format_key, source="overflow")
+            touched.add(topic_id)
+            log.info(
+                "Seated overflow voter %s in lobby %s", username, topic_id,
+                extra={"topic_id": topic_id, "format_key": format_key}
+            )
+        else:
+            user_index.clear_triggers([username])
+            msg = (
+                f"Sorry, the {label} game you voted on just filled up a moment before "
+                f"we could grab your spot! Feel free to send me **{format_key}** to start "
+                f"a new search anytime."
+            )
+
+        outbox.enqueue("chat", f"overflow:{filled_topic_id}:{username}", {"usernames": [username], "message": msg})
+
+    for topic_id in touched:
+        check_if_full(topic_id)
+
+@profiled
+def complete_expiry(topic_id, info, voters, post_id):
+    """Queue the expiry notification and topic deletion, and untrack the topic."""
+    requester = info["requester"]
+    _, _, poll_threshold, _, label = LFG_FORMATS[info["format_key"]]
+
+    voter_usernames = get_poll_voters(topic_id, post_id) if post_id else []
+    seated = info.get("seated", [])
+    log.info(
+        "LFG topic %s expired with %s/%s poll votes and %s seated", topic_id, voters, poll_threshold, len(seated),
+        extra={"topic_id": topic_id, "format_key": info["format_key"]}
+    )
+    EXPIRIES.inc(format=info["format_key"])
 
-    for topic_id in stale_topics:
-        active_lfg_topics.pop(topic_id, None)
+    all_players = list(dict.fromkeys([requester] + seated + voter_usernames))
+    user_index.clear_triggers(all_players)
+
+    with state_transaction():
+        notify_expiry(topic_id, all_players, label, voters + len(seated), poll_threshold)
+        outbox.enqueue("delete_topic", f"delete:{topic_id}", {"topic_id": topic_id})
+        untrack_topic(topic_id)
+
+def evaluate_lfg_topic(topic_id, info, expired, poll_state=None):
+    """
+    Poll a topic and run the match or expiry flow. Returns True if the topic is finished.
+    Match notifications are queued at high priority; expiry cleanup is
+    background work and yields to user-facing traffic.
+    """
+    try:
+        if poll_state is None:
+            poll_state = get_poll_state(topic_id, info.get("post_id"))
+        elif isinstance(poll_state, Exception):
+            raise poll_state
+        voters, is_closed, post_id = poll_state
+
+        if voters is None:
+            return True
+
+        if voters != (info.get("voters") or 0):
+            record_event("votes", info["format_key"], topic_id, voters, topic_age(info))
+        if (post_id and info.get("post_id") != post_id) or info.get("voters") != voters:
+            if info.get("voters") != voters:
+                info.pop("voted_members", None)
+            info["post_id"] = post_id
+            info["voters"] = voters
+            track_topic(topic_id, info)
+
+        if open_seats(info) <= 0:
+            with request_priority(PRIORITY_HIGH):
+                if complete_match(topic_id, info, post_id):
+                    return True
+
+        if expired:
+            with request_priority(PRIORITY_LOW):
+                complete_expiry(topic_id, info, voters, post_id)
+            return True
+
+        poll_scheduler.record_topic(topic_id, info, voters)
+
+    except Exception as e:
+        log.error("Error checking LFG topic %s: %s", topic_id, e, extra={"topic_id": topic_id})
+        # retry soon; an expiry that fired must not be lost to a transient error
+        poll_scheduler.schedule_topic(topic_id, SCHED_BASE_INTERVAL)
+        if expired:
+            expiry_wheel.add(topic_id, time.time() + SCHED_BASE_INTERVAL)
+
+    return False
+
+def check_active_lfg_topics(topic_ids=None):
+    """
+    Check active LFG topics for fulfilled or expired polls.
+    topic_ids limits the pass to specific topics (those due on the
+    scheduler, or flagged by a push event); by default every active topic
+    is checked. Topics whose expiry timer has fired are always included.
+    Nothing is checked while topic_checks_paused().
+    """
+    if topic_checks_paused():
+        return
+    expired = set(expiry_wheel.advance(time.time()))
+    topics = list(active_lfg_topics.items())
+    if topic_ids is not None:
+        topics = [(topic_id, info) for topic_id, info in topics if topic_id in topic_ids or topic_id in expired]
+    states = get_poll_states({topic_id: info.get("post_id") for topic_id, info in topics})
+    for topic_id, info in topics:
+        check_lfg_topic(topic_id, info, topic_id in expired, states[topic_id])
+
+# format_key -> set once the format's lobbies are restored (or need no restoring)
+restored_formats = {format_key: threading.Event() for format_key in LFG_FORMATS}
+for _event in restored_formats.values():
+    _event.set()
+
+# Triggers that arrived while their format was being restored:
+# format_key -> [(channel_id, username, priority)]. Formats whose
+# restoration outlasted RESTORE_WAIT_SECONDS are no longer deferred.
+_deferred_requests = {}
+_restore_wait_expired = set()
+_deferred_lock = threading.Lock()
 
 def restore_active_topics():
     """
-    On startup, reload existing LFG topics into memory.
-    Each restored topic receives a fresh 1-hour expiry window from
-    restart time since the original creation time is not persisted.
-    channel_id is unknown after restart and set to None.
+    Rebuild active topics by crawling the LFG categories, all in parallel
+    and following every page of each listing.
+    Only used when the state store is empty (first run or lost database);
+    normal restarts restore from the store via load_state().
     """
     log.info("Restoring active LFG topics from forum...")
-    for format_key, (category_id, _, _, _, label) in LFG_FORMATS.items():
-        try:
-            topics = get_lfg_topics(category_id)
-            for topic in topics:
+    with ThreadPoolExecutor(max_workers=len(LFG_FORMATS), thread_name_prefix="restore") as pool:
+        restored = sum(pool.map(restore_format, LFG_FORMATS))
+    log.info("Restored %s active LFG topics", restored)
+
+def restore_format(format_key):
+    """
+    Track every topic the bot opened in one format's category. created_at
+    comes from the listing, so a restored topic keeps its original expiry;
+    the requester, first post id and vote count come from the topic's first
+    post, so later polls use the conditional /posts/{id}.json request.
+    channel_id is unknown and set to None. Returns how many were restored.
+    """
+    category_id, _, _, _, label = LFG_FORMATS[format_key]
+    restored = 0
+    try:
+        with request_priority(PRIORITY_LOW):
+            for topic in iter_category_topics(category_id):
                 topic_id = topic.get("id")
-                title = topic.get("title", "")
-                if "—" in title:
-                    requester = title.split("—")[-1].strip()
-                    active_lfg_topics[topic_id] = {
+                if topic_id in active_lfg_topics or topic.get("closed"):
+                    continue
+                voters, _, post_id, data = get_poll_data(topic_id)
+                posts = data.get("post_stream", {}).get("posts", [])
+                requester = lfg_requester(posts[0]) if posts else None
+                if not requester or not post_id:
+                    log.warning(
+                        "Not restoring %s topic %s: its first post names no requester or has no poll",
+                        label, topic_id, extra={"topic_id": topic_id, "format_key": format_key}
+                    )
+                    continue
+                with _topic_creation_lock:
+                    track_topic(topic_id, {
                         "requester": requester,
                         "format_key": format_key,
                         "channel_id": None,
-                        "created_at": time.time()
-                    }
-                    log.info(f"  Restored {label} topic {topic_id} for {requester}")
+                        "post_id": post_id,
+                        "voters": voters or 0,
+                        "created_at": parse_timestamp(topic.get("created_at")) or time.time()
+                    })
+                restored += 1
+                log.info(
+                    "  Restored %s topic %s for %s", label, topic_id, requester,
+                    extra={"topic_id": topic_id, "format_key": format_key}
+                )
+    except Exception as e:
+        log.error("Error restoring %s topics: %s", label, e, extra={"format_key": format_key})
+    finally:
+        restored_formats[format_key].set()
+        release_deferred_requests(format_key)
+    return restored
+
+def defer_until_restored(channel_id, requester_username, format_key):
+    """
+    Set a trigger aside while its format's lobbies are still being
+    restored, so it can join one of them instead of opening a duplicate,
+    without holding up the thread that handles DMs. Returns True if the
+    request was deferred; it is handled by release_deferred_requests().
+    """
+    with _deferred_lock:
+        if restored_formats[format_key].is_set() or format_key in _restore_wait_expired:
+            return False
+        waiting = _deferred_requests.setdefault(format_key, [])
+        waiting.append((channel_id, requester_username, _request_priority.get()))
+        if len(waiting) == 1:
+            timer = threading.Timer(RESTORE_WAIT_SECONDS, release_deferred_requests, (format_key, True))
+            timer.daemon = True
+            timer.start()
+    return True
+
+def release_deferred_requests(format_key, timed_out=False):
+    """Handle the triggers deferred for a format, once it is restored or RESTORE_WAIT_SECONDS have passed."""
+    with _deferred_lock:
+        if timed_out and not restored_formats[format_key].is_set():
+            _restore_wait_expired.add(format_key)
+            log.warning("%s lobbies still restoring, handling requests without waiting", LFG_FORMATS[format_key][4])
+        waiting = _deferred_requests.pop(format_key, [])
+    for channel_id, username, priority in waiting:
+        try:
+            with request_priority(priority):
+                handle_lfg_request(channel_id, username, format_key)
+        except Exception as e:
+            log.error(
+                "Error handling deferred request from %s: %s", username, e,
+                extra={"channel_id": channel_id, "format_key": format_key}
+            )
+
+# ============================================================
+# Push Ingestion
+# ============================================================
+#
+# Webhook and MessageBus events never run matching logic themselves.
+# They flag the channel or topic that changed and wake the main loop,
+# which then runs process_channel / check_lfg_topic on just those
+# objects. The periodic full pass catches anything a push source missed.
+
+_pending_channels = set()
+_pending_topics = set()
+_pending_lock = threading.Lock()
+_wake_event = threading.Event()
+
+def mark_channel_dirty(channel_id):
+    with _pending_lock:
+        _pending_channels.add(channel_id)
+    _wake_event.set()
+
+def mark_topic_dirty(topic_id):
+    if topic_id not in active_lfg_topics:
+        return
+    with _pending_lock:
+        _pending_topics.add(topic_id)
+    _wake_event.set()
+
+def drain_pending_events():
+    """Return and clear the (channel_ids, topic_ids) flagged since the last drain."""
+    with _pending_lock:
+        channels = set(_pending_channels)
+        topics = set(_pending_topics)
+        _pending_channels.clear()
+        _pending_topics.clear()
+    return channels, topics
+
+def wait_for_events(timeout):
+    """Sleep until a push event arrives or the timeout elapses."""
+    _wake_event.wait(timeout)
+    _wake_event.clear()
+
+def process_pending_events():
+    """
+    Handle every channel and topic flagged by push events.
+    A channel the bot has never seen needs the channel list to set its
+    baseline, so any unknown channel triggers one full check_dm_channels().
+    """
+    channels, topics = drain_pending_events()
+    message_fetch_budget.reset()
+    channels = {c for c in channels if coordinator.owns_channel(c)}
+    if any(channel_id not in processed_message_ids for channel_id in channels):
+        check_dm_channels()
+        channels = {c for c in channels if c in processed_message_ids}
+    for channel_id in channels:
+        try:
+            process_channel(channel_id)
+        except Exception as e:
+            log.error("Error processing DM channel %s: %s", channel_id, e, extra={"channel_id": channel_id})
+    if topics:
+        check_active_lfg_topics(topic_ids=topics)
+
+def handle_webhook_event(event, payload):
+    """Flag the channel or topic referenced by a Discourse webhook payload."""
+    if event.startswith("chat_message"):
+        chat_message = payload.get("chat_message", {})
+        message = chat_message.get("message", chat_message)
+        if message.get("user", {}).get("username") == DISCOURSE_BOT_USERNAME:
+            return
+        channel_id = (
+            chat_message.get("channel", {}).get("id")
+            or message.get("chat_channel_id")
+            or chat_message.get("chat_channel_id")
+        )
+        if channel_id:
+            mark_channel_dirty(int(channel_id))
+    elif event.startswith("post_") or event.startswith("topic_"):
+        topic_id = payload.get("post", payload.get("topic", {})).get("topic_id") or payload.get("topic", {}).get("id")
+        if topic_id:
+            mark_topic_dirty(int(topic_id))
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Receives Discourse webhooks and verifies their HMAC signature."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        expected = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        if not WEBHOOK_SECRET or not hmac.compare_digest(expected, self.headers.get("X-Discourse-Event-Signature", "")):
+            self.send_response(403)
+            self.end_headers()
+            return
+        try:
+            handle_webhook_event(self.headers.get("X-Discourse-Event", ""), json.loads(body or b"{}"))
+        except (ValueError, AttributeError) as e:
+            log.error("Ignoring malformed webhook payload: %s", e)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_webhook_receiver():
+    if not WEBHOOK_SECRET:
+        log.error("Webhook receiver not started: LFG_WEBHOOK_SECRET is not set, so payloads could not be verified")
+        return None
+    try:
+        server = ThreadingHTTPServer((WEBHOOK_BIND_ADDRESS, WEBHOOK_PORT), WebhookHandler)
+    except OSError as e:
+        # another worker on this host already receives the webhooks
+        log.error("Could not start webhook receiver on port %s: %s", WEBHOOK_PORT, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="webhook-receiver", daemon=True).start()
+    log.info("Webhook receiver listening on %s:%s", WEBHOOK_BIND_ADDRESS, WEBHOOK_PORT)
+    return server
+
+def handle_messagebus_message(message):
+    """Flag the channel or topic referenced by a MessageBus message."""
+    channel = message.get("channel", "")
+    data = message.get("data") or {}
+    if channel == MESSAGEBUS_CHAT_CHANNEL:
+        if isinstance(data, dict) and data.get("username") != DISCOURSE_BOT_USERNAME and data.get("channel_id"):
+            mark_channel_dirty(int(data["channel_id"]))
+    elif channel.startswith("/polls/"):
+        topic_id = channel.rsplit("/", 1)[-1]
+        if topic_id.isdigit():
+            mark_topic_dirty(int(topic_id))
+
+def messagebus_loop():
+    """
+    Long-poll Discourse's MessageBus for new chat messages and poll votes.
+    The subscription set is rebuilt every poll so newly created topics are
+    picked up; a new channel starts at -1 (only messages from now on).
+    """
+    client_id = uuid.uuid4().hex
+    last_ids = {MESSAGEBUS_CHAT_CHANNEL: -1}
+    failures = 0
+    while True:
+        wanted = {MESSAGEBUS_CHAT_CHANNEL} | {f"/polls/{topic_id}" for topic_id in list(active_lfg_topics)}
+        last_ids = {channel: last_ids.get(channel, -1) for channel in wanted}
+        try:
+            r = discourse_request(
+                "POST", f"/message-bus/{client_id}/poll",
+                data=last_ids,
+                headers={"Content-Type": "application/x-www-form-urlencoded", "Dont-Chunk": "true"},
+                timeout=(HTTP_CONNECT_TIMEOUT, MESSAGEBUS_READ_TIMEOUT)
+            )
+            failures = 0
+            # subscribed to every active topic's votes: topic polls become a fallback
+            poll_scheduler.set_topic_floor(RECONCILE_INTERVAL_SECONDS)
+            for message in r.json():
+                channel = message.get("channel")
+                if channel == "/__status":
+                    # Server-side positions for channels we subscribed at -1
+                    last_ids.update({c: i for c, i in (message.get("data") or {}).items() if c in last_ids})
+                    continue
+                if channel in last_ids:
+                    last_ids[channel] = message.get("message_id", last_ids[channel])
+                handle_messagebus_message(message)
         except Exception as e:
-            log.error(f"Error restoring {label} topics: {e}")
+            failures += 1
+            if poll_scheduler.set_topic_floor(0):
+                _wake_event.set()  # votes are no longer pushed; poll topics at the normal cadence
+            delay = backoff_delay(min(failures, 6))
+            log.error("MessageBus poll failed (%s), retrying in %.1fs", e, delay)
+            time.sleep(delay)
+
+def start_push_ingestion():
+    """
+    Start the configured push sources. Returns True if any are running.
+    The MessageBus subscriber raises the topic floor itself while its
+    polls succeed.
+    """
+    running = False
+    if "webhook" in PUSH_SOURCES:
+        running = start_webhook_receiver() is not None
+    if "messagebus" in PUSH_SOURCES:
+        threading.Thread(target=messagebus_loop, name="messagebus", daemon=True).start()
+        log.info("MessageBus subscriber started")
+        running = True
+    unknown = PUSH_SOURCES - {"webhook", "messagebus"}
+    if unknown:
+        log.error("Unknown push sources ignored: %s", sorted(unknown))
+    return running
+
+# ============================================================
+# Coordination
+# ============================================================
+#
+# Several bot processes can run side by side. Each is a worker that
+# renews leases in a LeaseStore: member:<worker> while it is alive,
+# leader for whoever runs topic lifecycle, and shard:<n> for each slice
+# of DM channels (channel_id % SHARD_COUNT) it answers. Cursors are
+# written through to the shared state database, so a new shard owner
+# simply reloads them.
+
+LEASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    holder     TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+class LeaseStore(abc.ABC):
+    """
+    Interface for lease backends. A lease is held by at most one holder
+    until it expires; renewing is acquiring again as the same holder.
+    """
+
+    @abc.abstractmethod
+    def acquire(self, name, holder, ttl):
+        """Take or renew a lease. Returns True if holder now has it."""
+
+    @abc.abstractmethod
+    def release(self, name, holder):
+        """Give up a lease if holder still has it."""
+
+    @abc.abstractmethod
+    def holders(self, prefix):
+        """name -> holder for every unexpired lease whose name starts with prefix."""
+
+class SQLiteLeaseStore(LeaseStore):
+    """Leases in a SQLite table, shared by every worker on the host."""
+
+    def __init__(self, path=STATE_DB_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(LEASE_SCHEMA)
+        self._lock = threading.Lock()
+
+    def acquire(self, name, holder, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (name, holder, now + ttl, now)
+            )
+            row = self._conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == holder
+
+    def release(self, name, holder):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+    def holders(self, prefix):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, holder FROM leases WHERE name LIKE ? AND expires_at >= ?",
+                (prefix + "%", time.time())
+            ).fetchall()
+        return dict(rows)
+
+LEASE_BACKENDS = {
+    "sqlite": SQLiteLeaseStore,
+}
+
+class Coordinator:
+    """
+    Leader election and DM shard ownership for this worker.
+
+    Disabled (the default), this worker is the leader and owns every
+    channel. Once started, a background thread renews the worker's leases
+    every LEASE_RENEW_INTERVAL, tries for the leader lease, and balances
+    shards so each live worker holds at most ceil(SHARD_COUNT / workers):
+    a worker over its share releases shards, one under it takes free ones.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.worker_id = WORKER_ID
+        self.lost_leadership = False
+        self._store = None
+        self._leader = False
+        self._on_elected = None
+        self._shards = set()
+        self._shard_locks = [threading.Lock() for _ in range(SHARD_COUNT)]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_leader(self):
+        return not self.enabled or self._leader
+
+    def shard_of(self, channel_id):
+        return channel_id % SHARD_COUNT
+
+    def owns_channel(self, channel_id):
+        return not self.enabled or self.shard_of(channel_id) in self._shards
+
+    def shard_count(self):
+        return len(self._shards) if self.enabled else SHARD_COUNT
+
+    @contextmanager
+    def hold_channel(self, channel_id):
+        """Pin the channel's shard to this worker for the duration; yields whether it is owned."""
+        if not self.enabled:
+            yield True
+            return
+        with self._shard_locks[self.shard_of(channel_id)]:
+            yield self.owns_channel(channel_id)
+
+    def start(self, store, on_elected):
+        """Join the worker group. on_elected runs (on the coordinator thread) when this worker becomes leader."""
+        self.enabled = True
+        self._store = store
+        self._on_elected = on_elected
+        self.tick()
+        self._thread = threading.Thread(target=self._run, name="coordinator", daemon=True)
+        self._thread.start()
+        log.info("Worker %s joined (leader: %s, shards: %s)", self.worker_id, self._leader, sorted(self._shards))
+
+    def stop(self):
+        """Release every lease so other workers can take over at once."""
+        if not self.enabled:
+            return
+        self._stop.set()
+        for shard in list(self._shards):
+            self._drop_shard(shard)
+        if self._leader:
+            self._store.release("leader", self.worker_id)
+        self._store.release(f"member:{self.worker_id}", self.worker_id)
+        log.info("Worker %s released its leases", self.worker_id)
+
+    def _run(self):
+        while not self._stop.wait(LEASE_RENEW_INTERVAL):
+            try:
+                self.tick()
+            except Exception as e:
+                log.error("Coordination tick failed: %s", e)
+
+    def tick(self):
+        """Renew this worker's leases, contest leadership and rebalance shards."""
+        store, me = self._store, self.worker_id
+        store.acquire(f"member:{me}", me, LEASE_TTL_SECONDS)
+
+        # renew every lease before touching shard locks, which may be held by a long channel pass
+        is_leader = store.acquire("leader", me, LEASE_TTL_SECONDS) if not self.lost_leadership else False
+        lost = [s for s in list(self._shards) if not store.acquire(f"shard:{s}", me, LEASE_TTL_SECONDS)]
+
+        if self._leader and not is_leader:
+            log.error("Worker %s lost the leader lease; stopping", me)
+            self._leader = False
+            self.lost_leadership = True
+        elif is_leader and not self._leader:
+            log.info("Worker %s elected leader", me)
+            self._on_elected()
+            self._leader = True
+
+        for shard in lost:
+            log.warning("Worker %s lost shard %s to another worker", me, shard)
+            self._drop_shard(shard, release=False)
+
+        workers = len(set(store.holders("member:").values()) | {me})
+        share = math.ceil(SHARD_COUNT / workers)
+        while len(self._shards) > share:
+            self._drop_shard(max(self._shards))
+        taken = store.holders("shard:")
+        for shard in range(SHARD_COUNT):
+            if len(self._shards) >= share:
+                break
+            if shard not in self._shards and f"shard:{shard}" not in taken:
+                if store.acquire(f"shard:{shard}", me, LEASE_TTL_SECONDS):
+                    self._take_shard(shard)
+
+    def _take_shard(self, shard):
+        with self._shard_locks[shard]:
+            cursors = load_cursors(shard)
+            self._shards.add(shard)
+        log.info("Worker %s took shard %s (%s cursors)", self.worker_id, shard, cursors)
+
+    def _drop_shard(self, shard, release=True):
+        with self._shard_locks[shard]:
+            self._shards.discard(shard)
+            for channel_id in [c for c in list(processed_message_ids) if self.shard_of(c) == shard]:
+                del processed_message_ids[channel_id]
+            if release:
+                self._store.release(f"shard:{shard}", self.worker_id)
+        log.info("Worker %s handed off shard %s", self.worker_id, shard)
+
+coordinator = Coordinator()
+
+def become_leader():
+    """Take over topic lifecycle: load topics, outbox jobs and pooled rooms, and start their workers."""
+    topics, jobs, rooms = load_topic_state()
+    log.info("Leader loaded %s active topics, %s pending outbox jobs and %s pooled rooms", topics, jobs, rooms)
+    store_empty = not (topics or jobs or state_query("SELECT 1 FROM channel_cursors LIMIT 1"))
+    start_topic_lifecycle(store_empty)
+
+def start_topic_lifecycle(store_empty):
+    """
+    Start the outbox and room pool. With an empty state store, topics are
+    restored from the forum in the background while DMs are already being
+    answered; the sweeper starts only after that, so it never mistakes a
+    topic that is still being restored for an orphan.
+    """
+    outbox.start()
+    if ROOM_POOL_ENABLED:
+        room_pool.start()
+    if store_empty:
+        for event in restored_formats.values():
+            event.clear()
+        threading.Thread(target=restore_then_sweep, name="restore", daemon=True).start()
+    elif SWEEP_ENABLED:
+        sweeper.start()
+
+def restore_then_sweep():
+    restore_active_topics()
+    if SWEEP_ENABLED:
+        sweeper.start()
+
+def check_leadership():
+    """Exit if the leader lease was lost: another worker may already be acting on the same topics."""
+    if coordinator.lost_leadership:
+        raise SystemExit("lost the leader lease")
+
+# ============================================================
+# Async Engine
+# ============================================================
+#
+# The async engine reuses the same synchronous helpers; each unit of
+# network work runs in a worker thread via asyncio.to_thread, and a
+# shared semaphore bounds how many API calls are in flight at once.
+
+async def run_bounded(semaphore, func, *args):
+    async with semaphore:
+        return await asyncio.to_thread(func, *args)
+
+async def check_dm_channels_async(semaphore):
+    """Async counterpart of check_dm_channels: unread channels are fetched concurrently."""
+    message_fetch_budget.reset()
+    maybe_evict_dormant_channels()
+    try:
+        channels, channel_tracking = await run_bounded(semaphore, get_dm_channel_data)
+    except CircuitOpenError:
+        return 0
+    except Exception as e:
+        log.error("Error checking DM channels: %s", e)
+        return 0
+
+    # prepare_channel makes no API calls, so it runs inline
+    channel_ids = [c.get("id") for c in channels if prepare_channel(c, channel_tracking)]
+    results = await asyncio.gather(
+        *(run_bounded(semaphore, process_channel, channel_id) for channel_id in channel_ids),
+        return_exceptions=True
+    )
+    for channel_id, result in zip(channel_ids, results):
+        if isinstance(result, Exception):
+            log.error("Error processing DM channel %s: %s", channel_id, result, extra={"channel_id": channel_id})
+    return len(channel_ids)
+
+async def check_active_lfg_topics_async(semaphore, topic_ids=None):
+    """
+    Async counterpart of check_active_lfg_topics. Poll states are fetched
+    in one get_poll_states() batch (which bounds its own concurrency, so it
+    holds a single semaphore slot), then every topic is checked concurrently.
+    """
+    if topic_checks_paused():
+        return
+    expired = set(expiry_wheel.advance(time.time()))
+    topics = list(active_lfg_topics.items())
+    if topic_ids is not None:
+        topics = [(topic_id, info) for topic_id, info in topics if topic_id in topic_ids or topic_id in expired]
+    states = await run_bounded(semaphore, get_poll_states, {topic_id: info.get("post_id") for topic_id, info in topics})
+    await asyncio.gather(*(
+        run_bounded(semaphore, check_lfg_topic, topic_id, info, topic_id in expired, states[topic_id])
+        for topic_id, info in topics
+    ))
+
+async def process_pending_events_async(semaphore):
+    """Async counterpart of process_pending_events."""
+    channels, topics = drain_pending_events()
+    message_fetch_budget.reset()
+    channels = {c for c in channels if coordinator.owns_channel(c)}
+    if any(channel_id not in processed_message_ids for channel_id in channels):
+        await check_dm_channels_async(semaphore)
+        channels = {c for c in channels if c in processed_message_ids}
+    results = await asyncio.gather(
+        *(run_bounded(semaphore, process_channel, channel_id) for channel_id in channels),
+        return_exceptions=True
+    )
+    for channel_id, result in zip(channels, results):
+        if isinstance(result, Exception):
+            log.error("Error processing DM channel %s: %s", channel_id, result, extra={"channel_id": channel_id})
+    if topics:
+        await check_active_lfg_topics_async(semaphore, topic_ids=topics)
+
+async def dm_ingestion_loop(semaphore):
+    while True:
+        with CYCLE_DURATION.time(phase="check_dm_channels"), profile_cycle("check_dm_channels"):
+            active = await check_dm_channels_async(semaphore)
+        poll_scheduler.record_channels(active > 0)
+        await asyncio.sleep(max(0, poll_scheduler.channels_due_at - time.time()))
+
+async def topic_monitor_loop(semaphore):
+    # Wakes at least once a second: topics created by the DM coroutine and
+    # expiry timers are picked up without needing a cross-loop signal.
+    while True:
+        check_leadership()
+        if not coordinator.is_leader():
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            continue
+        if coordinator.enabled:
+            await asyncio.to_thread(process_forwarded_requests)
+        if topic_checks_paused():
+            await asyncio.sleep(1)
+            continue
+        due = poll_scheduler.pop_due_topics(time.time())
+        with CYCLE_DURATION.time(phase="check_active_lfg_topics"), profile_cycle("check_active_lfg_topics"):
+            await check_active_lfg_topics_async(semaphore, topic_ids=set(due))
+        deadlines = [d for d in (poll_scheduler.next_topic_deadline(), expiry_wheel.next_deadline()) if d]
+        await asyncio.sleep(min([1.0] + [max(0, d - time.time()) for d in deadlines]))
+
+async def push_event_loop(semaphore):
+    while True:
+        await asyncio.to_thread(wait_for_events, 1)
+        with CYCLE_DURATION.time(phase="process_pending_events"), profile_cycle("process_pending_events"):
+            await process_pending_events_async(semaphore)
+
+async def stats_loop():
+    while True:
+        await asyncio.sleep(HTTP_STATS_LOG_INTERVAL)
+        log_http_stats()
+        log_rate_limit_usage()
+        log_outbox_stats()
+
+async def async_main(push_enabled):
+    semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    loops = [
+        dm_ingestion_loop(semaphore),
+        topic_monitor_loop(semaphore),
+        stats_loop()
+    ]
+    if push_enabled:
+        loops.append(push_event_loop(semaphore))
+    await asyncio.gather(*loops)
 
 # ============================================================
 # Main Loop
 # ============================================================
 
+def run_cycle():
+    """
+    Run one pass of the synchronous engine: the channel list if its
+    deadline has passed, every topic that is due or has expired, and any
+    objects flagged by push events. Topics and forwarded requests are
+    only handled by the leader, and topics not while Discourse's circuit
+    breaker is open.
+    """
+    with profile_cycle("cycle"):
+        now = time.time()
+        if now >= poll_scheduler.channels_due_at:
+            with CYCLE_DURATION.time(phase="check_dm_channels"), span("check_dm_channels"):
+                active = check_dm_channels()
+            poll_scheduler.record_channels(active > 0)
+        if coordinator.is_leader():
+            if coordinator.enabled:
+                process_forwarded_requests()
+            if not topic_checks_paused():
+                with CYCLE_DURATION.time(phase="check_active_lfg_topics"), span("check_active_lfg_topics"):
+                    check_active_lfg_topics(topic_ids=set(poll_scheduler.pop_due_topics(now)))
+        with CYCLE_DURATION.time(phase="process_pending_events"), span("process_pending_events"):
+            process_pending_events()
+
 def main():
-    log.info("PDH Forum LFG Bot v2.3.0 starting...")
-    restore_active_topics()
-    log.info(f"Monitoring every {POLL_INTERVAL_SECONDS} seconds. Active topics: {len(active_lfg_topics)}")
+    configure_logging()
+    log.info("PDH Forum LFG Bot v2.27.0 starting...")
+    start_metrics_server()
+    if traffic_recorder:
+        log.info("Recording API traffic to %s", RECORD_FILE)
+    open_state_store()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: sampling_profiler.trigger())
+    # SIGTERM unwinds main(), so the finally below hands our leases over
+    # and the atexit hooks flush the match history
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if COORDINATION_ENABLED:
+        dm_cache.load()
+        coordinator.start(LEASE_BACKENDS[LEASE_BACKEND](), become_leader)
+    else:
+        start_topic_lifecycle(not load_state())
+    try:
+        run_engine()
+    finally:
+        coordinator.stop()
+
+def run_engine():
+    """Start push ingestion and run the sync or async engine until the process stops."""
+    push_enabled = start_push_ingestion()
+    if push_enabled:
+        poll_scheduler.channels_floor = RECONCILE_INTERVAL_SECONDS
+        poll_scheduler.channels_max_interval = SCHED_CHANNELS_PUSH_MAX_INTERVAL
+    log.info(
+        "Adaptive polling enabled (channel floor %ss). Active topics: %s",
+        poll_scheduler.channels_floor, len(active_lfg_topics)
+    )
+
+    if ASYNC_MODE:
+        log.info("Async engine enabled (concurrency %s)", ASYNC_CONCURRENCY)
+        asyncio.run(async_main(push_enabled))
+        return
 
+    last_stats_log = time.time()
     while True:
-        check_dm_channels()
-        check_active_lfg_topics()
-        time.sleep(POLL_INTERVAL_SECONDS)
+        check_leadership()
+        run_cycle()
+        if time.time() - last_stats_log >= HTTP_STATS_LOG_INTERVAL:
+            log_http_stats()
+            log_rate_limit_usage()
+            log_outbox_stats()
+            last_stats_log = time.time()
+        wait_for_events(max(0, next_wakeup() - time.time()))
 
 if __name__ == "__main__":
     main()
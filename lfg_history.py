@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Match-history analytics for the PDH Forum LFG bot.
+
+Reads the event store the bot appends to (LFG_HISTORY_DIR, see
+MatchHistory in lfg_bot.py) and reports, per format, what is needed to
+tune the polling cadence, the expiry window and Convoke capacity:
+
+  fill rate        matches / (matches + expiries)
+  time to match    percentiles of seconds from lobby creation to match
+  first vote       percentiles of lobby age when its poll first got a vote
+  expiry           expiries that had partial votes or seated players
+  hourly demand    requests, matches and fill rate per hour of day
+                   (averaged over the days covered), median time to match
+                   per hour, and the busiest single hour of matches
+
+Segments are flat arrays of fixed-size records, so each is loaded with
+one numpy.fromfile call and every statistic is a vectorised pass over
+the columns; millions of events take seconds. NumPy is required.
+
+Usage:
+  python3 lfg_history.py
+  python3 lfg_history.py --days 90 --format casual --utc-offset -5
+  python3 lfg_history.py --dir /var/lib/lfg_bot/history --days 0 --json
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"LFGHIST1"
+PERCENTILES = (50, 75, 90, 95, 99)
+DEFAULT_HEADER = {"record": "<dBBHIf", "fields": ["t", "kind", "format", "count", "topic_id", "value"]}
+STRUCT_TO_NUMPY = {"d": "f8", "f": "f4", "B": "u1", "H": "u2", "I": "u4", "Q": "u8"}
+
+Events = namedtuple("Events", "records formats kinds")
+
+# ============================================================
+# Reading
+# ============================================================
+
+def record_dtype(header):
+    """numpy dtype matching the segment's struct layout, e.g. "<dBBHIf"."""
+    layout = header["record"]
+    if layout[0] != "<":
+        raise ValueError(f"unsupported record layout {layout!r}")
+    return np.dtype([
+        (name, "<" + STRUCT_TO_NUMPY[code])
+        for name, code in zip(header["fields"], layout[1:])
+    ])
+
+def read_segment(path):
+    """Return (header, records) for one segment. A torn final record is dropped."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a match history segment")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+    dtype = record_dtype(header)
+    offset = len(MAGIC) + 4 + length
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    return header, np.fromfile(path, dtype=dtype, count=count, offset=offset)
+
+def code_map(names, known):
+    """Lookup table from a segment's codes to indexes in known (extended in place)."""
+    table = np.full(256, 255, dtype=np.uint8)
+    for code, name in enumerate(names):
+        if name not in known:
+            known.append(name)
+        table[code] = known.index(name)
+    return table
+
+def load_events(directory, since=None):
+    """
+    Load every segment in directory into one time-ordered record array.
+    Format and kind codes are remapped onto a shared list, so segments
+    written under different format configs can be combined.
+    """
+    formats, kinds, parts = [], [], []
+    first_day = time.strftime("%Y%m%d", time.gmtime(since)) if since else ""
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    for name in names:
+        if not (name.startswith("events-") and name.endswith(".lfgh")) or name[7:15] < first_day:
+            continue
+        header, records = read_segment(os.path.join(directory, name))
+        records["format"] = code_map(header["formats"], formats)[records["format"]]
+        records["kind"] = code_map(header["kinds"], kinds)[records["kind"]]
+        parts.append(records)
+    if not parts:
+        return Events(np.zeros(0, dtype=record_dtype(DEFAULT_HEADER)), formats, kinds)
+    records = np.concatenate(parts)
+    if since:
+        records = records[records["t"] >= since]
+    records = records[np.argsort(records["t"], kind="stable")]
+    return Events(records, formats, kinds)
+
+# ============================================================
+# Analysis
+# ============================================================
+
+def split_by_kind(events, records):
+    """kind -> that kind's records, still in time order (one stable sort instead of a mask per kind)."""
+    ordered = records[np.argsort(records["kind"], kind="stable")]
+    bounds = np.searchsorted(ordered["kind"], np.arange(len(events.kinds) + 1))
+    return {kind: ordered[bounds[code]:bounds[code + 1]] for code, kind in enumerate(events.kinds)}
+
+def percentiles(values):
+    if not len(values):
+        return {"n": 0}
+    stats = dict(zip((f"p{p}" for p in PERCENTILES), np.percentile(values, PERCENTILES)))
+    stats["mean"] = values.mean()
+    stats["n"] = len(values)
+    return stats
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+def hour_of_day(records, utc_offset):
+    return (np.floor(records["t"] / 3600 + utc_offset).astype(np.int64) % 24)
+
+def first_votes(votes):
+    """Lobby age at each lobby's first recorded vote (votes are in time order)."""
+    voted = votes[votes["count"] > 0]
+    _, first = np.unique(voted["topic_id"], return_index=True)
+    return voted["value"][first]
+
+def hourly_demand(by_kind, utc_offset, days):
+    requests, matches, expiries = by_kind["request"], by_kind["match"], by_kind["expiry"]
+    match_hours = hour_of_day(matches, utc_offset)
+    request_counts = np.bincount(hour_of_day(requests, utc_offset), minlength=24)
+    match_counts = np.bincount(match_hours, minlength=24)
+    expiry_counts = np.bincount(hour_of_day(expiries, utc_offset), minlength=24)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fill = match_counts / (match_counts + expiry_counts)
+    median_ttm = [
+        float(np.median(matches["value"][match_hours == hour])) if match_counts[hour] else None
+        for hour in range(24)
+    ]
+    return {
+        "requests_per_day": (request_counts / days).tolist(),
+        "matches_per_day": (match_counts / days).tolist(),
+        "fill_rate": [None if np.isnan(f) else float(f) for f in fill],
+        "median_time_to_match_s": median_ttm,
+    }
+
+def busiest_hour(matches):
+    """Most matches in any single clock hour: Convoke rooms needed at peak."""
+    if not len(matches):
+        return {"matches": 0, "at": None}
+    hours, counts = np.unique((matches["t"] // 3600).astype(np.int64), return_counts=True)
+    peak = counts.argmax()
+    return {"matches": int(counts[peak]), "at": time.strftime("%Y-%m-%d %H:00 UTC", time.gmtime(hours[peak] * 3600))}
+
+def analyze(events, utc_offset=0.0, format_keys=None):
+    """Per-format report over the loaded events (plus "all" when several formats are included)."""
+    records = events.records
+    if not len(records):
+        return {"events": 0, "formats": {}}
+    days = max(1, int(np.ceil((records["t"][-1] - records["t"][0]) / 86400)))
+    selected = [f for f in events.formats if not format_keys or f in format_keys]
+    groups = {f: records[records["format"] == events.formats.index(f)] for f in selected}
+    if len(groups) > 1:
+        codes = [events.formats.index(f) for f in selected]
+        groups["all"] = records[np.isin(records["format"], codes)]
+
+    empty = records[:0]
+    report = {}
+    for key, group in groups.items():
+        by_kind = split_by_kind(events, group)
+        for kind in ("request", "opened", "seated", "votes", "match", "expiry", "overflow"):
+            by_kind.setdefault(kind, empty)
+        matches, expiries = by_kind["match"], by_kind["expiry"]
+        report[key] = {
+            "requests": len(by_kind["request"]),
+            "lobbies_opened": len(by_kind["opened"]),
+            "seated_in_existing": len(by_kind["seated"]),
+            "matches": len(matches),
+            "expiries": len(expiries),
+            "overflow_voters": int(by_kind["overflow"]["count"].sum()),
+            "fill_rate": ratio(len(matches), len(matches) + len(expiries)),
+            "time_to_match_s": percentiles(matches["value"]),
+            "first_vote_s": percentiles(first_votes(by_kind["votes"])),
+            "expired_with_players": ratio(int((expiries["count"] > 0).sum()), len(expiries)),
+            "busiest_hour": busiest_hour(matches),
+            "hourly": hourly_demand(by_kind, utc_offset, days),
+        }
+    return {
+        "events": len(records),
+        "from": time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(records["t"][0])),
+        "to": time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(records["t"][-1])),
+        "days": days,
+        "utc_offset": utc_offset,
+        "formats": report,
+    }
+
+# ============================================================
+# Reporting
+# ============================================================
+
+def plain(value):
+    """Convert numpy scalars (and NaN) for json.dumps."""
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return None if np.isnan(value) else round(value, 3)
+    return value
+
+def fmt_stats(stats):
+    if not stats["n"]:
+        return "n=0"
+    return "  ".join(f"p{p} {stats[f'p{p}']:.0f}" for p in PERCENTILES) + f"  (n={stats['n']})"
+
+def fmt_ratio(value):
+    return "-" if value is None else f"{value:.1%}"
+
+def print_report(result):
+    if not result["events"]:
+        print("No events recorded in this range.")
+        return
+    print(f"{result['events']} events, {result['from']} to {result['to']} ({result['days']} days)")
+    for key, stats in result["formats"].items():
+        print(f"\n=== {key} ===")
+        print(
+            f"  requests {stats['requests']}, lobbies opened {stats['lobbies_opened']}, "
+            f"seated in an existing lobby {stats['seated_in_existing']}"
+        )
+        print(
+            f"  matches {stats['matches']}, expiries {stats['expiries']}, fill rate {fmt_ratio(stats['fill_rate'])}, "
+            f"overflow voters {stats['overflow_voters']}"
+        )
+        print(f"  time to match s: {fmt_stats(stats['time_to_match_s'])}")
+        print(f"  first vote s:    {fmt_stats(stats['first_vote_s'])}")
+        print(f"  expiries with votes or seated players: {fmt_ratio(stats['expired_with_players'])}")
+        peak = stats["busiest_hour"]
+        if peak["at"]:
+            print(f"  busiest hour: {peak['matches']} matches at {peak['at']}")
+        hourly = stats["hourly"]
+        print(f"  hour (UTC{result['utc_offset']:+g})  requests/day  matches/day  fill   median ttm s")
+        for hour in range(24):
+            median = hourly["median_time_to_match_s"][hour]
+            print(
+                f"  {hour:02d}:00      {hourly['requests_per_day'][hour]:12.1f}  {hourly['matches_per_day'][hour]:11.1f}  "
+                f"{fmt_ratio(hourly['fill_rate'][hour]):>5}  {'-' if median is None else f'{median:.0f}':>11}"
+            )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Capacity-planning report from the LFG bot's match history.")
+    parser.add_argument("--dir", default=os.environ.get("LFG_HISTORY_DIR", "/var/lib/lfg_bot/history"),
+                        help="history directory (LFG_HISTORY_DIR)")
+    parser.add_argument("--days", type=float, default=30, help="only the last N days (0 = everything)")
+    parser.add_argument("--format", action="append", dest="formats", help="limit to a format (repeatable)")
+    parser.add_argument("--utc-offset", type=float, default=0.0, help="hours added to UTC for the hourly curves")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if np is None:
+        sys.exit("lfg_history.py needs NumPy: pip install numpy")
+    since = time.time() - args.days * 86400 if args.days else None
+    result = analyze(load_events(args.dir, since), args.utc_offset, args.formats)
+    if args.json:
+        print(json.dumps(plain(result), indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Deterministic replay and load simulator for the PDH Forum LFG bot.
+
+Replays production traffic recorded by the bot (LFG_RECORD_FILE) without
+touching pdhforum.com or Convoke. The recording is reduced to what the
+players did — each DM they sent the bot and each vote they cast on an
+LFG poll, with its timestamp — and those inputs are fed to the
+in-memory fake forum from lfg_bench.py. The bot runs in-process against
+it with a virtual clock standing in for time.time() / time.sleep(), so
+an hour of traffic replays in seconds and every run of the same
+recording produces the same requests.
+
+Because the bot's own requests are generated afresh rather than
+replayed, a code change shows up directly as a change in requests per
+cycle and CPU per match.
+
+--amplify N adds N-1 synthetic copies of every recorded player, each
+acting out the original's DMs and votes shifted by up to --spread
+seconds, to project how the bot behaves at N times the real load.
+
+--faults replays production incidents as well: every recorded attempt
+(retries included) is matched, per route, to the replay's attempt on
+the same route closest to when it happened (RecordedFaults). A matched
+attempt takes its recorded latency on the virtual clock, and a recorded
+429, 5xx or dropped connection replaces the fake forum's answer, so
+retries, rate-limit backoff and the circuit breakers run as they did in
+production. Successful responses still come from the fake forum, which
+keeps them consistent with what the bot actually asked for.
+
+Usage:
+  LFG_RECORD_FILE=/var/lib/lfg_bot/traffic.jsonl.gz python3 lfg_bot.py   # record
+  python3 lfg_replay.py traffic.jsonl.gz
+  python3 lfg_replay.py traffic.jsonl.gz --amplify 20 --json
+  python3 lfg_replay.py traffic.jsonl.gz --faults
+
+Reported:
+  requests/cycle  API requests divided by bot cycles
+  requests/match  API requests divided by completed matches
+  CPU/match       bot CPU time divided by completed matches
+  time to match   p50/p95/max virtual seconds from topic creation to match
+"""
+
+import os
+import re
+import json
+import time
+import gzip
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import Counter, deque, namedtuple
+from urllib.parse import urlsplit
+
+import requests
+
+from lfg_bench import BOT_USERNAME, FakeForum, import_bot, record_cycle_phases, summarize
+
+Event = namedtuple("Event", "t kind username text")  # kind: "dm" (text) or "vote" (text = format_key)
+
+MIN_STEP = 0.1  # virtual seconds the clock always moves between cycles
+FAULT_WINDOW = 5.0  # seconds a recorded attempt may be matched before or after it happened
+
+RECORDED_EXCEPTIONS = {
+    "ConnectTimeout": requests.ConnectTimeout,
+    "ReadTimeout": requests.ReadTimeout,
+    "Timeout": requests.Timeout,
+    "ConnectionError": requests.ConnectionError,
+}
+
+# ============================================================
+# Recording
+# ============================================================
+
+def read_recording(path):
+    """Yield the entries of a recording written by the bot's TrafficRecorder."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # a torn last line from a crash
+
+def extract_events(entries, formats):
+    """
+    Reduce recorded traffic to player inputs.
+    DMs come from every message a player sent that showed up in a
+    channel-messages response, timed by its first appearance. Votes come
+    from the poll voter count of each LFG topic: every increase is one
+    vote per new voter, named from the topic's voter list where the
+    recording has it.
+    """
+    category_formats = {spec[0]: format_key for format_key, spec in formats.items()}
+    dms = {}              # message id -> Event
+    topic_format = {}     # topic id -> format_key
+    post_topic = {}       # post id -> topic id
+    vote_counts = {}      # topic id -> [(t, voters)]
+    voter_names = {}      # topic id -> usernames in vote order
+
+    for e in entries:
+        t, method, path, body = e.get("t"), e.get("m"), e.get("p", ""), e.get("r")
+        if not isinstance(body, dict):
+            continue
+
+        if method == "GET" and re.fullmatch(r"/chat/api/channels/\d+/messages", path):
+            for msg in body.get("messages", []):
+                username = (msg.get("user") or {}).get("username")
+                if username and username != BOT_USERNAME and msg.get("id") not in dms:
+                    dms[msg["id"]] = Event(t, "dm", username, msg.get("message", ""))
+
+        elif method == "POST" and path == "/posts.json" and body.get("topic_id"):
+            category = (e.get("b") or {}).get("category")
+            if category in category_formats:
+                topic_format[body["topic_id"]] = category_formats[category]
+            post_topic[body.get("id")] = body["topic_id"]
+
+        elif method == "GET" and re.fullmatch(r"/c/\d+\.json", path):
+            category = int(re.search(r"\d+", path).group())
+            for topic in body.get("topic_list", {}).get("topics", []):
+                if category in category_formats:
+                    topic_format.setdefault(topic.get("id"), category_formats[category])
+
+        elif method == "GET" and re.fullmatch(r"/posts/\d+\.json", path):
+            topic_id = body.get("topic_id") or post_topic.get(int(re.search(r"\d+", path).group()))
+            polls = body.get("polls") or []
+            if topic_id and polls:
+                vote_counts.setdefault(topic_id, []).append((t, polls[0].get("voters", 0)))
+
+        elif method == "GET" and re.fullmatch(r"/t/\d+\.json", path):
+            topic_id = int(re.search(r"\d+", path).group())
+            posts = body.get("post_stream", {}).get("posts", [])
+            polls = posts[0].get("polls", []) if posts else []
+            if polls:
+                vote_counts.setdefault(topic_id, []).append((t, polls[0].get("voters", 0)))
+
+        elif method == "GET" and path == "/polls/voters.json":
+            topic_id = int((e.get("q") or {}).get("topic_id", 0))
+            names = [v.get("username") for option in (body.get("voters") or {}).values() for v in option]
+            if len(names) > len(voter_names.get(topic_id, [])):
+                voter_names[topic_id] = names
+
+    events = list(dms.values())
+    for topic_id, counts in vote_counts.items():
+        format_key = topic_format.get(topic_id)
+        if format_key is None:
+            continue
+        names = voter_names.get(topic_id, [])
+        seen = 0
+        for t, voters in sorted(counts):
+            for i in range(seen, voters):
+                username = names[i] if i < len(names) else f"voter{topic_id}-{i}"
+                events.append(Event(t, "vote", username, format_key))
+            seen = max(seen, voters)
+    return sorted(events, key=lambda ev: ev.t)
+
+def amplify(events, factor, spread, seed):
+    """Add factor - 1 renamed copies of every player, each event shifted by up to +/- spread seconds."""
+    if factor <= 1 or not events:
+        return list(events)
+    rng = random.Random(seed)
+    start = events[0].t
+    copies = list(events)
+    for k in range(1, factor):
+        offsets = {}
+        for ev in events:
+            offset = offsets.setdefault(ev.username, rng.uniform(-spread, spread))
+            copies.append(ev._replace(t=max(start, ev.t + offset), username=f"{ev.username}~{k}"))
+    return sorted(copies, key=lambda ev: ev.t)
+
+# ============================================================
+# Virtual Clock and Transport
+# ============================================================
+
+class VirtualClock:
+    """
+    Stands in for the time module inside the bot. time(), monotonic()
+    and sleep() follow virtual time, which only moves when the replay
+    advances it (or a retry sleeps); everything else, such as
+    perf_counter() and process_time(), is the real clock.
+    sleep() on the replay's own thread moves the clock forward; on any
+    other thread (a circuit breaker's probe) it waits for the replay to
+    reach the wake-up time.
+    """
+
+    def __init__(self, now):
+        self.now = now
+        self._driver = threading.current_thread()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if threading.current_thread() is self._driver:
+            self.now += max(0.0, seconds)
+            return
+        until = self.now + seconds
+        while self.now < until:
+            time.sleep(0.001)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+class RecordedFaults:
+    """
+    Production outcomes per (service, method, route), from a recording.
+    take() matches the replay's attempts to recorded attempts in order:
+    recorded attempts more than FAULT_WINDOW seconds older than the
+    replay's are dropped, and the next one is used if it started within
+    FAULT_WINDOW. injected counts the failures handed out, by outcome.
+    """
+
+    def __init__(self, entries, route_key):
+        self.route_key = route_key
+        self.injected = Counter()
+        attempts = {}
+        for e in entries:
+            if "st" not in e or "t" not in e:
+                continue
+            latency = e.get("d", 0) / 1000
+            key = (e.get("s"), e.get("m"), route_key(e.get("p", "")))
+            attempts.setdefault(key, []).append((e["t"] - latency, e["st"], latency, e.get("h") or {}))
+        self._attempts = {key: deque(sorted(found, key=lambda a: a[0])) for key, found in attempts.items()}
+        self._lock = threading.Lock()
+
+    def take(self, service, method, path, now):
+        """The recorded (start, status, latency, headers) for an attempt at `now`, or None."""
+        with self._lock:
+            queue = self._attempts.get((service, method, self.route_key(path)))
+            while queue and queue[0][0] < now - FAULT_WINDOW:
+                queue.popleft()
+            if queue and queue[0][0] <= now + FAULT_WINDOW:
+                return queue.popleft()
+        return None
+
+class ReplaySession:
+    """
+    Stands in for a service's pooled requests.Session, so the bot's own
+    retries, rate limiting and circuit breaker run unchanged. Requests
+    are answered by the fake forum without sockets; with recorded faults,
+    a matched attempt first takes its recorded latency and, if it failed
+    in production, fails the same way.
+    """
+
+    def __init__(self, service, forum, clock, faults=None):
+        self.service = service
+        self.forum = forum
+        self.clock = clock
+        self.faults = faults
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        path = urlsplit(url).path
+        self.forum.count(method, path)
+        recorded = self.faults.take(self.service, method, path, self.clock.now) if self.faults else None
+        if recorded:
+            _, status, latency, headers = recorded
+            self.clock.sleep(latency)
+            if isinstance(status, str):
+                self.faults.injected[status] += 1
+                raise RECORDED_EXCEPTIONS.get(status, requests.ConnectionError)(f"recorded {status} on {path}")
+            if status == 429 or status >= 500:
+                self.faults.injected[str(status)] += 1
+                return self.response(url, status, b"{}", headers)
+
+        query = {k: [str(v)] for k, v in (kwargs.get("params") or {}).items()}
+        with self.forum.lock:
+            status, payload = self.forum.handle(method, path, query, kwargs.get("json") or {})
+        body = json.dumps(payload if payload is not None else {}).encode()
+        headers = {}
+        if method == "GET" and status == 200:
+            headers["ETag"] = f'W/"{hashlib.md5(body).hexdigest()}"'
+            if (kwargs.get("headers") or {}).get("If-None-Match") == headers["ETag"]:
+                status, body = 304, b""
+        return self.response(url, status, body, headers)
+
+    @staticmethod
+    def response(url, status, body, headers):
+        response = requests.Response()
+        response.url = url
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = body
+        response._content_consumed = True  # iter_content() serves the body above
+        return response
+
+# ============================================================
+# Replay
+# ============================================================
+
+def apply_event(forum, event, categories):
+    """Act out one player input. A voter who finds no open topic DMs the trigger instead."""
+    if event.kind == "vote":
+        topic_id = forum.oldest_topic(categories.get(event.text))
+        if topic_id and forum.vote(topic_id, event.username):
+            return
+        forum.user_send(event.username, event.text)
+    else:
+        forum.user_send(event.username, event.text)
+
+def run_replay(args):
+    workdir = tempfile.mkdtemp(prefix="lfg_replay_")
+    os.environ.pop("LFG_RECORD_FILE", None)  # never record the replay itself
+    bot = import_bot(workdir)
+
+    events = extract_events(read_recording(args.recording), bot.LFG_FORMATS)
+    if not events:
+        raise SystemExit(f"No player DMs or votes found in {args.recording}")
+    events = amplify(events, args.amplify, args.spread, args.seed)
+
+    clock = VirtualClock(events[0].t)
+    bot.time = clock
+    # objects that read the clock when created must be rebuilt on virtual time
+    bot.poll_scheduler = bot.PollScheduler()
+    bot.expiry_wheel = bot.TimerWheel()
+    bot.rate_limiters["discourse"] = bot.RateLimiter(10 ** 9, 10 ** 6, {})
+    bot.ROOM_POOL_ENABLED = False
+    bot.LFG_EXPIRY_SECONDS = args.expiry
+
+    forum = FakeForum(seed=args.seed)
+    faults = RecordedFaults(read_recording(args.recording), bot.route_key) if args.faults else None
+    sessions = {}
+    bot.get_session = lambda service: sessions.setdefault(service, ReplaySession(service, forum, clock, faults))
+    bot.open_state_store(os.environ["LFG_STATE_DB"])
+    phases = record_cycle_phases(bot)
+    match_times = []
+    observe = bot.TIME_TO_MATCH.observe
+
+    def recording_observe(value, **labels):
+        match_times.append(value)
+        observe(value, **labels)
+
+    bot.TIME_TO_MATCH.observe = recording_observe
+
+    categories = {format_key: spec[0] for format_key, spec in bot.LFG_FORMATS.items()}
+    pending = deque(events)
+    end = events[-1].t + args.tail
+    cycles = 0
+    cpu_start = time.process_time()
+    wall_start = time.time()
+    while clock.now <= end:
+        while pending and pending[0].t <= clock.now:
+            apply_event(forum, pending.popleft(), categories)
+        bot.run_cycle()
+        bot.outbox.run_due()
+        cycles += 1
+        if not pending and not bot.active_lfg_topics and not bot.outbox.pending():
+            break
+        wakeup = bot.next_wakeup()
+        if pending:
+            wakeup = min(wakeup, pending[0].t)
+        clock.now = max(wakeup, clock.now + MIN_STEP)
+    wall = time.time() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    virtual = clock.now - events[0].t
+    match_count = int(sum(bot.MATCHES._values.values()))
+    total_requests = forum.total_requests()
+    return {
+        "recording": args.recording,
+        "amplify": args.amplify,
+        "players": len({ev.username for ev in events}),
+        "events": len(events),
+        "virtual_seconds": round(virtual, 1),
+        "wall_seconds": round(wall, 2),
+        "speedup": round(virtual / wall, 1) if wall else None,
+        "cycles": cycles,
+        "bot_cpu_seconds": round(cpu, 2),
+        "matches": match_count,
+        "expiries": int(sum(bot.EXPIRIES._values.values())),
+        "requests": total_requests,
+        "requests_per_cycle": round(total_requests / cycles, 2) if cycles else None,
+        "requests_per_match": round(total_requests / match_count, 1) if match_count else None,
+        "cpu_ms_per_match": round(cpu / match_count * 1000, 1) if match_count else None,
+        "time_to_match_s": summarize(match_times),
+        "cycle_phase_ms": {phase: summarize(values, 1000) for phase, values in sorted(phases.items())},
+        "requests_by_route": dict(sorted(forum.requests.items(), key=lambda kv: -kv[1])),
+        "faults_injected": dict(faults.injected) if faults else None,
+        "breaker_trips": {labels[0]: int(n) for labels, n in bot.BREAKER_TRIPS._values.items()},
+    }
+
+# ============================================================
+# Reporting
+# ============================================================
+
+def print_report(result):
+    print(f"\n=== {result['recording']} x{result['amplify']} ===")
+    print(f"  {result['players']} players, {result['events']} DMs and votes")
+    print(
+        f"  virtual {result['virtual_seconds']}s in {result['wall_seconds']}s wall "
+        f"({result['speedup']}x), {result['cycles']} cycles, bot CPU {result['bot_cpu_seconds']}s"
+    )
+    print(f"  matches {result['matches']}, expiries {result['expiries']}")
+    if result["faults_injected"] is not None:
+        injected = ", ".join(f"{k} x{n}" for k, n in sorted(result["faults_injected"].items())) or "none"
+        trips = ", ".join(f"{k} x{n}" for k, n in result["breaker_trips"].items()) or "none"
+        print(f"  recorded faults replayed: {injected}; circuit breaker trips: {trips}")
+    print(
+        f"  requests {result['requests']}, per cycle {result['requests_per_cycle']}, "
+        f"per match {result['requests_per_match']}, CPU per match {result['cpu_ms_per_match']}ms"
+    )
+    ttm = result["time_to_match_s"]
+    print(f"  time to match s: p50 {ttm['p50']}  p95 {ttm['p95']}  max {ttm['max']}")
+    for phase, stats in result["cycle_phase_ms"].items():
+        print(f"  {phase:<24} ms: p50 {stats['p50']}  p95 {stats['p95']}  max {stats['max']}  (n={stats['n']})")
+    top = list(result["requests_by_route"].items())[:6]
+    print("  busiest routes: " + ", ".join(f"{route} x{count}" for route, count in top))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded LFG bot traffic against a fake forum.")
+    parser.add_argument("recording", help="traffic log written with LFG_RECORD_FILE (.jsonl or .jsonl.gz)")
+    parser.add_argument("--amplify", type=int, default=1, help="multiply the recorded players by this factor")
+    parser.add_argument("--spread", type=float, default=300,
+                        help="synthetic players act up to this many seconds before or after the original")
+    parser.add_argument("--expiry", type=float, default=3600, help="LFG_EXPIRY_SECONDS for the bot")
+    parser.add_argument("--tail", type=float, default=3660,
+                        help="virtual seconds to keep running after the last recorded input")
+    parser.add_argument("--faults", action="store_true",
+                        help="replay recorded latencies, 429s, 5xx and dropped connections per route")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    result = run_replay(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Offline tests for card_service.py against the fixture bulk file."""
+
+import os
+import sys
+import json
+import gzip
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import card_service
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cards.json")
+
+class CardIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        path = os.path.join(cls.tmp, "cards.idx")
+        cls.indexed = card_service.build_index(FIXTURE, path)
+        cls.index = card_service.CardIndex(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index.close()
+        shutil.rmtree(cls.tmp)
+
+    def name_of(self, query):
+        card = self.index.resolve(query)
+        return card and card.name
+
+    def test_tokens_are_not_indexed(self):
+        self.assertEqual(self.indexed, 7)
+        self.assertIsNone(self.index.exact("Goblin"))
+
+    def test_exact(self):
+        self.assertEqual(self.index.exact("Lightning Bolt").name, "Lightning Bolt")
+        self.assertEqual(self.index.exact("  lightning   BOLT ").name, "Lightning Bolt")
+        self.assertIsNone(self.index.exact("Lightning"))
+
+    def test_prefix(self):
+        self.assertEqual(self.name_of("lightning hel"), "Lightning Helix")
+        self.assertEqual(self.name_of("Lightning"), "Lightning Bolt")  # shortest name wins
+        self.assertEqual(self.name_of("Delver"), "Delver of Secrets // Insectile Aberration")
+
+    def test_fuzzy(self):
+        self.assertEqual(self.name_of("lightnig bolt"), "Lightning Bolt")
+        self.assertEqual(self.name_of("Bolas Citadel"), "Bolas's Citadel")
+        self.assertIsNone(self.name_of("Completely Unrelated Name"))
+
+    def test_split_card_faces(self):
+        self.assertEqual(self.name_of("Fire // Ice"), "Fire // Ice")
+        self.assertEqual(self.name_of("Fire"), "Fire // Ice")
+        self.assertEqual(self.name_of("ice"), "Fire // Ice")
+
+    def test_double_faced_card_faces(self):
+        card = self.index.resolve("Insectile Aberration")
+        self.assertEqual(card.name, "Delver of Secrets // Insectile Aberration")
+        self.assertIn("/front/", card.image_url)  # the front face's image
+
+    def test_accent_and_punctuation_folding(self):
+        self.assertEqual(self.name_of("Jotun Grunt"), "Jötun Grunt")
+        self.assertEqual(self.name_of("lim duls vault"), "Lim-Dûl's Vault")
+        self.assertEqual(self.name_of("Lim-Dûl’s Vault"), "Lim-Dûl's Vault")
+
+    def test_by_id(self):
+        card = self.index.by_id("e3285e6b-3e79-4d7c-bf96-d920f973b122")
+        self.assertEqual(card.name, "Lightning Bolt")
+        self.assertIsNone(self.index.by_id("not-a-uuid"))
+
+class BulkDataTest(unittest.TestCase):
+
+    def test_streams_across_chunk_boundaries(self):
+        with open(FIXTURE, encoding="utf-8") as f:
+            expected = json.load(f)
+        self.assertEqual(list(card_service.iter_bulk_cards(FIXTURE, chunk_size=7)), expected)
+
+    def test_gzipped_bulk_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cards.json.gz")
+            with open(FIXTURE, "rb") as src, gzip.open(path, "wb") as dest:
+                dest.write(src.read())
+            self.assertEqual(len(list(card_service.iter_bulk_cards(path))), 8)
+
+if __name__ == "__main__":
+    unittest.main()
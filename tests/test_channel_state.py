@@ -0,0 +1,181 @@
+"""The streaming channel-list parser, the compact cursor table and the DM channel cache."""
+
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lfg_bench import import_bot
+
+bot = import_bot(tempfile.mkdtemp())
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def read_all(stream):
+    """Rebuild the next value through items()/elements(), to exercise the pull API."""
+    char = stream._peek()
+    if char == "{":
+        return {key: read_all(stream) for key in stream.items()}
+    if char == "[":
+        return [read_all(stream) for _ in stream.elements()]
+    return stream.value()
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size):
+        return (self.body[i:i + chunk_size] for i in range(0, len(self.body), chunk_size))
+
+class JsonStreamTest(unittest.TestCase):
+
+    DOCUMENT = {
+        "escaped": "quote \" backslash \\ slash / tab \t unicode é 😀 brackets ]}",
+        "nested": [[1, [2, [3, {"deep": [[], {}]}]]], [], "]"],
+        "numbers": [0, -12, 3.25, 1e3, -2.5E-3, 12345678901234],
+        "literals": [True, False, None],
+        "empty": {},
+    }
+
+    def test_every_chunk_size(self):
+        text = json.dumps(self.DOCUMENT, indent=1)
+        for size in range(1, 12):
+            with self.subTest(size=size):
+                self.assertEqual(read_all(bot.JsonStream(chunked(text, size))), self.DOCUMENT)
+
+    def test_number_split_across_chunks(self):
+        stream = bot.JsonStream(["[12", "34, 5", ".5e", "1]"])
+        self.assertEqual(read_all(stream), [1234, 55.0])
+
+    def test_skip_steps_over_nested_values(self):
+        text = json.dumps({"skip": self.DOCUMENT, "keep": "yes"})
+        stream = bot.JsonStream(chunked(text, 5))
+        kept = {}
+        for key in stream.items():
+            if key == "keep":
+                kept[key] = stream.value()
+            else:
+                stream.skip()
+        self.assertEqual(kept, {"keep": "yes"})
+
+    def test_truncated_document_raises(self):
+        with self.assertRaises(ValueError):
+            read_all(bot.JsonStream(chunked('{"a": [1, 2', 3)))
+
+    def test_malformed_separator_raises(self):
+        with self.assertRaises(ValueError):
+            read_all(bot.JsonStream(['{"a": 1 "b": 2}']))
+
+class ChannelListTest(unittest.TestCase):
+
+    def test_channels_and_tracking_are_streamed_and_the_rest_skipped(self):
+        body = json.dumps({
+            "public_channels": [{"id": 1, "title": "ignored", "nested": [[{"x": "}"}]]}],
+            "direct_message_channels": [
+                {"id": 10, "last_message": {"id": 5}, "chatable": {"users": [{"username": "zoë"}]}},
+                {"id": 11, "last_message": {"id": 7}},
+            ],
+            "tracking": {
+                "thread_tracking": {"3": {"unread_count": 9}},
+                "channel_tracking": {"10": {"unread_count": 2}, "11": {"unread_count": 0}},
+            },
+        }, ensure_ascii=False).encode()
+        for size in (1, 2, 7, 64):  # 1 and 2 split the UTF-8 "ë"
+            with self.subTest(size=size), mock.patch.object(bot, "CHANNEL_LIST_CHUNK_SIZE", size):
+                items = list(bot.iter_channel_list(FakeResponse(body)))
+                self.assertEqual([item["id"] for kind, item in items if kind == "channel"], [10, 11])
+                self.assertEqual(items[0][1]["chatable"]["users"][0]["username"], "zoë")
+                self.assertEqual(
+                    [item for kind, item in items if kind == "tracking"],
+                    [("10", {"unread_count": 2}), ("11", {"unread_count": 0})]
+                )
+
+class CursorTableTest(unittest.TestCase):
+
+    def test_grows_in_channel_id_order(self):
+        table = bot.CursorTable()
+        for channel_id in (50, 10, 30, 20, 40):
+            table[channel_id] = channel_id * 2
+        self.assertEqual(list(table), [10, 20, 30, 40, 50])
+        self.assertEqual(len(table), 5)
+        table[30] = 99
+        self.assertEqual(table.get(30), 99)
+        self.assertEqual(len(table), 5)
+
+    def test_lookup_matches_a_dict(self):
+        rng = random.Random(7)
+        table, expected = bot.CursorTable(), {}
+        for _ in range(5000):
+            channel_id = rng.randrange(1, 2000)
+            if rng.random() < 0.2:
+                self.assertEqual(table.pop(channel_id), expected.pop(channel_id, None))
+            else:
+                expected[channel_id] = rng.randrange(1, 2 ** 40)
+                table[channel_id] = expected[channel_id]
+        self.assertEqual(list(table), sorted(expected))
+        for channel_id in range(2001):
+            self.assertEqual(channel_id in table, channel_id in expected)
+            self.assertEqual(table.get(channel_id, -1), expected.get(channel_id, -1))
+
+    def test_missing_keys(self):
+        table = bot.CursorTable()
+        self.assertIsNone(table.get(1))
+        self.assertEqual(table.pop(1, "gone"), "gone")
+        with self.assertRaises(KeyError):
+            del table[1]
+
+    def test_update_merges_and_replace_swaps(self):
+        table = bot.CursorTable()
+        table[1] = 10
+        table.update([(3, 30), (2, 20), (1, 11)])
+        self.assertEqual([(c, table.get(c)) for c in table], [(1, 11), (2, 20), (3, 30)])
+        table.replace([(9, 90)])
+        self.assertEqual(list(table), [9])
+
+    def test_dormant_entries(self):
+        table = bot.CursorTable()
+        with mock.patch.object(bot.time, "time", return_value=100.0):
+            table[1] = 1
+            table[2] = 2
+        with mock.patch.object(bot.time, "time", return_value=200.0):
+            table[2] = 3
+        self.assertEqual(table.dormant(150.0), [1])
+
+class DMChannelCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        bot.open_state_store(os.path.join(self.tmp, "state.db"))
+        self.addCleanup(self.close_store)
+
+    def close_store(self):
+        bot._state_db.close()
+        bot._state_db = None
+        shutil.rmtree(self.tmp)
+
+    def test_observe_writes_a_channel_list_in_one_transaction(self):
+        cache = bot.DMChannelCache()
+        channels = [{"id": i, "chatable": {"users": [{"username": f"player{i}"}]}} for i in range(1, 201)]
+        commits = []
+        execute = bot.state_execute
+
+        def counting_execute(sql, params=()):
+            commits.append(bot._state_db.in_transaction)
+            execute(sql, params)
+
+        with mock.patch.object(bot, "state_execute", counting_execute):
+            cache.observe(channels)
+        self.assertEqual(len(commits), 200)
+        self.assertTrue(all(commits))  # every write inside the one transaction
+        self.assertEqual(bot.state_query("SELECT COUNT(*) FROM dm_channels"), [(200,)])
+        self.assertEqual(cache.get(["player7"]), 7)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+"""Lobby index, seating and overflow, with topic creation and chat replies faked out."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lfg_bench import import_bot
+
+bot = import_bot(tempfile.mkdtemp())
+
+def casual_lobby(requester, seated=(), voters=0, **extra):
+    return {"requester": requester, "format_key": "casual", "channel_id": None, "post_id": None,
+            "seated": list(seated), "voters": voters, "created_at": bot.time.time(), **extra}
+
+class LobbyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        for topic_id in list(bot.active_lfg_topics):
+            bot.untrack_topic(topic_id)
+        self.patch(bot, "outbox", bot.Outbox())
+        self.patch(bot, "lobby_index", bot.LobbyIndex())
+        self.patch(bot, "user_index", bot.UserIndex())
+        self.created = []
+        self.replies = []
+        self.patch(bot, "create_lfg_topic", self.create_lfg_topic)
+        self.patch(bot, "send_chat_message", lambda channel_id, message: self.replies.append((channel_id, message)))
+        self.addCleanup(lambda: [bot.untrack_topic(t) for t in list(bot.active_lfg_topics)])
+
+    def patch(self, target, name, value):
+        patcher = mock.patch.object(target, name, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_lfg_topic(self, requester_username, format_key):
+        self.assertFalse(bot._topic_creation_lock.locked(), "topic created while holding the lobby lock")
+        self.created.append((requester_username, format_key))
+        topic_id = 100 + len(self.created)
+        return {"topic_id": topic_id, "id": topic_id * 10}
+
+    def last_reply(self):
+        return self.replies[-1][1]
+
+class LobbyIndexTest(LobbyTestCase):
+
+    def test_lobbies_in_creation_order_and_members_by_user(self):
+        bot.track_topic(1, casual_lobby("alice"))
+        bot.track_topic(2, casual_lobby("bob", seated=["carol"]))
+        self.assertEqual(bot.lobby_index.lobbies("casual"), [1, 2])
+        self.assertEqual(bot.lobby_index.lobby_for_user("carol", "casual"), 2)
+        self.assertEqual(bot.lobby_index.lobbies_for_user("bob"), {"casual": 2})
+
+    def test_reindexing_drops_unseated_members(self):
+        info = casual_lobby("alice", seated=["bob"])
+        bot.track_topic(1, info)
+        info["seated"] = []
+        bot.track_topic(1, info)
+        self.assertIsNone(bot.lobby_index.lobby_for_user("bob", "casual"))
+        bot.untrack_topic(1)
+        self.assertEqual(bot.lobby_index.lobbies("casual"), [])
+        self.assertEqual(bot.lobby_index.by_user, {})
+
+    def test_reservations_count_towards_held_lobbies(self):
+        bot.track_topic(1, casual_lobby("alice"))
+        self.assertTrue(bot.lobby_index.reserve("alice", "comp"))
+        self.assertFalse(bot.lobby_index.reserve("alice", "comp"))
+        self.assertEqual(bot.lobby_index.held_count("alice"), 2)
+        bot.lobby_index.release("alice", "comp")
+        self.assertEqual(bot.lobby_index.held_count("alice"), 1)
+        self.assertEqual(bot.lobby_index.opening, {})
+
+class SeatCountingTest(LobbyTestCase):
+
+    def test_open_seats_counts_seated_players_and_votes(self):
+        self.assertEqual(bot.open_seats(casual_lobby("alice", seated=["bob"], voters=1)), 1)
+
+    def test_seated_player_who_voted_counts_once(self):
+        info = casual_lobby("alice", seated=["bob"], voters=2, voted_members=["bob"])
+        self.assertEqual(bot.open_seats(info), 1)
+
+    def test_complete_match_waits_for_distinct_players(self):
+        info = casual_lobby("alice", seated=["bob"], voters=2, post_id=50)
+        bot.track_topic(1, info)
+        self.patch(bot, "get_poll_voters", lambda topic_id, post_id: ["bob", "carol"])
+        self.assertFalse(bot.complete_match(1, info, 50))
+        self.assertIn(1, bot.active_lfg_topics)
+        self.assertEqual(info["voted_members"], ["bob"])
+        self.assertEqual(bot.open_seats(info), 1)
+
+class RequestTest(LobbyTestCase):
+
+    def test_first_request_opens_a_lobby_and_the_next_is_seated(self):
+        bot.handle_lfg_request(7, "alice", "casual")
+        self.assertEqual(self.created, [("alice", "casual")])
+        self.assertEqual(bot.lobby_index.opening, {})
+        bot.handle_lfg_request(8, "bob", "casual")
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(bot.active_lfg_topics[101]["seated"], ["bob"])
+        self.assertIn("saved you a seat", self.last_reply())
+
+    def test_repeat_request_points_at_the_existing_lobby(self):
+        bot.handle_lfg_request(7, "alice", "casual")
+        bot.handle_lfg_request(7, "alice", "casual")
+        self.assertEqual(len(self.created), 1)
+        self.assertIn("already in a Casual", self.last_reply())
+
+    def test_per_user_lobby_limit(self):
+        bot.handle_lfg_request(7, "alice", "casual")
+        bot.handle_lfg_request(7, "alice", "comp")
+        bot.handle_lfg_request(7, "alice", "1v1")
+        self.assertEqual(len(self.created), bot.USER_MAX_LOBBIES)
+        self.assertIn("that's the most I can hold", self.last_reply())
+
+    def test_request_while_the_lobby_is_being_opened(self):
+        create = self.create_lfg_topic
+
+        def slow_create(requester_username, format_key):
+            bot.handle_lfg_request(7, requester_username, format_key)  # the same trigger again, mid-creation
+            return create(requester_username, format_key)
+
+        self.patch(bot, "create_lfg_topic", slow_create)
+        bot.handle_lfg_request(7, "alice", "casual")
+        self.assertEqual(len(self.created), 1)
+        self.assertTrue(any("already setting up" in message for _, message in self.replies))
+
+    def test_failed_creation_releases_the_reservation(self):
+        self.patch(bot, "create_lfg_topic", mock.Mock(side_effect=bot.requests.ConnectionError("down")))
+        bot.handle_lfg_request(7, "alice", "casual")
+        self.assertIn("something went wrong", self.last_reply())
+        self.assertEqual(bot.lobby_index.held_count("alice"), 0)
+
+class DuplicateTriggerTest(LobbyTestCase):
+
+    def chat_jobs(self):
+        return [job for job in bot.outbox._jobs.values() if job["kind"] == "chat"]
+
+    def test_repeated_trigger_is_answered_once_at_low_priority(self):
+        dispatched = []
+        messages = [{"id": i, "message": "casual", "user": {"username": "alice"}} for i in (1, 2, 3)]
+        self.patch(bot, "user_index", bot.UserIndex())
+        self.patch(bot, "processed_message_ids", bot.CursorTable())
+        self.patch(bot, "iter_new_messages", lambda channel_id, after_id: iter(messages))
+        self.patch(bot, "mark_channel_read", lambda channel_id, message_id: None)
+        self.patch(bot, "dispatch_lfg_request", lambda *args: dispatched.append(args))
+        with self.assertLogs(bot.log, "INFO") as logs:
+            bot.handle_channel_messages(7)
+        self.assertEqual(dispatched, [(7, "alice", "casual")])
+        self.assertTrue(any("Dropped casual trigger from alice" in line for line in logs.output))
+        jobs = self.chat_jobs()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]["priority"], bot.PRIORITY_LOW)
+        self.assertEqual(jobs[0]["payload"]["channel_id"], 7)
+        self.assertIn("already got your Casual", jobs[0]["payload"]["message"])
+
+    def test_reply_links_the_lobby_the_player_is_in(self):
+        bot.handle_lfg_request(7, "alice", "casual")
+        bot.reply_to_duplicate_trigger(7, "alice", "casual")
+        self.assertIn(f"{bot.DISCOURSE_URL}/t/101", self.chat_jobs()[0]["payload"]["message"])
+
+class OverflowTest(LobbyTestCase):
+
+    def overflow_messages(self):
+        return {job["key"]: job["payload"]["message"] for job in bot.outbox._jobs.values() if job["kind"] == "chat"}
+
+    def test_overflow_voter_gets_a_new_lobby(self):
+        bot.track_topic(1, casual_lobby("alice", voters=3))
+        bot.seat_overflow("casual", ["dave"], 1)
+        self.assertEqual(self.created, [("dave", "casual")])
+        self.assertEqual(bot.active_lfg_topics[101]["requester"], "dave")
+        self.assertIn("started a new lobby", self.overflow_messages()["overflow:1:dave"])
+
+    def test_overflow_voter_is_seated_in_an_open_lobby(self):
+        bot.track_topic(1, casual_lobby("alice", voters=3))
+        bot.track_topic(2, casual_lobby("bob"))
+        bot.seat_overflow("casual", ["dave"], 1)
+        self.assertEqual(self.created, [])
+        self.assertEqual(bot.active_lfg_topics[2]["seated"], ["dave"])
+        self.assertIn("moved you to the next lobby", self.overflow_messages()["overflow:1:dave"])
+
+    def test_overflow_voter_already_in_another_lobby_is_left_alone(self):
+        bot.track_topic(1, casual_lobby("alice", voters=3))
+        bot.track_topic(2, casual_lobby("dave"))
+        bot.seat_overflow("casual", ["dave"], 1)
+        self.assertEqual(self.created, [])
+        self.assertEqual(self.overflow_messages(), {})
+
+class RestoreTest(LobbyTestCase):
+
+    def listing(self, *topics):
+        return {
+            "users": [{"id": 1, "username": bot.DISCOURSE_BOT_USERNAME}],
+            "topic_list": {"topics": [
+                {"id": topic_id, "title": title, "created_at": "2026-01-01T00:00:00Z",
+                 "posters": [{"user_id": 1, "description": "Original Poster"}]}
+                for topic_id, title in topics
+            ]},
+        }
+
+    def topic(self, post_id, cooked, voters=0):
+        return {"post_stream": {"posts": [
+            {"id": post_id, "cooked": cooked, "polls": [{"status": "open", "voters": voters}]}
+        ]}}
+
+    def test_requester_and_first_post_come_from_the_first_post(self):
+        pages = {
+            "/c/10.json": self.listing((1, "Casual game tonight"), (2, "Looking for a Casual Game — alice")),
+            "/t/1.json": self.topic(11, '<p><a class="mention" href="/u/bob.smith">@bob.smith</a> is looking', 2),
+            "/t/2.json": self.topic(21, "<p>No mention here</p>"),
+        }
+        self.patch(bot, "LFG_FORMATS", {"casual": (10,) + bot.LFG_FORMATS["casual"][1:]})
+        self.patch(bot, "restored_formats", {"casual": bot.threading.Event()})
+        self.patch(bot, "discourse_get", lambda path, params=None: pages[path])
+        self.assertEqual(bot.restore_format("casual"), 1)
+        info = bot.active_lfg_topics[1]
+        self.assertEqual((info["requester"], info["post_id"], info["voters"]), ("bob.smith", 11, 2))
+        self.assertNotIn(2, bot.active_lfg_topics)
+
+    def test_requester_from_raw_post_body(self):
+        self.assertEqual(bot.lfg_requester({"raw": bot.lfg_post_body("zoë_1", "casual")}), "zoë_1")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Outbox jobs queued inside a state transaction are delivered only if it commits."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lfg_bench import import_bot
+
+bot = import_bot(tempfile.mkdtemp())
+
+class OutboxTransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        bot.open_state_store(os.path.join(self.tmp, "state.db"))
+        self.addCleanup(self.close_store)
+        self.delivered = []
+        handlers = mock.patch.dict(bot.OUTBOX_HANDLERS, {"test": lambda job: self.delivered.append(job["key"])})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+        self.outbox = bot.Outbox()
+
+    def close_store(self):
+        bot._state_db.close()
+        bot._state_db = None
+        shutil.rmtree(self.tmp)
+
+    def rows(self):
+        return bot.state_query("SELECT dedupe_key, status FROM outbox")
+
+    def test_committed_job_is_delivered(self):
+        with bot.state_transaction():
+            self.outbox.enqueue("test", "job:1", {})
+            self.outbox.run_due()
+            self.assertEqual(self.delivered, [])  # not visible before the commit
+        self.outbox.run_due()
+        self.assertEqual(self.delivered, ["job:1"])
+        self.assertEqual(self.rows(), [("job:1", "delivered")])
+
+    def test_rolled_back_job_is_never_delivered(self):
+        with self.assertRaises(RuntimeError):
+            with bot.state_transaction():
+                self.outbox.enqueue("test", "job:1", {})
+                raise RuntimeError("a later write in the transaction failed")
+        self.outbox.run_due()
+        self.assertEqual(self.delivered, [])
+        self.assertEqual(self.outbox.pending(), 0)
+        self.assertEqual(self.rows(), [])
+
+    def test_rolled_back_key_can_be_queued_again(self):
+        with self.assertRaises(RuntimeError):
+            with bot.state_transaction():
+                self.outbox.enqueue("test", "job:1", {})
+                raise RuntimeError("rolled back")
+        self.assertTrue(self.outbox.enqueue("test", "job:1", {}))
+        self.outbox.run_due()
+        self.assertEqual(self.delivered, ["job:1"])
+
+    def test_enqueue_outside_a_transaction_is_delivered_at_once(self):
+        self.outbox.enqueue("test", "job:1", {})
+        self.outbox.run_due()
+        self.assertEqual(self.delivered, ["job:1"])
+
+if __name__ == "__main__":
+    unittest.main()
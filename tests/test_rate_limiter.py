@@ -0,0 +1,34 @@
+"""RateLimiter headroom as seen by load shedding."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lfg_bench import import_bot
+
+bot = import_bot(tempfile.mkdtemp())
+
+class HeadroomTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = bot.RateLimiter(60, 10, {})
+        patcher = mock.patch.dict(bot.rate_limiters, {"discourse": self.limiter})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_headroom_follows_spent_tokens(self):
+        self.assertAlmostEqual(bot.rate_limit_headroom(), 1.0, places=2)
+        for _ in range(4):
+            self.limiter.acquire("/posts.json")
+        self.assertAlmostEqual(bot.rate_limit_headroom(), 0.6, places=2)
+
+    def test_no_headroom_during_a_retry_after_pause(self):
+        self.limiter.block_for(30)
+        self.assertEqual(bot.rate_limit_headroom(), 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""TimerWheel: slot wrap-around, re-adding, cancelling and deadlines past one revolution."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lfg_bench import import_bot
+
+bot = import_bot(tempfile.mkdtemp())
+
+TICK = 10
+SLOTS = 8
+START = 1000 * TICK  # tick 1000, a multiple of SLOTS, so slot 0 is the current tick
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        with mock.patch.object(bot.time, "time", return_value=START):
+            self.wheel = bot.TimerWheel(tick=TICK, slots=SLOTS)
+
+    def fired_by_tick(self, last_tick):
+        """Advance one tick at a time; return item -> the tick whose advance fired it."""
+        fired = {}
+        for t in range(1000, last_tick + 1):
+            for item in self.wheel.advance(t * TICK):
+                fired[item] = t
+        return fired
+
+    def test_fires_once_its_tick_completes(self):
+        self.wheel.add("a", START + 3 * TICK + 1)  # tick 1003
+        self.assertEqual(self.wheel.advance(START + 3 * TICK + 5), [])
+        self.assertEqual(self.wheel.next_deadline(), START + 4 * TICK)
+        self.assertEqual(self.wheel.advance(START + 4 * TICK), ["a"])
+        self.assertIsNone(self.wheel.next_deadline())
+
+    def test_wraps_around_the_slots(self):
+        # ticks 1006..1011 use slots 6, 7, 0, 1, 2, 3
+        for offset in range(6, 12):
+            self.wheel.add(offset, START + offset * TICK)
+        fired = self.fired_by_tick(1020)
+        self.assertEqual(fired, {offset: 1000 + offset + 1 for offset in range(6, 12)})
+
+    def test_deadline_beyond_one_revolution_waits_for_its_round(self):
+        self.wheel.add("near", START + 2 * TICK)              # tick 1002, slot 2
+        self.wheel.add("far", START + (2 + 2 * SLOTS) * TICK)  # tick 1018, also slot 2
+        self.assertEqual(self.wheel.next_deadline(), START + 3 * TICK)
+        fired = self.fired_by_tick(1030)
+        self.assertEqual(fired, {"near": 1003, "far": 1019})
+
+    def test_next_deadline_beyond_one_revolution(self):
+        self.wheel.add("far", START + 3 * SLOTS * TICK)
+        self.assertEqual(self.wheel.next_deadline(), START + (3 * SLOTS + 1) * TICK)
+
+    def test_long_gap_between_advances_fires_everything_due(self):
+        self.wheel.add("a", START + 1 * TICK)
+        self.wheel.add("b", START + 5 * TICK)
+        self.wheel.add("c", START + 40 * TICK)
+        self.assertEqual(sorted(self.wheel.advance(START + 30 * TICK)), ["a", "b"])
+        self.assertEqual(self.wheel.advance(START + 41 * TICK), ["c"])
+
+    def test_readding_with_a_later_deadline_moves_the_item(self):
+        self.wheel.add("a", START + 2 * TICK)
+        self.wheel.add("a", START + 5 * TICK)
+        self.assertEqual(self.fired_by_tick(1010), {"a": 1006})
+
+    def test_readding_with_a_later_round_of_the_same_slot(self):
+        self.wheel.add("a", START + 2 * TICK)
+        self.wheel.add("a", START + (2 + SLOTS) * TICK)
+        self.assertEqual(self.fired_by_tick(1020), {"a": 1000 + 2 + SLOTS + 1})
+
+    def test_cancelled_item_never_fires(self):
+        self.wheel.add("a", START + 2 * TICK)
+        self.wheel.add("b", START + 2 * TICK)
+        self.wheel.cancel("a")
+        self.wheel.cancel("missing")
+        self.assertEqual(self.fired_by_tick(1010), {"b": 1003})
+
+    def test_deadline_in_a_processed_tick_fires_on_the_next_advance(self):
+        self.wheel.advance(START + 5 * TICK)
+        self.wheel.add("late", START + TICK)
+        self.assertEqual(self.wheel.advance(START + 5 * TICK), [])
+        self.assertEqual(self.wheel.advance(START + 6 * TICK), ["late"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Both engines fetch poll state for a pass in one get_poll_states() batch."""
+
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lfg_bench import import_bot
+
+bot = import_bot(tempfile.mkdtemp())
+
+class TopicCheckBatchingTest(unittest.TestCase):
+
+    def setUp(self):
+        topics = {1: {"post_id": 10}, 2: {"post_id": None}, 3: {"post_id": 30}}
+        self.batches = []
+        self.checked = []
+        for name, value in (
+            ("active_lfg_topics", topics),
+            ("expiry_wheel", bot.TimerWheel()),
+            ("get_poll_states", self.get_poll_states),
+            ("get_poll_state", mock.Mock(side_effect=AssertionError("fetched outside the batch"))),
+            ("check_lfg_topic", lambda topic_id, info, expired, state: self.checked.append((topic_id, state))),
+        ):
+            patcher = mock.patch.object(bot, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_poll_states(self, topic_posts):
+        self.batches.append(dict(topic_posts))
+        return {topic_id: (0, False, post_id) for topic_id, post_id in topic_posts.items()}
+
+    def test_sync_pass(self):
+        bot.check_active_lfg_topics(topic_ids={1, 2})
+        self.assertEqual(self.batches, [{1: 10, 2: None}])
+        self.assertEqual(sorted(self.checked), [(1, (0, False, 10)), (2, (0, False, None))])
+
+    def test_async_pass(self):
+        asyncio.run(bot.check_active_lfg_topics_async(asyncio.Semaphore(2)))
+        self.assertEqual(self.batches, [{1: 10, 2: None, 3: 30}])
+        self.assertEqual(sorted(self.checked), [(1, (0, False, 10)), (2, (0, False, None)), (3, (0, False, 30))])
+
+if __name__ == "__main__":
+    unittest.main()